@@ -0,0 +1,124 @@
+"""
+Audit log benchmark for the panel.
+
+Fills a scratch audit.db with years of made-up /action rows, then times:
+
+    - rows per second through the batched writer (record_action)
+    - /api/audit's newest page, per-PC and per-action pages
+    - walking deep into the history with the keyset cursor
+    - /api/audit/summary over the last 30 days
+
+Exits non-zero if any query's p99 is over 50 ms.
+
+    python scripts/bench_audit.py --rows 1000000 --pcs 20 --years 3
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'src')
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, SRC_DIR)
+
+from bench_panel import percentile
+
+MAX_QUERY_MS = 50
+ACTIONS = ['lock', 'message', 'set_limit', 'extend_time', 'add_lock_time', 'get_usage',
+           'list_lock_times', 'set_app_limit', 'shutdown', 'remove_lock_time']
+
+def fake_rows(count, pcs, years, rng):
+    """Rows spread evenly over the last `years` years, oldest first"""
+    now = time.time()
+    span = years * 365 * 86400
+    for i in range(count):
+        pc = f'10.99.0.{rng.randrange(pcs) + 1}'
+        ok = rng.random() > 0.05
+        yield (now - span + span * i / count, pc, f'PC-{pc}', rng.choice(ACTIONS), None,
+               int(ok), 0, 'done' if ok else 'timed out', rng.uniform(1, 40), '192.168.1.10', None)
+
+def timed(fn, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the audit log on a large synthetic history")
+    parser.add_argument('--rows', type=int, default=1000000, help='rows of history to fill in')
+    parser.add_argument('--pcs', type=int, default=20)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--writes', type=int, default=50000, help='rows sent through the writer thread')
+    parser.add_argument('--requests', type=int, default=100, help='requests per query')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # web_panel writes its templates and opens audit.db in the working directory
+    os.chdir(workdir)
+    import web_panel
+    web_panel.app.logger.disabled = True
+    rng = random.Random(1)
+    results = {'rows': args.rows, 'pcs': args.pcs, 'years': args.years}
+
+    start = time.perf_counter()
+    with closing(web_panel.audit_connection()) as conn, conn:
+        web_panel.insert_audit_rows(conn, list(fake_rows(args.rows, args.pcs, args.years, rng)))
+    results['fill_s'] = round(time.perf_counter() - start, 1)
+
+    start = time.perf_counter()
+    for i in range(args.writes):
+        web_panel.record_action(ts=time.time(), pc='10.99.0.1', action='lock', success=1, queued=0,
+                                response='PC Locked', latency_ms=2.0, client='127.0.0.1')
+    web_panel.audit_queue.join()
+    results['writer_rows_per_s'] = round(args.writes / (time.perf_counter() - start))
+
+    client = web_panel.app.test_client()
+    first = client.get('/api/audit?limit=50').get_json()
+    queries = {
+        'newest': lambda: client.get('/api/audit'),
+        'one_pc': lambda: client.get('/api/audit?pc=10.99.0.7'),
+        'one_action': lambda: client.get('/api/audit?action=shutdown'),
+        'pc_failures': lambda: client.get('/api/audit?pc=10.99.0.7&failed=1'),
+        'last_tuesday_locks': lambda: client.get(
+            f"/api/audit?action=lock&since={time.time() - 8 * 86400}&until={time.time() - 7 * 86400}"),
+        'summary_30d': lambda: client.get('/api/audit/summary'),
+    }
+    passed = True
+    for name, fn in queries.items():
+        samples = timed(fn, args.requests)
+        results[f'{name}_p99_ms'] = round(percentile(samples, 99), 2)
+        passed = passed and percentile(samples, 99) <= MAX_QUERY_MS
+
+    # Follow the cursor a long way back: each page should cost the same
+    cursor, samples = first['next'], []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        page = client.get(f'/api/audit?pc=10.99.0.3&limit=500&cursor={cursor}').get_json()
+        samples.append((time.perf_counter() - start) * 1000)
+        cursor = page['next']
+        if not cursor:
+            break
+    results['deep_pages_p99_ms'] = round(percentile(samples, 99), 2)
+    passed = passed and percentile(samples, 99) <= MAX_QUERY_MS
+    results['passed'] = passed
+    os.chdir(SCRIPTS_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>24}: {value}")
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Cost of authenticated commands versus today's plaintext round trip.
+
+Starts two agents (null backend) on loopback - one without a key, one with -
+and times GET_STATUS three ways:
+
+    plaintext      new connection per command, unsigned (the old send_command)
+    signed         new connection per command, HMAC-signed frame
+    signed+pooled  signed frame over a pooled connection (agent_client.py,
+                   what web_panel.py and kidpc_cli.py do now)
+
+Exits non-zero if signed+pooled costs more than 10% over plaintext.
+
+    python scripts/bench_auth.py --count 2000
+"""
+import argparse
+import json
+import os
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+AGENT = os.path.join(SRC_DIR, 'pc_control.py')
+MAX_OVERHEAD = 0.10
+
+def free_port():
+    """An unused TCP port on loopback"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_agent(workdir, key):
+    """Run an agent subprocess; returns (process, port) once it answers"""
+    port = free_port()
+    env = dict(os.environ, KIDPC_BACKEND='null', KIDPC_KEY=key)
+    proc = subprocess.Popen([sys.executable, AGENT, '--port', str(port), '--host', '127.0.0.1',
+                             '--key-file', os.path.join(workdir, 'missing.key'), '--rate-limit', '0'],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.01)
+    proc.kill()
+    raise RuntimeError('agent did not start')
+
+def timed(fn, count):
+    """Per-call latency samples in microseconds, after a short warm-up"""
+    for _ in range(min(50, count)):
+        fn()
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare plaintext and authenticated command cost")
+    parser.add_argument('--count', type=int, default=1000, help='commands per mode')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    key = secrets.token_hex(32)
+    with tempfile.TemporaryDirectory() as workdir:
+        plain_agent, plain_port = start_agent(workdir, '')
+        signed_agent, signed_port = start_agent(workdir, key)
+        try:
+            sys.path.insert(0, SRC_DIR)
+            from agent_client import AgentClient
+            client = AgentClient(key.encode())
+
+            def plaintext():
+                with socket.create_connection(('127.0.0.1', plain_port), timeout=5) as s:
+                    s.send(b'GET_STATUS')
+                    assert s.recv(1024) == b'UNLOCKED'
+
+            def signed():
+                with socket.create_connection(('127.0.0.1', signed_port), timeout=5) as s:
+                    frame = client.make_frame('GET_STATUS', to=f'127.0.0.1:{signed_port}')
+                    s.sendall(json.dumps(frame).encode() + b'\n')
+                    reader = s.makefile('rb')
+                    assert client.read_reply(frame, reader.readline()) == 'UNLOCKED'
+                    reader.close()
+
+            def pooled():
+                assert client.send('127.0.0.1', 'GET_STATUS', 5, port=signed_port) == 'UNLOCKED'
+
+            samples = {
+                'plaintext': timed(plaintext, args.count),
+                'signed': timed(signed, args.count),
+                'signed+pooled': timed(pooled, args.count),
+            }
+        finally:
+            for proc in (plain_agent, signed_agent):
+                proc.terminate()
+                proc.wait()
+
+    baseline = statistics.median(samples['plaintext'])
+    results = {}
+    for mode, values in samples.items():
+        median = statistics.median(values)
+        results[mode] = {
+            'median_us': round(median, 1),
+            'p99_us': round(sorted(values)[int(len(values) * 0.99) - 1], 1),
+            'overhead_pct': round((median / baseline - 1) * 100, 1),
+        }
+    passed = results['signed+pooled']['overhead_pct'] <= MAX_OVERHEAD * 100
+
+    if args.json:
+        print(json.dumps({'results': results, 'passed': passed}, indent=2))
+    else:
+        for mode, r in results.items():
+            print(f"{mode:>14}: median {r['median_us']:8.1f} us  p99 {r['p99_us']:8.1f} us  "
+                  f"{r['overhead_pct']:+6.1f}% vs plaintext")
+        print(f"authenticated commands within {MAX_OVERHEAD:.0%} of plaintext: {'PASS' if passed else 'FAIL'}")
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
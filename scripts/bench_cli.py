@@ -0,0 +1,89 @@
+"""
+Bulk command benchmark for the shared client (agent_client.py), the way
+kidpc_cli.py uses it.
+
+Starts a fleet of fake agents from fleet_sim.py with some network latency
+and runs the same list of commands on every PC three ways:
+
+    one at a time  a round trip per command, PC after PC (a shell loop)
+    pipelined      each PC's commands over one connection without waiting
+                   for each reply, PC after PC
+    fan-out        pipelined, and all PCs at once (what kidpc_cli.py does)
+
+Checks that all three get the same replies and exits non-zero unless
+fan-out is at least 10x faster than one at a time.
+
+    python scripts/bench_cli.py --agents 20 --commands 20 --latency 5
+
+Linux only out of the box (uses 127.0.x.y loopback aliases).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'src')
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, SRC_DIR)
+
+import fleet_sim
+from agent_client import AgentClient
+
+MIN_SPEEDUP = 10
+COMMANDS = ['GET_STATUS', 'GET_NAME', 'SET_LIMIT:120', 'LIST_LOCK_TIMES', 'GET_ID']
+
+def replies(results):
+    """Comparable form of fan_out-style results"""
+    return {host: [r if isinstance(r, str) else f'error: {r}' for r in rs] if isinstance(rs, list)
+            else f'unreachable: {rs}' for host, rs in results.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Time one-at-a-time, pipelined and fanned-out commands")
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--commands', type=int, default=20, help='commands per PC')
+    parser.add_argument('--latency', type=float, default=5.0, help='reply latency in ms (fake agents)')
+    parser.add_argument('--network', default='127.0.30.0/24')
+    parser.add_argument('--port', type=int, default=fleet_sim.PORT)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    key = os.urandom(32).hex().encode()
+    ips = fleet_sim.fleet_ips(args.network, args.agents)
+    fleet_sim.run_in_thread(fleet_sim.Fleet(ips, args.port, latency_ms=args.latency, key=key))
+    commands = [COMMANDS[i % len(COMMANDS)] for i in range(args.commands)]
+    # A fresh client per mode, so no mode starts with connections already open
+    modes = {
+        'one_at_a_time': lambda client: {
+            ip: [client.send(ip, command, port=args.port) for command in commands] for ip in ips},
+        'pipelined': lambda client: {ip: client.pipeline(ip, commands, port=args.port) for ip in ips},
+        'fan_out': lambda client: client.fan_out(ips, commands, port=args.port),
+    }
+    results, outputs = {}, {}
+    for name, run in modes.items():
+        client = AgentClient(key, args.port)
+        start = time.perf_counter()
+        outputs[name] = replies(run(client))
+        elapsed = time.perf_counter() - start
+        client.close()
+        results[name] = {'seconds': round(elapsed, 3),
+                         'commands_per_s': round(args.agents * args.commands / elapsed)}
+    for name in results:
+        results[name]['speedup'] = round(results['one_at_a_time']['seconds'] / results[name]['seconds'], 1)
+    same = outputs['pipelined'] == outputs['one_at_a_time'] == outputs['fan_out']
+    all_ok = all(isinstance(r, list) and not any(str(x).startswith('error') for x in r)
+                 for r in outputs['fan_out'].values())
+    passed = same and all_ok and results['fan_out']['speedup'] >= MIN_SPEEDUP
+
+    if args.json:
+        print(json.dumps({'results': results, 'same_replies': same, 'passed': passed}, indent=2))
+    else:
+        for name, r in results.items():
+            print(f"{name:>14}: {r['seconds']:7.3f} s  {r['commands_per_s']:7d} commands/s  {r['speedup']:6.1f}x")
+        print(f"same replies every way: {'yes' if same else 'NO'}")
+        print(f"fan-out at least {MIN_SPEEDUP}x faster than one at a time: {'PASS' if passed else 'FAIL'}")
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Flood test for the agent's rate limits and backpressure.
+
+Starts an agent (null backend) on 127.0.0.1, then from 127.0.0.2 runs
+flooding clients hammering GET_STATUS in tight loops plus a pile of idle
+connections, while a well-behaved "panel" on 127.0.0.3 checks the status
+every 50 ms. Reports, before and during the flood:
+
+    - the panel's success rate and p50/p99 latency
+    - how many flood commands were answered, and how many got BUSY
+    - the agent's CPU use
+
+Exits non-zero if the panel's commands fail or slow down past 200 ms p99
+during the flood. --no-limits runs the agent without per-client rate limits
+for comparison.
+
+    python scripts/bench_flood.py --flooders 32 --hogs 64 --seconds 10
+
+Linux only (uses the 127.0.0.2 and 127.0.0.3 loopback aliases and /proc).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'src')
+AGENT = os.path.join(SRC_DIR, 'pc_control.py')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from bench_auth import free_port
+from bench_panel import percentile
+
+AGENT_IP = '127.0.0.1'
+FLOOD_IP = '127.0.0.2'
+PANEL_IP = '127.0.0.3'
+PANEL_INTERVAL = 0.05
+MAX_PANEL_P99_MS = 200
+MIN_PANEL_SUCCESS = 0.99
+
+def start_agent(workdir, port, limits):
+    """Run an agent subprocess; returns it once it accepts connections"""
+    env = dict(os.environ, KIDPC_BACKEND='null', KIDPC_KEY='')
+    cmd = [sys.executable, AGENT, '--port', str(port), '--host', AGENT_IP,
+           '--key-file', os.path.join(workdir, 'missing.key')]
+    if not limits:
+        cmd += ['--rate-limit', '0']
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((AGENT_IP, port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.01)
+    proc.kill()
+    raise RuntimeError('agent did not start')
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process so far"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+def connect(port, source, timeout=2):
+    return socket.create_connection((AGENT_IP, port), timeout=timeout, source_address=(source, 0))
+
+class Panel:
+    """A polite client: one framed GET_STATUS every PANEL_INTERVAL, new connection on errors"""
+
+    def __init__(self, port):
+        self.port = port
+        self.samples = []
+        self.failures = 0
+        self.busy = 0
+        self.stop = threading.Event()
+        self.sock = self.reader = None
+
+    def status(self):
+        if self.sock is None:
+            self.sock = connect(self.port, PANEL_IP)
+            self.reader = self.sock.makefile('rb')
+        self.sock.sendall(json.dumps({'cmd': 'GET_STATUS', 'nonce': 'n'}).encode() + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('closed')
+        return json.loads(line)
+
+    def run(self):
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            try:
+                reply = self.status()
+                if reply.get('ok'):
+                    self.samples.append((time.perf_counter() - start) * 1000)
+                else:
+                    self.busy += reply.get('error') == 'BUSY'
+                    self.failures += 1
+            except (OSError, ValueError):
+                self.failures += 1
+                if self.sock:
+                    self.sock.close()
+                self.sock = None
+            self.stop.wait(PANEL_INTERVAL)
+
+    def results(self):
+        total = len(self.samples) + self.failures
+        return {
+            'commands': total,
+            'success': round(len(self.samples) / total, 4) if total else 0.0,
+            'busy': self.busy,
+            'p50_ms': round(percentile(self.samples, 50), 2),
+            'p99_ms': round(percentile(self.samples, 99), 2),
+        }
+
+def measure_panel(port, seconds):
+    """Panel results over a stretch of time"""
+    panel = Panel(port)
+    thread = threading.Thread(target=panel.run, daemon=True)
+    thread.start()
+    time.sleep(seconds)
+    panel.stop.set()
+    thread.join()
+    return panel.results()
+
+def flooder(port, stop, counts, lock):
+    """GET_STATUS as fast as the agent answers, reconnecting whenever dropped"""
+    sock = None
+    while not stop.is_set():
+        try:
+            if sock is None:
+                sock = connect(port, FLOOD_IP)
+            sock.sendall(b'GET_STATUS')
+            reply = sock.recv(1024)
+            if not reply:
+                raise ConnectionError('closed')
+            kind = 'busy' if reply == b'BUSY' else 'answered'
+        except OSError:
+            kind = 'errors'
+            if sock:
+                sock.close()
+            sock = None
+        with lock:
+            counts[kind] += 1
+    if sock:
+        sock.close()
+
+def flood(port, flooders, hogs, seconds, results):
+    """
+    The whole flood, run in its own process so its threads don't starve the
+    panel's measurements of the GIL. Puts per-second counts on `results`.
+    """
+    stop = threading.Event()
+    lock = threading.Lock()
+    counts = {'answered': 0, 'busy': 0, 'errors': 0}
+    threads = [threading.Thread(target=flooder, args=(port, stop, counts, lock), daemon=True)
+               for _ in range(flooders)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    # Idle connections on top of the busy ones
+    held = []
+    for _ in range(hogs):
+        try:
+            held.append(connect(port, FLOOD_IP))
+        except OSError:
+            break
+    stop.wait(max(0, seconds - (time.monotonic() - start)))
+    stop.set()
+    for t in threads:
+        t.join(5)
+    for sock in held:
+        sock.close()
+    elapsed = time.monotonic() - start
+    results.put({key: round(value / elapsed, 1) for key, value in counts.items()})
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the agent stays responsive under a command flood")
+    parser.add_argument('--flooders', type=int, default=32, help='clients sending commands in tight loops')
+    parser.add_argument('--hogs', type=int, default=64, help='idle connections held open by the flooder')
+    parser.add_argument('--seconds', type=float, default=10, help='length of the flood')
+    parser.add_argument('--no-limits', action='store_true', help='run the agent without per-client rate limits')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    port = free_port()
+    results = {'flooders': args.flooders, 'hogs': args.hogs, 'limits': not args.no_limits}
+    with tempfile.TemporaryDirectory() as workdir:
+        agent = start_agent(workdir, port, not args.no_limits)
+        try:
+            results['before'] = measure_panel(port, 2)
+
+            queue = multiprocessing.Queue()
+            flood_proc = multiprocessing.Process(
+                target=flood, args=(port, args.flooders, args.hogs, args.seconds + 1, queue))
+            flood_proc.start()
+            time.sleep(0.5)  # let the flood get going
+            cpu_start, wall_start = cpu_seconds(agent.pid), time.monotonic()
+            results['during'] = measure_panel(port, args.seconds)
+            elapsed = time.monotonic() - wall_start
+            results['agent_cpu_pct'] = round((cpu_seconds(agent.pid) - cpu_start) / elapsed * 100, 1)
+            results['flood_per_s'] = queue.get(timeout=30)
+            flood_proc.join()
+        finally:
+            agent.terminate()
+            agent.wait()
+
+    during = results['during']
+    passed = during['success'] >= MIN_PANEL_SUCCESS and during['p99_ms'] <= MAX_PANEL_P99_MS
+    results['passed'] = passed
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>14}: {value}")
+        print(f"panel stays responsive under the flood: {'PASS' if passed else 'FAIL'}")
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
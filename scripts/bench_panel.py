@@ -0,0 +1,160 @@
+"""
+End-to-end benchmark of the web panel against a simulated fleet.
+
+Starts fake agents from fleet_sim.py (in this process, or spread over
+subprocesses with --processes) and drives web_panel.py through Flask's test
+client, reporting:
+
+    - scan time for the whole fleet
+    - dashboard (/), /api/pcs and /api/pcs?since= latency, p50/p99
+    - /action command throughput
+
+    python scripts/bench_panel.py --agents 200 --latency 5 --loss 0.01
+
+Linux only out of the box (uses 127.0.x.y loopback aliases).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'src')
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, SRC_DIR)
+
+import fleet_sim
+
+def percentile(samples, pct):
+    """pct-th percentile of a list of numbers (nearest rank)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+def start_fleet(args):
+    """Start the fake agents; returns a cleanup function"""
+    # Agents and panel share KIDPC_KEY from the environment, if set
+    key = os.environ.get('KIDPC_KEY', '').encode() or None
+    if args.processes <= 1 and args.real:
+        fleet_sim.start_real_agents(fleet_sim.fleet_ips(args.network, args.agents),
+                                    churn=args.churn, key=key)
+        return lambda: None
+    if args.processes <= 1:
+        fleet = fleet_sim.Fleet(fleet_sim.fleet_ips(args.network, args.agents),
+                                latency_ms=args.latency, jitter_ms=args.jitter,
+                                loss=args.loss, churn=args.churn, key=key)
+        fleet_sim.run_in_thread(fleet)
+        return lambda: None
+
+    procs = []
+    per_proc = -(-args.agents // args.processes)
+    for offset in range(0, args.agents, per_proc):
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPTS_DIR, 'fleet_sim.py'),
+             '--count', str(min(per_proc, args.agents - offset)), '--offset', str(offset),
+             '--network', args.network, '--latency', str(args.latency),
+             '--jitter', str(args.jitter), '--loss', str(args.loss), '--churn', str(args.churn)]
+            + (['--real'] if args.real else []),
+            stdout=subprocess.PIPE, text=True))
+    for proc in procs:
+        line = proc.stdout.readline()
+        if not line.startswith('READY'):
+            raise RuntimeError(f"fleet process failed to start: {line!r}")
+
+    def stop():
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+    return stop
+
+def time_requests(fn, count):
+    """Call fn() count times, returning per-call latency in ms"""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark web_panel.py against a simulated fleet")
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--network', default='127.0.10.0/24')
+    parser.add_argument('--processes', type=int, default=1, help='run the fleet in this many subprocesses')
+    parser.add_argument('--latency', type=float, default=2.0, help='agent reply latency in ms')
+    parser.add_argument('--jitter', type=float, default=2.0, help='random extra latency in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='fraction of requests never answered')
+    parser.add_argument('--churn', type=float, default=0.01, help='lock/unlock chance per agent per second')
+    parser.add_argument('--real', action='store_true', help='use the real agent core on NullBackend instead of fakes')
+    parser.add_argument('--page-views', type=int, default=20, help='dashboard loads to time')
+    parser.add_argument('--commands', type=int, default=500, help='/action requests for the throughput test')
+    parser.add_argument('--concurrency', type=int, default=16, help='parallel /action requests')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    stop_fleet = start_fleet(args)
+    # web_panel writes its templates to the working directory, like `cd src` in the README
+    os.chdir(SRC_DIR)
+    import web_panel
+    web_panel.app.logger.disabled = True
+    client = web_panel.app.test_client()
+    results = {'agents': args.agents, 'real': args.real, 'latency_ms': args.latency, 'loss': args.loss}
+
+    try:
+        start = time.perf_counter()
+        found = web_panel.scan_for_servers(network=args.network)
+        results['scan_s'] = round(time.perf_counter() - start, 3)
+        results['found'] = len(found)
+
+        samples = time_requests(lambda: client.get('/'), args.page_views)
+        results['dashboard_p50_ms'] = round(percentile(samples, 50), 1)
+        results['dashboard_p99_ms'] = round(percentile(samples, 99), 1)
+
+        samples = time_requests(lambda: client.get('/api/pcs'), args.page_views * 10)
+        results['api_pcs_p50_ms'] = round(percentile(samples, 50), 2)
+        results['api_pcs_p99_ms'] = round(percentile(samples, 99), 2)
+
+        # Delta polls as the dashboard makes them, against the scanned registry
+        version = client.get('/api/pcs').get_json()['version']
+        def poll_delta():
+            reply = client.get(f'/api/pcs?since={version - 1}')
+            assert reply.status_code in (200, 304), reply.status_code
+        samples = time_requests(poll_delta, args.page_views * 10)
+        reply = client.get('/api/pcs?since=0')
+        assert reply.status_code == 200 and len(reply.get_json()['pcs']) == len(found), reply.status_code
+        results['api_pcs_delta_p50_ms'] = round(percentile(samples, 50), 2)
+        results['api_pcs_delta_p99_ms'] = round(percentile(samples, 99), 2)
+
+        ips = sorted(found)
+        def one_command(i):
+            ip = ips[i % len(ips)]
+            t = time.perf_counter()
+            reply = client.post('/action', json={'ip': ip, 'action': 'message', 'message': f'bench {i}'})
+            return reply.get_json()['success'], (time.perf_counter() - t) * 1000
+
+        if ips:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                outcomes = list(pool.map(one_command, range(args.commands)))
+            elapsed = time.perf_counter() - start
+            latencies = [ms for _, ms in outcomes]
+            results['commands_per_s'] = round(args.commands / elapsed, 1)
+            results['command_failures'] = sum(1 for ok, _ in outcomes if not ok)
+            results['command_p50_ms'] = round(percentile(latencies, 50), 1)
+            results['command_p99_ms'] = round(percentile(latencies, 99), 1)
+    finally:
+        stop_fleet()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>20}: {value}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Report page benchmark for the panel's usage history cache.
+
+Fills web_panel's history with made-up daily numbers (no agents needed) and
+times the report pages through Flask's test client:
+
+    /reports?days=N         every PC's summary
+    /reports/<ip>?days=N    one PC with its chart
+    /api/reports?days=N     the same summaries as JSON
+
+Exits non-zero if any page's p99 is over 100 ms.
+
+    python scripts/bench_reports.py --pcs 10 --days 365
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'src')
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, SRC_DIR)
+
+from bench_panel import percentile
+
+MAX_PAGE_MS = 100
+
+def fake_report(days, rng):
+    """A GET_STATS:DAY:<days> reply with plausible numbers"""
+    today = date.today()
+    return {
+        'res': 'day',
+        'keys': [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)],
+        'active': [rng.randrange(0, 5 * 3600) for _ in range(days)],
+        'locks': [rng.randrange(0, 4) for _ in range(days)],
+        'unlocks': [rng.randrange(0, 4) for _ in range(days)],
+        'limit_hits': [1 if rng.random() < 0.15 else 0 for _ in range(days)],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the report pages on a synthetic history")
+    parser.add_argument('--pcs', type=int, default=10)
+    parser.add_argument('--days', type=int, default=365, help='days of history per PC')
+    parser.add_argument('--requests', type=int, default=50, help='requests per page')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    # web_panel writes its templates to the working directory, like `cd src` in the README
+    os.chdir(SRC_DIR)
+    import web_panel
+    web_panel.app.logger.disabled = True
+    # Keep the synthetic history in memory: no saving over a real cache, no refresh from PCs
+    web_panel.save_history = lambda: None
+    web_panel.history.clear()
+    web_panel.history_refreshed = time.monotonic()
+
+    rng = random.Random(1)
+    ips = [f'10.99.0.{n + 1}' for n in range(args.pcs)]
+    for ip in ips:
+        web_panel.ingest_report(ip, fake_report(args.days, rng))
+
+    client = web_panel.app.test_client()
+    pages = {
+        'reports': f'/reports?days={min(args.days, 365)}',
+        'report_one_pc': f'/reports/{ips[0]}?days={min(args.days, 365)}',
+        'api_reports': f'/api/reports?days={min(args.days, 365)}',
+    }
+    results = {'pcs': args.pcs, 'days': args.days}
+    passed = True
+    for name, url in pages.items():
+        client.get(url)
+        samples = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            reply = client.get(url)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert reply.status_code == 200, (url, reply.status_code)
+        results[f'{name}_p50_ms'] = round(percentile(samples, 50), 2)
+        results[f'{name}_p99_ms'] = round(percentile(samples, 99), 2)
+        passed = passed and percentile(samples, 99) <= MAX_PAGE_MS
+    results['passed'] = passed
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>22}: {value}")
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Cold start benchmark for the agent (src/pc_control.py).
+
+The scheduled task starts the agent at logon, and nothing is enforced until
+it is listening, so this tracks:
+
+    - import time of pc_control (fresh interpreter each run)
+    - time from process start until the agent answers GET_STATUS
+
+    python scripts/bench_startup.py --runs 10
+
+Runs the agent on the null backend, so it works on Linux too. Add
+--importtime to see which modules dominate the import.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+AGENT = os.path.join(SRC_DIR, 'pc_control.py')
+
+def free_port():
+    """An unused TCP port on loopback"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def import_time():
+    """Seconds to import pc_control in a fresh interpreter"""
+    code = ("import time, sys; sys.path.insert(0, %r); t = time.perf_counter(); "
+            "import pc_control; print(time.perf_counter() - t)" % SRC_DIR)
+    out = subprocess.check_output([sys.executable, '-c', code], text=True)
+    return float(out.strip())
+
+def time_to_listening(workdir, timeout=10):
+    """Seconds from spawning the agent until it answers GET_STATUS"""
+    port = free_port()
+    env = dict(os.environ, KIDPC_BACKEND='null')
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, AGENT, '--port', str(port), '--host', '127.0.0.1'],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                    s.sendall(b'GET_STATUS')
+                    if s.recv(1024):
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.002)
+        raise RuntimeError('agent did not start listening')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def top_imports(limit=10):
+    """Slowest imports of pc_control according to python -X importtime"""
+    code = "import sys; sys.path.insert(0, %r); import pc_control" % SRC_DIR
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure agent import time and time-to-listening")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    with tempfile.TemporaryDirectory() as workdir:
+        listening = [time_to_listening(workdir) for _ in range(args.runs)]
+
+    results = {
+        'runs': args.runs,
+        'import_ms_median': round(statistics.median(imports) * 1000, 1),
+        'import_ms_max': round(max(imports) * 1000, 1),
+        'listening_ms_median': round(statistics.median(listening) * 1000, 1),
+        'listening_ms_max': round(max(listening) * 1000, 1),
+    }
+    if args.importtime:
+        results['slowest_imports_us'] = {name: us for us, name in top_imports()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>20}: {value}")
+
+if __name__ == '__main__':
+    main()
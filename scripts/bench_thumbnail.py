@@ -0,0 +1,114 @@
+"""
+Screen thumbnail benchmark: tile delta encoding on the agent, rebuilding
+and PNG encoding on the panel.
+
+Feeds the agent's ThumbnailStream frames from the null backend's synthetic
+screen (no capture API needed) in a few situations:
+
+    still     nothing moves
+    cursor    one small box moving (typing, a mouse, a chat window)
+    video     a dozen boxes moving (a game or video in part of the screen)
+    switch    the whole picture changes every frame (switching apps)
+
+and reports, per situation, the agent's encode time per frame, bytes sent
+per frame against sending every frame whole, the panel's time to patch the
+tiles in and make a PNG, and the capture rate the bandwidth cap allows.
+Checks that the panel's picture matches the screen after every frame.
+
+    python scripts/bench_thumbnail.py --frames 200 --width 320
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import pc_control
+
+MAX_ENCODE_MS = 20   # agent CPU per captured frame
+
+SITUATIONS = {
+    'still': {'boxes': 0, 'switch': False},
+    'cursor': {'boxes': 1, 'switch': False},
+    'video': {'boxes': 12, 'switch': False},
+    'switch': {'boxes': 1, 'switch': True},
+}
+
+def run(web_panel, situation, frames, width):
+    backend = pc_control.NullBackend()
+    backend.screen_boxes = situation['boxes']
+    control = pc_control.PCTimeControl(backend, stats_path=None, id_path=None)
+    stream = pc_control.ThumbnailStream(control, width=width)
+    viewer = web_panel.Thumbnail()
+    encode_ms, panel_ms, sent, whole = [], [], [], []
+    matches = True
+    for _ in range(frames):
+        if situation['switch']:
+            backend.screen_scene += 1
+        frame = backend.capture_screen(width)
+        start = time.perf_counter()
+        cost = stream.encode(*frame)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        reply = json.loads(json.dumps(stream.delta(viewer.seq)))
+
+        start = time.perf_counter()
+        viewer.apply(reply)
+        if viewer.png is None:
+            viewer.png = web_panel.encode_png(viewer.width, viewer.height, viewer.pixels)
+        panel_ms.append((time.perf_counter() - start) * 1000)
+
+        sent.append(cost)
+        whole.append(len(base64.b64encode(zlib.compress(frame[2], 6))))
+        matches = matches and bytes(viewer.pixels) == frame[2]
+    # Skip the first frame: every tile is new to everyone
+    per_frame = statistics.mean(sent[1:]) if frames > 1 else sent[0]
+    min_interval = max(pc_control.THUMBNAIL_MIN_INTERVAL, per_frame / pc_control.THUMBNAIL_BANDWIDTH)
+    return {
+        'encode_ms': round(statistics.median(encode_ms), 2),
+        'encode_p99_ms': round(sorted(encode_ms)[int(len(encode_ms) * 0.99) - 1], 2),
+        'bytes_per_frame': round(per_frame),
+        'whole_frame_bytes': round(statistics.mean(whole)),
+        'panel_ms': round(statistics.median(panel_ms), 2),
+        'max_fps': round(1 / min_interval, 2),
+        'matches': matches,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time thumbnail delta encoding on a synthetic screen")
+    parser.add_argument('--frames', type=int, default=200, help='frames per situation')
+    parser.add_argument('--width', type=int, default=pc_control.THUMBNAIL_WIDTH)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    # web_panel writes its templates and audit.db in the working directory
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+    import web_panel
+
+    results = {name: run(web_panel, situation, args.frames, args.width)
+               for name, situation in SITUATIONS.items()}
+    os.chdir(SCRIPTS_DIR)
+    workdir.cleanup()
+    passed = all(r['matches'] and r['encode_p99_ms'] <= MAX_ENCODE_MS for r in results.values())
+
+    if args.json:
+        print(json.dumps({'results': results, 'passed': passed}, indent=2))
+    else:
+        for name, r in results.items():
+            print(f"{name:>7}: encode {r['encode_ms']:6.2f} ms (p99 {r['encode_p99_ms']:6.2f})  "
+                  f"{r['bytes_per_frame']:7d} B/frame vs {r['whole_frame_bytes']:7d} whole  "
+                  f"panel {r['panel_ms']:6.2f} ms  up to {r['max_fps']} fps  "
+                  f"{'ok' if r['matches'] else 'MISMATCH'}")
+        print(f"pictures match and encoding stays under {MAX_ENCODE_MS} ms: {'PASS' if passed else 'FAIL'}")
+    sys.exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    main()
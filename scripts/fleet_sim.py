@@ -0,0 +1,302 @@
+"""
+Fake agent fleet for load testing the web panel.
+
+Starts many fake PCs that speak the same protocol as RemoteControlServer in
+pc_control.py, each on its own loopback address (127.x.y.z - Linux answers
+on the whole 127.0.0.0/8 range without any setup), so the panel can scan
+and control them as if they were real PCs.
+
+    python scripts/fleet_sim.py --count 200 --latency 5 --loss 0.01 --churn 0.02
+
+With --real the fleet runs the actual agent core from src/pc_control.py
+(PCTimeControl + RemoteControlServer on the in-memory NullBackend) instead of
+the lightweight fakes; latency and loss options don't apply then.
+
+Runs until Ctrl+C. See bench_panel.py for the benchmark that drives it.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import random
+import sys
+import os
+import threading
+import time
+
+PORT = 9999
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+def frame_mac(key, frame):
+    """Same signature as pc_control.frame_mac"""
+    body = {k: v for k, v in frame.items() if k != "mac"}
+    data = json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+    return hmac.new(key, data, hashlib.sha256).hexdigest()
+
+class FakeAgent:
+    """In-memory stand-in for PCTimeControl + RemoteControlServer"""
+
+    def __init__(self, ip, fleet):
+        self.ip = ip
+        self.fleet = fleet
+        self.name = f"SIM-{ip.replace('.', '-')}"
+        self.locked = False
+        self.usage_limit = None
+        self.lock_times = set()
+        self.commands = 0
+
+    def process_command(self, command):
+        """Same replies as RemoteControlServer.process_command for the common commands"""
+        self.commands += 1
+        if command == "LOCK":
+            self.locked = True
+            return "PC Locked"
+        elif command == "SHUTDOWN":
+            return "PC Shutting down"
+        elif command == "GET_NAME":
+            return self.name
+        elif command == "GET_ID":
+            return f"sim-{self.ip}"
+        elif command == "GET_STATUS":
+            return "LOCKED" if self.locked else "UNLOCKED"
+        elif command.startswith("MESSAGE:"):
+            return "Message sent"
+        elif command.startswith("SET_LIMIT:"):
+            try:
+                self.usage_limit = int(command.split(":", 1)[1])
+                return f"Usage limit set to {self.usage_limit} minutes"
+            except ValueError:
+                return "Invalid limit value"
+        elif command.startswith("ADD_LOCK_TIME:"):
+            spec = command.split(":", 1)[1]
+            if spec in self.lock_times:
+                return f"Lock time already set: {spec}"
+            self.lock_times.add(spec)
+            return f"Lock time added: {spec}"
+        elif command.startswith("REMOVE_LOCK_TIME:"):
+            spec = command.split(":", 1)[1]
+            if spec in self.lock_times:
+                self.lock_times.discard(spec)
+                return f"Lock time removed: {spec}"
+            return f"No lock time at {spec}"
+        elif command == "LIST_LOCK_TIMES":
+            return "\n".join(sorted(self.lock_times)) or "No lock times set"
+        elif command.startswith("EXTEND_TIME:"):
+            if self.usage_limit:
+                self.usage_limit += int(command.split(":", 1)[1])
+                return f"Extended time by {command.split(':', 1)[1]} minutes"
+            return "No time limit set to extend"
+        elif command.startswith("BATCH:"):
+            return json.dumps([self.process_command(c) for c in json.loads(command.split(":", 1)[1])])
+        elif command.startswith("GET_STATS"):
+            # A week of made-up history, same shape as UsageStats.report("day", 7)
+            rng = random.Random(self.name)
+            return json.dumps({"res": "day", "keys": [f"day-{i}" for i in range(7)],
+                               "active": [rng.randrange(0, 4 * 3600) for _ in range(7)],
+                               "locks": [rng.randrange(0, 5) for _ in range(7)],
+                               "unlocks": [rng.randrange(0, 5) for _ in range(7)],
+                               "limit_hits": [rng.randrange(0, 2) for _ in range(7)]})
+        elif command == "HELP":
+            return "Simulated agent"
+        return "Unknown command (try HELP)"
+
+    def handle_frame(self, line):
+        """Framed request -> reply frame, signed like the real agent's when the fleet has a key"""
+        frame = json.loads(line)
+        reply = {"ok": True, "resp": self.process_command(frame["cmd"]), "nonce": frame.get("nonce")}
+        if self.fleet.key:
+            reply["mac"] = frame_mac(self.fleet.key, reply)
+        return json.dumps(reply).encode() + b"\n"
+
+    async def handle(self, reader, writer):
+        """One panel connection; like the real agent it serves until the client hangs up"""
+        loop = asyncio.get_running_loop()
+        reply_at = 0.0
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                if buffer.startswith(b"{"):
+                    # Every complete line, in order (clients may pipeline frames)
+                    *lines, buffer = buffer.split(b"\n")
+                else:
+                    lines, buffer = [buffer], b""
+                for line in lines:
+                    if random.random() < self.fleet.loss:
+                        # Lost request: never answer, let the client time out
+                        await asyncio.sleep(self.fleet.lost_hold)
+                        return
+                    if line.startswith(b"{"):
+                        reply = self.handle_frame(line)
+                    else:
+                        reply = self.process_command(line.decode().strip()).encode()
+                    delay = self.fleet.latency + random.random() * self.fleet.jitter
+                    if not delay:
+                        writer.write(reply)
+                        continue
+                    # Latency acts like a slow network: it holds this reply back
+                    # but not the requests behind it, and replies stay in order
+                    reply_at = max(loop.time() + delay, reply_at)
+                    loop.call_at(reply_at, self.write_reply, writer, reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def write_reply(writer, reply):
+        if not writer.is_closing():
+            writer.write(reply)
+
+class Fleet:
+    """A set of FakeAgents served from one asyncio loop"""
+
+    def __init__(self, ips, port=PORT, latency_ms=0.0, jitter_ms=0.0, loss=0.0,
+                 churn=0.0, lost_hold=10.0, key=None):
+        self.port = port
+        self.key = key
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.loss = loss
+        self.churn = churn
+        self.lost_hold = lost_hold
+        self.agents = [FakeAgent(ip, self) for ip in ips]
+        self.servers = []
+
+    async def start(self):
+        """Bind every agent; returns once all of them are listening"""
+        for agent in self.agents:
+            server = await asyncio.start_server(agent.handle, agent.ip, self.port, reuse_address=True)
+            self.servers.append(server)
+        if self.churn:
+            asyncio.ensure_future(self._churn())
+
+    async def _churn(self):
+        """Kids locking and unlocking their PCs: each agent flips with probability churn per second"""
+        while True:
+            await asyncio.sleep(1)
+            for agent in self.agents:
+                if random.random() < self.churn:
+                    agent.locked = not agent.locked
+
+    async def stop(self):
+        """Stop listening"""
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+def fleet_ips(network, count, offset=0):
+    """The first `count` host addresses of a network, after skipping `offset`"""
+    hosts = ipaddress.ip_network(network).hosts()
+    ips = []
+    for i, ip in enumerate(hosts):
+        if i < offset:
+            continue
+        if len(ips) == count:
+            break
+        ips.append(str(ip))
+    if len(ips) < count:
+        raise ValueError(f"{network} has room for only {len(ips)} agents after offset {offset}")
+    return ips
+
+def run_in_thread(fleet):
+    """Serve a fleet from a background thread; returns once it is listening"""
+    ready = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(fleet.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return loop
+
+def start_real_agents(ips, port=PORT, churn=0.0, key=None):
+    """
+    Run the real agent core for each address on NullBackend, in threads.
+
+    Returns the list of (PCTimeControl, RemoteControlServer) once all are listening.
+    """
+    sys.path.insert(0, SRC_DIR)
+    import pc_control
+
+    agents = []
+    for ip in ips:
+        control = pc_control.PCTimeControl(pc_control.NullBackend(), stats_path=None, id_path=None)
+        server = pc_control.RemoteControlServer(port=port, host=ip, key=key)
+        threading.Thread(target=server.start_server, args=(control,), daemon=True).start()
+        agents.append((control, server))
+
+    for control, server in agents:
+        if not server.ready.wait(10) or not server.running:
+            raise OSError(f"agent on {server.host} did not start")
+
+    if churn:
+        def flip():
+            while True:
+                time.sleep(1)
+                for control, _ in agents:
+                    if random.random() < churn:
+                        backend = control.backend
+                        backend.unlock() if backend.locked else backend.lock()
+        threading.Thread(target=flip, daemon=True).start()
+    return agents
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of kid PC agents on loopback addresses")
+    parser.add_argument("--count", type=int, default=50, help="number of fake PCs")
+    parser.add_argument("--network", default="127.0.10.0/24", help="loopback network to place them in")
+    parser.add_argument("--offset", type=int, default=0, help="skip this many addresses (for splitting across processes)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="added reply latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency up to this many ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of requests never answered")
+    parser.add_argument("--churn", type=float, default=0.0, help="chance per agent per second of a lock/unlock")
+    parser.add_argument("--real", action="store_true", help="run the real agent core on NullBackend")
+    parser.add_argument("--key", help="shared key to sign replies with (default: KIDPC_KEY)")
+    args = parser.parse_args()
+    key = (args.key or os.environ.get("KIDPC_KEY") or "").encode() or None
+
+    if args.real:
+        try:
+            agents = start_real_agents(fleet_ips(args.network, args.count, args.offset),
+                                       args.port, args.churn, key)
+        except OSError as e:
+            print(f"Could not start agents: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"READY {len(agents)} real agents on {args.network} port {args.port}", flush=True)
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    fleet = Fleet(fleet_ips(args.network, args.count, args.offset), args.port,
+                  args.latency, args.jitter, args.loss, args.churn, key=key)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(fleet.start())
+    except OSError as e:
+        print(f"Could not bind fake agents: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"READY {len(fleet.agents)} agents on {args.network} port {args.port}", flush=True)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(fleet.stop())
+
+if __name__ == "__main__":
+    main()
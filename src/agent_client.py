@@ -0,0 +1,503 @@
+"""
+Client side of the agent protocol (pc_control.py), shared by web_panel.py and
+kidpc_cli.py.
+
+Commands go out as JSON-line frames, HMAC-signed when a shared key is
+configured, over connections kept open between uses. Besides one command at
+a time (send), a client can pipeline many commands over one connection
+(pipeline) and run the same commands on many PCs at once (fan_out).
+
+push_update and roll_out send a new agent build (see AgentUpdate in
+pc_control.py) to one PC or many.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+DEFAULT_PORT = 9999
+KEY_FILE = 'agent.key'    # same agent.key as on the PCs, see pc_control.py --make-key
+MAX_FRAME = 256 * 1024    # must match pc_control.py
+MAX_TRACE_ID = 64         # must match pc_control.py
+
+# Open connections to agents are reused; agents drop idle ones after 60s
+POOL_IDLE_SECONDS = 30
+POOL_MAX_IDLE = 4         # idle connections kept per PC
+
+# Pipelining: frames written ahead of their replies on one connection. The
+# agent answers them in order, one at a time, so this only saves round trips.
+PIPELINE_WINDOW = 32
+# An agent over its rate limit answers BUSY without running the command;
+# pipelined commands that got one are sent again after a pause
+PIPELINE_BUSY_RETRIES = 5
+BUSY_RETRY_DELAY = 0.25   # seconds, doubled for each retry
+
+FAN_OUT = 32              # PCs talked to at once by fan_out
+
+# Agent updates: chunks are pipelined a few at a time (each is ~90 KB once
+# base64'd). A transfer that breaks off is resumed from what the agent has.
+UPDATE_WINDOW = 8
+UPDATE_ATTEMPTS = 5           # transfer attempts in a row that make no progress before giving up
+UPDATE_RESTART_TIMEOUT = 180  # seconds for a PC to come back running the new build
+UPDATE_POLL_INTERVAL = 2
+ROLLOUT_CONCURRENCY = 4       # PCs updated at once by roll_out
+
+class AgentError(Exception):
+    """The agent answered but refused the request (bad signature, bad frame...)"""
+
+class AgentBusy(AgentError):
+    """The agent is over one of its limits and did not run the command"""
+
+class AgentTooOld(AgentError):
+    """The agent only speaks the plaintext protocol from before signed frames"""
+
+def load_key(path=KEY_FILE):
+    """Shared key from KIDPC_KEY or the key file; None means unsigned commands"""
+    key = os.environ.get('KIDPC_KEY')
+    if not key:
+        try:
+            with open(path) as f:
+                key = f.read().strip()
+        except FileNotFoundError:
+            return None
+    return key.encode() if key else None
+
+def frame_mac(key, frame):
+    """HMAC-SHA256 of a frame's canonical JSON, ignoring any "mac" field"""
+    body = {k: v for k, v in frame.items() if k != 'mac'}
+    data = json.dumps(body, sort_keys=True, separators=(',', ':')).encode()
+    return hmac.new(key, data, hashlib.sha256).hexdigest()
+
+class Trace:
+    """Timings of one request: the client's own steps plus the agent's spans"""
+    def __init__(self, trace_id, pc, action, start=None):
+        self.trace_id = trace_id
+        self.pc = pc
+        self.action = action
+        self.ts = time.time()
+        self.start = start or time.perf_counter()
+        self.spans = []           # [name, start ms, duration ms]
+        self.total_ms = None
+
+    def add(self, name, start, end):
+        self.spans.append([name, round((start - self.start) * 1000, 3), round((end - start) * 1000, 3)])
+
+    def add_agent(self, spans, sent):
+        """The agent's spans, placed from when the frame was sent (network time not split out)"""
+        offset = (sent - self.start) * 1000
+        for name, start, duration in spans:
+            self.spans.append([f'agent.{name}', round(offset + start, 3), duration])
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self.start) * 1000, 3)
+
+    def to_json(self):
+        return {'trace': self.trace_id, 'pc': self.pc, 'action': self.action, 'ts': self.ts,
+                'total_ms': self.total_ms, 'spans': self.spans}
+
+@contextmanager
+def trace_span(trace, name):
+    """Time the block as a span of `trace`; does nothing without one"""
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter())
+
+class AgentConnection:
+    """A framed connection to one agent, kept in the client's pool between uses"""
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        self.last_used = time.monotonic()
+        # Signed frames name the agent they are for (host resolved, as the agent sees it)
+        self.target = '%s:%d' % self.sock.getpeername()[:2]
+
+    def readline(self):
+        """
+        The next reply line. An agent from before frames answers a frame as an
+        unknown plaintext command, without a newline; that fails at once
+        instead of waiting for the timeout.
+        """
+        first = self.reader.peek(1)[:1]
+        if first and first != b'{':
+            raise AgentTooOld("Agent is too old for this panel (copy the new pc_control.py to the PC)")
+        return self.reader.readline(MAX_FRAME)
+
+    def is_open(self):
+        """False if the agent has closed this idle connection (restarted, say); doesn't block"""
+        try:
+            self.sock.setblocking(False)
+            try:
+                return self.sock.recv(1, socket.MSG_PEEK) != b''
+            finally:
+                self.sock.setblocking(True)
+        except BlockingIOError:
+            return True   # nothing to read: still open
+        except OSError:
+            return False
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class AgentClient:
+    """
+    Talks to agents with one shared key and a pool of open connections.
+
+    Safe to use from many threads; each connection is used by one caller at
+    a time.
+    """
+    def __init__(self, key=None, port=DEFAULT_PORT, timeout=5):
+        self.key = key
+        self.port = port
+        self.timeout = timeout
+        self.pool = {}            # (host, port) -> [AgentConnection, ...]
+        self.pool_lock = threading.Lock()
+
+    def make_frame(self, command, request_id=None, trace_id=None, to=None):
+        """Request frame for the agent at `to` ("ip:port"), signed when a shared key is configured"""
+        frame = {'cmd': command, 'ts': int(time.time() * 1000), 'nonce': secrets.token_hex(8)}
+        if to:
+            frame['to'] = to
+        if request_id:
+            # Retries carry the same id, and the agent runs the command only once
+            frame['id'] = request_id
+        if trace_id:
+            frame['trace'] = trace_id[:MAX_TRACE_ID]
+        if self.key:
+            frame['mac'] = frame_mac(self.key, frame)
+        return frame
+
+    def read_reply(self, frame, line, trace=None, sent=None):
+        """Check a reply line against its request frame and return the response text"""
+        if not line.endswith(b'\n'):
+            raise AgentError("Reply too long or cut off")
+        reply = json.loads(line)
+        if not reply.get('ok') and reply.get('error') == 'BUSY':
+            raise AgentBusy("PC is busy, try again in a moment")
+        if reply.get('nonce') != frame['nonce']:
+            raise AgentError("Reply does not match the request")
+        if not reply.get('ok'):
+            # Refusals are not signed (the agent may not trust our key)
+            raise AgentError(f"Agent refused the command: {reply.get('error')}")
+        if self.key and not hmac.compare_digest(reply.get('mac', ''), frame_mac(self.key, reply)):
+            raise AgentError("Reply failed authentication")
+        if trace is not None and isinstance(reply.get('spans'), list):
+            trace.add_agent(reply['spans'], sent)
+        return reply['resp']
+
+    def checkout(self, host, port, timeout):
+        """A pooled connection if a fresh one is idle, else a new one; returns (conn, reused)"""
+        now = time.monotonic()
+        with self.pool_lock:
+            idle = self.pool.get((host, port), [])
+            while idle:
+                conn = idle.pop()
+                if now - conn.last_used < POOL_IDLE_SECONDS and conn.is_open():
+                    return conn, True
+                conn.close()
+        return AgentConnection(host, port, timeout), False
+
+    def checkin(self, host, port, conn):
+        """Return a healthy connection to the pool"""
+        conn.last_used = time.monotonic()
+        with self.pool_lock:
+            idle = self.pool.setdefault((host, port), [])
+            if len(idle) < POOL_MAX_IDLE:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def drop(self, host, port=None):
+        """Close pooled connections to a PC (e.g. once it looks offline)"""
+        with self.pool_lock:
+            idle = self.pool.pop((host, port or self.port), [])
+        for conn in idle:
+            conn.close()
+
+    def close(self):
+        """Close every pooled connection"""
+        with self.pool_lock:
+            pools, self.pool = self.pool, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+    def send(self, host, command, timeout=None, request_id=None, trace=None, port=None):
+        """One framed round trip over a pooled connection; returns the response text"""
+        port = port or self.port
+        timeout = timeout or self.timeout
+        while True:
+            start = time.perf_counter()
+            conn, reused = self.checkout(host, port, timeout)
+            if trace:
+                trace.add('pool' if reused else 'connect', start, time.perf_counter())
+            frame = self.make_frame(command, request_id, trace and trace.trace_id, conn.target)
+            data = json.dumps(frame).encode() + b'\n'
+            # A stale pooled connection is retried on a new one, but once the
+            # frame is written the agent may have run it, so only a frame with
+            # a request id (which the agent runs once) is sent again
+            sent = None
+            try:
+                conn.sock.settimeout(timeout)
+                with trace_span(trace, 'send'):
+                    conn.sock.sendall(data)
+                sent = time.perf_counter()
+                with trace_span(trace, 'reply'):
+                    line = conn.readline()
+            except (socket.timeout, AgentTooOld):
+                conn.close()
+                raise
+            except OSError:
+                conn.close()
+                if reused and (sent is None or request_id):
+                    continue
+                raise
+            if not line:
+                conn.close()
+                if reused and request_id:
+                    continue
+                raise ConnectionError("Agent closed the connection")
+            self.checkin(host, port, conn)
+            with trace_span(trace, 'verify'):
+                return self.read_reply(frame, line, trace, sent)
+
+    def pipeline(self, host, commands, timeout=None, port=None, window=PIPELINE_WINDOW):
+        """
+        Run many commands on one PC over one connection, without waiting for
+        each reply before sending the next frame.
+
+        Returns one result per command, in order: the response text, or the
+        exception that command failed with (AgentError for a refusal).
+        Connection problems on the first try are raised instead; on a later
+        try (a BUSY retry or a reconnect) they fail just the commands left.
+        Every command carries a request id, so commands cut off by a broken
+        connection can be sent again without running twice; commands the
+        agent answered BUSY are sent again after a pause.
+        """
+        port = port or self.port
+        timeout = timeout or self.timeout
+        results = [None] * len(commands)
+        ids = [secrets.token_hex(8) for _ in commands]
+        todo = list(range(len(commands)))
+        busy_retries = reconnects = rounds = 0
+        while todo:
+            rounds += 1
+            try:
+                busy, unanswered = self._pipeline_round(host, port, commands, ids, todo, results,
+                                                        timeout, window)
+            except (OSError, AgentError) as e:
+                if rounds == 1:
+                    raise
+                # A BUSY retry or reconnect failed: keep what the agent did answer
+                for i in todo:
+                    results[i] = e
+                break
+            if unanswered and reconnects:
+                error = ConnectionError("Agent closed the connection")
+                for i in unanswered:
+                    results[i] = error
+                unanswered = []
+            elif unanswered:
+                reconnects += 1
+            if busy and busy_retries == PIPELINE_BUSY_RETRIES:
+                for i in busy:
+                    results[i] = AgentBusy("PC is busy, try again in a moment")
+                busy = []
+            elif busy:
+                time.sleep(BUSY_RETRY_DELAY * 2 ** busy_retries)
+                busy_retries += 1
+            todo = sorted(busy + unanswered)
+        return results
+
+    def _pipeline_round(self, host, port, commands, ids, todo, results, timeout, window):
+        """
+        Send the `todo` commands over one connection, filling in `results`.
+        Returns (busy, unanswered): indexes to send again.
+        """
+        conn, reused = self.checkout(host, port, timeout)
+        conn.sock.settimeout(timeout)
+        in_flight = deque()       # (index, frame) in the order they were sent
+        busy = []
+        answered = 0
+        pending = iter(todo)
+        try:
+            while True:
+                # Keep up to `window` frames in flight, then take the oldest reply
+                for i in pending:
+                    frame = self.make_frame(commands[i], ids[i], to=conn.target)
+                    conn.sock.sendall(json.dumps(frame).encode() + b'\n')
+                    in_flight.append((i, frame))
+                    if len(in_flight) >= window:
+                        break
+                if not in_flight:
+                    break
+                line = conn.readline()
+                if not line:
+                    raise ConnectionError("Agent closed the connection")
+                i, frame = in_flight.popleft()
+                answered += 1
+                try:
+                    results[i] = self.read_reply(frame, line)
+                except AgentBusy:
+                    busy.append(i)
+                except (AgentError, ValueError) as e:
+                    results[i] = e
+        except AgentTooOld:
+            conn.close()
+            raise
+        except socket.timeout as e:
+            conn.close()
+            if not answered:
+                raise
+            # It answered some, so it is up but slow: the rest time out
+            for i in todo:
+                if results[i] is None and i not in busy:
+                    results[i] = e
+            return busy, []
+        except OSError:
+            conn.close()
+            if reused and not answered:
+                # Stale pooled connection, nothing arrived; try a new one
+                return self._pipeline_round(host, port, commands, ids, todo, results, timeout, window)
+            # The connection broke; whatever is unanswered goes again on a new one
+            return busy, [i for i in todo if results[i] is None and i not in busy]
+        self.checkin(host, port, conn)
+        return busy, []
+
+    def fan_out(self, hosts, commands, concurrency=FAN_OUT, timeout=None, port=None):
+        """
+        Pipeline the same commands to many PCs at once, at most `concurrency`
+        at a time. Returns {host: results}, results as for pipeline, or the
+        exception for a PC that could not be reached.
+        """
+        def run(host):
+            try:
+                return self.pipeline(host, commands, timeout, port)
+            except Exception as e:
+                self.drop(host, port)
+                return e
+
+        hosts = list(dict.fromkeys(hosts))
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(hosts))) as pool:
+            return dict(zip(hosts, pool.map(run, hosts)))
+
+    def update_command(self, host, command, port=None, timeout=None):
+        """Send an UPDATE_* command and return its JSON reply"""
+        reply = self.send(host, command, timeout, port=port)
+        if reply.startswith('Unknown command'):
+            raise AgentError("Agent is too old to update itself (install this build by hand once)")
+        try:
+            return json.loads(reply)
+        except ValueError:
+            raise AgentError(reply)
+
+    def push_update(self, host, data, progress=None, port=None):
+        """
+        Send a new agent build to one PC, install it and wait until the agent
+        is back running it. Carries on from whatever an earlier, interrupted
+        transfer left on the PC. Returns 'done', 'current' if the PC was
+        already running this build, or 'installed' if the PC has it installed
+        but can't restart itself (it runs the old build until restarted);
+        raises on failure.
+
+        progress(host, stage, sent, size) is called along the way, with stage
+        one of 'checking', 'sending', 'installing' and 'restarting'.
+        """
+        report = progress or (lambda host, stage, sent, size: None)
+        size, sha256 = len(data), hashlib.sha256(data).hexdigest()
+        report(host, 'checking', 0, size)
+        status = self.update_command(host, 'UPDATE_STATUS', port)
+        if status['build'] == sha256:
+            return 'current'
+        if status.get('installed') == sha256:
+            return 'installed'
+
+        offset = stalled = 0
+        while True:
+            try:
+                status = self.update_command(host, f'UPDATE_BEGIN:{size}:{sha256}', port)
+                offset, chunk = status['offset'], status['chunk']
+                if offset == size:
+                    break
+                report(host, 'sending', offset, size)
+                commands = [f'UPDATE_CHUNK:{start}:{base64.b64encode(data[start:start + chunk]).decode()}'
+                            for start in range(offset, size, chunk)]
+                for result in self.pipeline(host, commands, port=port, window=UPDATE_WINDOW):
+                    if isinstance(result, (OSError, AgentBusy)):
+                        break  # the chunks after this one were ignored
+                    if isinstance(result, Exception):
+                        raise result
+                    if not result.startswith('{'):
+                        raise AgentError(result)
+                    reached = json.loads(result)['offset']
+                    if reached > offset:
+                        offset = reached
+                        stalled = 0
+                        report(host, 'sending', offset, size)
+            except (OSError, AgentBusy):
+                pass  # interrupted; the agent keeps what it got
+            if offset == size:
+                continue  # UPDATE_BEGIN confirms everything arrived
+            stalled += 1
+            if stalled == UPDATE_ATTEMPTS:
+                raise ConnectionError(f"Transfer stopped at {offset} of {size} bytes")
+            time.sleep(BUSY_RETRY_DELAY * 2 ** stalled)
+
+        report(host, 'installing', size, size)
+        reply = self.send(host, f'UPDATE_COMMIT:{sha256}', port=port)
+        if reply == 'Update installed, restart required':
+            return 'installed'
+        if reply != 'Update installed, restarting':
+            raise AgentError(reply)
+        report(host, 'restarting', size, size)
+        deadline = time.monotonic() + UPDATE_RESTART_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(UPDATE_POLL_INTERVAL)
+            self.drop(host, port)
+            try:
+                if self.update_command(host, 'UPDATE_STATUS', port, UPDATE_POLL_INTERVAL)['build'] == sha256:
+                    return 'done'
+            except (OSError, AgentError):
+                continue  # still restarting
+        raise AgentError("PC did not come back running the new build (it may have gone back to the old one)")
+
+    def roll_out(self, hosts, data, concurrency=ROLLOUT_CONCURRENCY, progress=None, done=None, port=None):
+        """
+        push_update to many PCs, at most `concurrency` at a time. Returns
+        {host: 'done', 'current', 'installed' or the exception it failed with}; done(host,
+        result) is also called as each PC finishes.
+        """
+        def run(host):
+            try:
+                result = self.push_update(host, data, progress, port)
+            except Exception as e:
+                self.drop(host, port)
+                result = e
+            if done:
+                done(host, result)
+            return result
+
+        hosts = list(dict.fromkeys(hosts))
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(hosts))) as pool:
+            return dict(zip(hosts, pool.map(run, hosts)))
@@ -0,0 +1,187 @@
+"""
+Command-line client for Kid PC Monitor agents.
+
+Runs agent commands on one PC or many without the web panel, from a
+terminal, a script or a scheduled task:
+
+    python kidpc_cli.py -H 192.168.1.20 GET_STATUS
+    python kidpc_cli.py -H 192.168.1.20,192.168.1.21 EXTEND_TIME:30 GET_STATUS
+    python kidpc_cli.py --subnet 192.168.1.0/24 LOCK
+    python kidpc_cli.py --hosts-file kids.txt - < commands.txt
+    python kidpc_cli.py --json -H 192.168.1.20 GET_USAGE
+    python kidpc_cli.py --subnet 192.168.1.0/24 --update pc_control.py
+
+Commands are the agent's own (send HELP for the list); "-" or no commands
+reads them from standard input, one per line. All of a PC's commands go
+over one connection without waiting for each reply, and the PCs are
+handled in parallel. Uses the same agent.key as the panel.
+
+Settings the panel keeps per PC (time limit, lock times, app limits,
+blocked programs) are refused: a running panel would put them back within
+a minute. Change those in the panel, or pass --force for PCs no panel
+manages.
+
+--update sends a new pc_control.py to the PCs instead (a few at a time,
+resuming transfers that were cut off), installs it and waits for each
+agent to restart with it, printing progress as it goes.
+
+Exit status: 0 if every command succeeded on every PC, 1 if anything
+failed, 2 for bad arguments.
+"""
+import argparse
+import hashlib
+import ipaddress
+import json
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_client import (DEFAULT_PORT, FAN_OUT, KEY_FILE, ROLLOUT_CONCURRENCY, AgentBusy, AgentClient,
+                          load_key)
+
+SCAN_TIMEOUT = 0.5        # seconds to wait for a connection when scanning, as the panel's scan
+
+# Commands that change settings the panel's reconciler keeps in line with
+# its policies (see policies.json in web_panel.py)
+PANEL_MANAGED = ('SET_LIMIT:', 'ADD_LOCK_TIME:', 'REMOVE_LOCK_TIME:', 'REPLACE_LOCK_TIMES:', 'LOCK_OVERRIDE:',
+                 'SET_APP_LIMIT:', 'BLOCK_APP:', 'UNBLOCK_APP:', 'APPLY_CONFIG:')
+
+def panel_managed(command):
+    """True if the command (or one inside a BATCH) changes a setting the panel manages"""
+    if command.startswith('BATCH:'):
+        return any(prefix in command for prefix in PANEL_MANAGED)
+    return command.startswith(PANEL_MANAGED)
+
+def read_lines(path_or_file):
+    """Non-blank lines that are not # comments"""
+    f = open(path_or_file) if isinstance(path_or_file, str) else path_or_file
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+def scan(network, port, concurrency):
+    """Addresses in `network` with something listening on the agent port"""
+    def listening(ip):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(SCAN_TIMEOUT)
+            return s.connect_ex((ip, port)) == 0
+
+    addresses = [str(ip) for ip in ipaddress.ip_network(network, strict=False).hosts()]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return [ip for ip, up in zip(addresses, pool.map(listening, addresses)) if up]
+
+def result_json(command, result):
+    if isinstance(result, Exception):
+        return {'cmd': command, 'ok': False, 'busy': isinstance(result, AgentBusy), 'error': str(result)}
+    return {'cmd': command, 'ok': True, 'resp': result}
+
+def report_json(commands, results, elapsed):
+    hosts = {}
+    for host, host_results in results.items():
+        if isinstance(host_results, Exception):
+            hosts[host] = {'ok': False, 'error': str(host_results) or type(host_results).__name__}
+            continue
+        entries = [result_json(c, r) for c, r in zip(commands, host_results)]
+        hosts[host] = {'ok': all(e['ok'] for e in entries), 'results': entries}
+    return {'ok': all(h['ok'] for h in hosts.values()), 'elapsed_ms': round(elapsed * 1000, 1),
+            'hosts': hosts}
+
+def print_text(commands, results):
+    """One line per command (replies over several lines are indented)"""
+    width = max(len(host) for host in results)
+    for host, host_results in results.items():
+        if isinstance(host_results, Exception):
+            print(f"{host:<{width}}  unreachable: {host_results or type(host_results).__name__}")
+            continue
+        for command, result in zip(commands, host_results):
+            text = f"error: {result}" if isinstance(result, Exception) else str(result)
+            lines = text.splitlines() or ['']
+            print(f"{host:<{width}}  {command}  {lines[0]}")
+            for line in lines[1:]:
+                print(f"{'':<{width}}    {line}")
+
+UPDATE_RESULTS = {'done': 'updated', 'current': 'already up to date',
+                  'installed': 'installed, restart the agent to use it'}
+
+def update_report(build, results, elapsed):
+    hosts = {host: {'ok': False, 'error': str(result) or type(result).__name__} if isinstance(result, Exception)
+             else {'ok': True, 'result': result} for host, result in results.items()}
+    return {'ok': all(h['ok'] for h in hosts.values()), 'elapsed_ms': round(elapsed * 1000, 1),
+            'build': build, 'hosts': hosts}
+
+def show_progress(host, stage, sent, size):
+    """Progress lines on stderr, so stdout keeps just the results"""
+    detail = f" {sent * 100 // size}%" if stage == 'sending' else ''
+    print(f"{host}  {stage}{detail}", file=sys.stderr, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Kid PC Monitor agent commands on one or many PCs")
+    parser.add_argument('commands', nargs='*', metavar='COMMAND',
+                        help='agent commands, e.g. GET_STATUS or SET_LIMIT:120 ("-" or none: read from stdin)')
+    parser.add_argument('-H', '--host', action='append', default=[],
+                        help='PC address, or several separated by commas (may be repeated)')
+    parser.add_argument('--hosts-file', help='file with one PC address per line')
+    parser.add_argument('--subnet', help='run on every PC found listening in this network, e.g. 192.168.1.0/24')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'agent port (default: {DEFAULT_PORT})')
+    parser.add_argument('--key-file', default=KEY_FILE, help=f'shared key file (default: {KEY_FILE}; KIDPC_KEY overrides)')
+    parser.add_argument('--timeout', type=float, default=5, help='seconds to wait for each reply (default: 5)')
+    parser.add_argument('--concurrency', type=int,
+                        help=f'PCs to talk to at once (default: {FAN_OUT}, or {ROLLOUT_CONCURRENCY} with --update)')
+    parser.add_argument('--update', metavar='FILE', help='send this pc_control.py to the PCs and restart them with it')
+    parser.add_argument('--force', action='store_true',
+                        help='send settings the panel manages anyway (PCs no panel looks after)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    hosts = [h.strip() for value in args.host for h in value.split(',') if h.strip()]
+    try:
+        if args.hosts_file:
+            hosts += read_lines(args.hosts_file)
+        if not hosts and not args.subnet:
+            parser.error('no PCs given (use --host, --hosts-file or --subnet)')
+        if args.update:
+            if args.commands:
+                parser.error('--update takes no commands')
+            with open(args.update, 'rb') as f:
+                build = f.read()
+        else:
+            commands = [c for c in args.commands if c != '-']
+            if not commands or '-' in args.commands:
+                commands += read_lines(sys.stdin)
+            if not commands:
+                parser.error('no commands given')
+            managed = [c for c in commands if panel_managed(c)]
+            if managed and not args.force:
+                parser.error(f'{managed[0].split(":", 1)[0]} changes a setting the panel manages, and a '
+                             f'running panel puts it back within a minute; change it in the panel '
+                             f'(or use --force if no panel manages these PCs)')
+        concurrency = max(args.concurrency or (ROLLOUT_CONCURRENCY if args.update else FAN_OUT), 1)
+        if args.subnet:
+            hosts += scan(args.subnet, args.port, max(concurrency, FAN_OUT))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    client = AgentClient(load_key(args.key_file), args.port, args.timeout)
+    start = time.monotonic()
+    if args.update:
+        results = client.roll_out(hosts, build, concurrency, None if args.json else show_progress)
+        report = update_report(hashlib.sha256(build).hexdigest(), results, time.monotonic() - start)
+    else:
+        results = client.fan_out(hosts, commands, concurrency)
+        report = report_json(commands, results, time.monotonic() - start)
+    client.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif not results:
+        print(f"No PCs found in {args.subnet}", file=sys.stderr)
+    elif args.update:
+        for host, result in report['hosts'].items():
+            text = UPDATE_RESULTS.get(result.get('result'), result.get('result'))
+            print(f"{host}  {text if result['ok'] else 'failed: ' + result['error']}")
+    else:
+        print_text(commands, results)
+    sys.exit(0 if results and report['ok'] else 1)
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,570 @@
 import os
 import sys
 import time
+import base64
 import datetime
 import ctypes
 import socket
 import threading
-import tkinter as tk
-from tkinter import messagebox
-from datetime import datetime, time as dtime
-import subprocess
-from ctypes import wintypes
+import json
+import bisect
+import fnmatch
+import math
+import re
+import hmac
+import hashlib
+import heapq
+import secrets
+import shutil
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta, time as dtime
 
 import logging
-from pathlib import Path
 
-# Set up logging
+# tkinter, subprocess and ctypes.wintypes are imported where they are used:
+# the agent starts at logon and every millisecond before it is listening is
+# time the limits are not enforced.
+
 log_file = 'pc_control.log'
-os.unlink(log_file) #remove previous log
+LOG_FORMAT = '[%(asctime)s] %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def setup_logging(path=log_file, level="INFO"):
+    """Start a fresh log file (called from __main__, not on import)"""
+    try:
+        os.unlink(path) #remove previous log
+    except FileNotFoundError:
+        pass
 
-logging.basicConfig(
-    filename=str(log_file),
-    level=logging.INFO,
-    format='[%(asctime)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+    logging.basicConfig(
+        filename=str(path),
+        level=level,
+        format=LOG_FORMAT,
+        datefmt=LOG_DATE_FORMAT
+    )
 
-class PCTimeControl:
+def switch_logging(path, level):
+    """Log to `path` at `level` from now on, appending, without touching other handlers"""
+    root = logging.getLogger()
+    root.setLevel(level)
+    path = os.path.abspath(path)
+    old = [h for h in root.handlers if isinstance(h, logging.FileHandler)]
+    if any(h.baseFilename == path for h in old):
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    root.addHandler(handler)
+    for h in old:
+        root.removeHandler(h)
+        h.close()
+
+LOW_POWER_FACTOR = 5      # background polls run this many times less often
+LOW_POWER_TICK = 15       # seconds; low power wakeups are aligned to this grid
+ACCEPT_TIMEOUT = 5        # accept loop wakeup to check self.running
+ACCEPT_TIMEOUT_LOW_POWER = 30
+
+class AgentProfiler:
+    """
+    Self-profiling counters for the agent's background work.
+
+    Threads call wakeup() each time they wake and spawn() before starting a
+    subprocess; everything is a counter bump, so leaving it on costs next to
+    nothing. Reported through the PROFILE command.
+    """
     def __init__(self):
-        self.lock_times = []
-        self.usage_limit = None
-        self.start_time = datetime.now()
-        self.is_locked = False
-        self.last_activity = datetime.now()
+        self.enabled = False
+        self.low_power = False
+        self._lock = threading.Lock()
+        self.reset()
 
-        # Start monitoring thread
-        self.monitor_thread = threading.Thread(target=self.monitor_activity, daemon=True)
-        self.monitor_thread.start()
+    def reset(self):
+        """Start a fresh measurement window"""
+        with self._lock:
+            self.since = time.monotonic()
+            self.process_cpu_start = time.process_time()
+            self.wakeups = Counter()          # thread name -> wakeups
+            self.recent = deque(maxlen=5000)  # (monotonic, thread name) for per-minute rates
+            self.cpu = Counter()              # thread name -> CPU seconds in window
+            self._cpu_mark = {}               # thread ident -> thread_time at last wakeup
+            self.spawns = Counter()           # program -> subprocesses started
+
+    def wakeup(self, name):
+        """Count a wakeup of the calling thread and charge its CPU time since the last one"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        cpu = time.thread_time()
+        ident = threading.get_ident()
+        with self._lock:
+            last = self._cpu_mark.get(ident)
+            if last is not None:
+                self.cpu[name] += cpu - last
+            self._cpu_mark[ident] = cpu
+            self.wakeups[name] += 1
+            self.recent.append((now, name))
+
+    def thread_done(self):
+        """Forget the CPU mark of a short-lived thread that is about to exit"""
+        with self._lock:
+            self._cpu_mark.pop(threading.get_ident(), None)
+
+    def spawn(self, program):
+        """Count a subprocess start"""
+        if self.enabled:
+            with self._lock:
+                self.spawns[program] += 1
+
+    def report(self):
+        """Counters for the current window as a dict"""
+        now = time.monotonic()
+        with self._lock:
+            window = max(now - self.since, 1e-6)
+            last_minute = Counter(name for t, name in self.recent if t > now - 60)
+            threads = {
+                name: {
+                    "wakeups": count,
+                    "wakeups_per_min": round(count * 60 / window, 1),
+                    "wakeups_last_min": last_minute[name],
+                    "cpu_ms": round(self.cpu[name] * 1000, 1),
+                }
+                for name, count in sorted(self.wakeups.items())
+            }
+            return {
+                "enabled": self.enabled,
+                "low_power": self.low_power,
+                "window_s": round(window, 1),
+                "process_cpu_ms": round((time.process_time() - self.process_cpu_start) * 1000, 1),
+                "threads": threads,
+                "subprocesses": dict(self.spawns),
+                "spawns_per_min": round(sum(self.spawns.values()) * 60 / window, 2),
+                "rss_mb": round(current_rss() / 2**20, 1),
+            }
+
+def current_rss():
+    """Resident memory of this process in bytes (0 if unknown)"""
+    try:
+        if sys.platform == "win32":
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+            return counters.WorkingSetSize
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+profiler = AgentProfiler()
+
+def tick_sleep(interval):
+    """
+    Sleep between background polls.
+
+    In low power mode the interval is stretched and the wakeup is rounded up
+    to a shared LOW_POWER_TICK grid, so all polling threads wake together
+    instead of each waking the CPU on its own schedule.
+    """
+    if not profiler.low_power:
+        time.sleep(interval)
+        return
+    now = time.monotonic()
+    target = now + interval * LOW_POWER_FACTOR
+    target = math.ceil(target / LOW_POWER_TICK) * LOW_POWER_TICK
+    time.sleep(target - now)
+
+# Request tracing. A frame may carry a "trace" id from the panel; the reply
+# then lists where the agent spent the time as "spans": [[name, start ms,
+# duration ms], ...], starts counted from when the frame was read. Untraced
+# commands pay one thread-local lookup per span.
+MAX_TRACE_ID = 64
+current_trace = threading.local()
+
+class RequestTrace:
+    """Spans of one traced command, kept on the thread running it"""
+    __slots__ = ("trace_id", "start", "spans")
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, start, end):
+        self.spans.append([name, round((start - self.start) * 1000, 3), round((end - start) * 1000, 3)])
+
+@contextmanager
+def traced(name):
+    """Time the block as a span of the current thread's traced command, if any"""
+    trace = getattr(current_trace, "trace", None)
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter())
+
+# Authenticated protocol. When a shared key is configured every command must
+# arrive as a signed JSON frame: {"cmd": ..., "ts": <ms>, "nonce": ..., "to": ..., "mac": ...}
+# one per line. The mac is an HMAC-SHA256 of the frame without "mac"; replies
+# are signed the same way and echo the nonce. "to" is the "ip:port" the panel
+# connected to, so a frame captured on its way to one PC can't be replayed to
+# another (they all share the key). Connections are meant to be kept open and
+# reused, so the signature is the only per-command cost.
+KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent.key")
+AUTH_WINDOW = 300          # seconds of clock difference tolerated between panel and PC
+MAX_FRAME = 256 * 1024     # longest accepted frame line
+MAX_NONCES = 100000        # replay cache size
+
+def load_key(path=KEY_FILE):
+    """Shared key from KIDPC_KEY or the key file; None means authentication is off"""
+    key = os.environ.get("KIDPC_KEY")
+    if not key:
+        try:
+            with open(path) as f:
+                key = f.read().strip()
+        except FileNotFoundError:
+            return None
+    return key.encode() if key else None
+
+# The panel tells PCs apart by this ID rather than their IP address, which
+# DHCP may change. Made up on first run and kept next to the script.
+AGENT_ID_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_id")
+
+def load_agent_id(path=AGENT_ID_FILE):
+    """This PC's agent ID, created on first use; without a path it lasts until exit"""
+    if path:
+        try:
+            with open(path) as f:
+                agent_id = f.read().strip()
+            if agent_id:
+                return agent_id
+        except FileNotFoundError:
+            pass
+    agent_id = secrets.token_hex(8)
+    if path:
+        try:
+            with open(path, "w") as f:
+                f.write(agent_id)
+        except OSError as e:
+            logging.error(f"Could not save agent ID to {path}: {e}")
+    return agent_id
+
+def frame_mac(key, frame):
+    """HMAC-SHA256 of a frame's canonical JSON, ignoring any "mac" field"""
+    body = {k: v for k, v in frame.items() if k != "mac"}
+    data = json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+    return hmac.new(key, data, hashlib.sha256).hexdigest()
+
+# Backpressure. Each client address gets a token bucket of commands, the
+# server holds a bounded number of connections, and commands run through a
+# fixed number of worker slots with a short, bounded wait. Anything over a
+# limit gets an immediate "BUSY" instead of queueing up work.
+CLIENT_TIMEOUT = 60        # seconds an idle connection is kept
+RATE_LIMIT = 20            # commands per second per client address (0 = no limit)
+RATE_BURST = 40            # commands a client may send at once
+MAX_CONNECTIONS = 32       # open connections in total
+MAX_CONNECTIONS_PER_IP = 8
+MAX_WORKERS = 4            # commands executing at once
+MAX_WAITING = 16           # commands waiting for a worker
+WORKER_WAIT = 2            # seconds a command may wait for a worker
+MAX_BUCKETS = 1024         # client addresses tracked before full buckets are forgotten
+STATUS_MAX_AGE = 1.0       # seconds GET_STATUS may reuse the last lock check
+
+# Idempotency. A frame may carry an "id" chosen by the client; a retry with
+# the same id gets the first attempt's reply instead of running again (so a
+# timed-out EXTEND_TIME that is retried adds the time once).
+IDEMPOTENCY_KEYS = 256     # recent ids remembered
+IDEMPOTENCY_TTL = 600      # seconds an id is remembered after its last use
+MAX_ID_LENGTH = 64
+
+def valid_request_id(request_id):
+    """None (no id) or a short string"""
+    return request_id is None or (isinstance(request_id, str) and 0 < len(request_id) <= MAX_ID_LENGTH)
+
+class TokenBucket:
+    """Refills `rate` tokens a second up to `burst`; each command takes one"""
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def take(self, now):
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+WEEKDAY_NAMES = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+ALL_DAYS = 0b1111111
+DAY_ALIASES = {"DAILY": ALL_DAYS, "WEEKDAYS": 0b0011111, "WEEKENDS": 0b1100000}
+MAX_LOCK_TIMES = 64        # recurring lock times kept by LockSchedule
+MAX_OVERRIDE_DAYS = 60     # dated overrides kept by LockSchedule
+
+def parse_days(spec):
+    """Turn 'MON-FRI', 'SAT,SUN', 'WEEKENDS' or 'DAILY' into a weekday bitmask"""
+    spec = spec.strip().upper()
+    if not spec:
+        return ALL_DAYS
+    if spec in DAY_ALIASES:
+        return DAY_ALIASES[spec]
+    mask = 0
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = (WEEKDAY_NAMES.index(d) for d in part.split("-", 1))
+            days = range(first, last + 1) if first <= last else [*range(first, 7), *range(0, last + 1)]
+        else:
+            days = [WEEKDAY_NAMES.index(part)]
+        for day in days:
+            mask |= 1 << day
+    return mask
+
+def format_days(mask):
+    """Readable form of a weekday bitmask"""
+    for name, alias in DAY_ALIASES.items():
+        if mask == alias:
+            return name
+    return ",".join(name for i, name in enumerate(WEEKDAY_NAMES) if mask & (1 << i))
+
+def parse_lock_time(spec):
+    """Parse 'HH:MM' or 'HH:MM@DAYS' into (hour, minute, weekday mask)"""
+    time_str, _, days = spec.partition("@")
+    hour, minute = map(int, time_str.split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid time {time_str}")
+    try:
+        mask = parse_days(days)
+    except ValueError:
+        raise ValueError(f"Invalid days {days}")
+    return hour, minute, mask
+
+# Desired-state sync. The panel keeps a policy per PC and compares a short
+# hash of it with GET_CONFIG_HASH, so a PC that is already in sync costs one
+# tiny round trip. The canonical form (and so the hash) must match the
+# panel's canonical_config in web_panel.py.
+CONFIG_HASH_LENGTH = 16   # hex digits of SHA-256 kept
+
+def config_hash(config):
+    """Short hash of a canonical config dict"""
+    data = json.dumps(config, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(data).hexdigest()[:CONFIG_HASH_LENGTH]
+
+def is_minutes(value):
+    """True for a whole number of minutes, 0 or more (JSON true is an int to Python, but not minutes)"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def is_string_list(value):
+    """True for a JSON list of strings"""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def config_section(changes, name, valid_value):
+    """An APPLY_CONFIG section ({} if absent) once it is an object of strings to valid values"""
+    section = changes.get(name, {})
+    if not isinstance(section, dict) or not all(isinstance(key, str) and valid_value(value)
+                                                for key, value in section.items()):
+        raise ValueError(f"{name} is malformed")
+    return section
+
+class LockSchedule:
+    """
+    Recurring weekly lock times plus per-date overrides.
+
+    Each weekday keeps a sorted list of minutes-of-day, so lookups and
+    inserts are a bisect instead of a scan, and the same time added twice
+    is stored once. An override replaces the weekly times for one date
+    (an empty override means no scheduled lock that day).
+    """
+    def __init__(self):
+        self._rules = {}                          # minute of day -> weekday mask
+        self._by_day = [[] for _ in range(7)]     # weekday -> sorted minutes
+        self._overrides = {}                      # date -> sorted minutes
+        self._lock = threading.Lock()
+        self.version = 0                          # bumped on every change
+
+    def add(self, hour, minute, days=ALL_DAYS):
+        """Add a recurring lock time, returns False if it was already there"""
+        at = hour * 60 + minute
+        with self._lock:
+            old = self._rules.get(at, 0)
+            if old | days == old:
+                return False
+            if not old and len(self._rules) >= MAX_LOCK_TIMES:
+                raise ValueError(f"Too many lock times (max {MAX_LOCK_TIMES})")
+            self._rules[at] = old | days
+            for day in range(7):
+                if days & ~old & (1 << day):
+                    bisect.insort(self._by_day[day], at)
+            self.version += 1
+            return True
+
+    def remove(self, hour, minute, days=ALL_DAYS):
+        """Remove a recurring lock time from the given days"""
+        at = hour * 60 + minute
+        with self._lock:
+            old = self._rules.get(at, 0)
+            if not old & days:
+                return False
+            for day in range(7):
+                if old & days & (1 << day):
+                    times = self._by_day[day]
+                    del times[bisect.bisect_left(times, at)]
+            if old & ~days:
+                self._rules[at] = old & ~days
+            else:
+                del self._rules[at]
+            self.version += 1
+            return True
+
+    def replace(self, rules):
+        """Swap in a whole new set of (hour, minute, days) rules"""
+        new_rules = {}
+        for hour, minute, days in rules:
+            if days:
+                at = hour * 60 + minute
+                new_rules[at] = new_rules.get(at, 0) | days
+        if len(new_rules) > MAX_LOCK_TIMES:
+            raise ValueError(f"Too many lock times (max {MAX_LOCK_TIMES})")
+        by_day = [sorted(at for at, mask in new_rules.items() if mask & (1 << day))
+                  for day in range(7)]
+        # Readers see either the old schedule or the new one, never a mix
+        with self._lock:
+            self._rules, self._by_day = new_rules, by_day
+            self.version += 1
+
+    def set_override(self, day, times):
+        """Use these (hour, minute) times instead of the weekly ones on one date"""
+        with self._lock:
+            self._overrides[day] = sorted({h * 60 + m for h, m in times})
+            # Forget the oldest dates rather than growing forever
+            for old in sorted(self._overrides)[:-MAX_OVERRIDE_DAYS]:
+                del self._overrides[old]
+            self.version += 1
+
+    def clear_override(self, day):
+        """Go back to the weekly times for a date"""
+        with self._lock:
+            if self._overrides.pop(day, None) is None:
+                return False
+            self.version += 1
+            return True
+
+    def prune(self, today):
+        """Drop overrides for dates that have passed"""
+        with self._lock:
+            for old in [d for d in self._overrides if d < today]:
+                del self._overrides[old]
+
+    def rules(self):
+        """Recurring rules as a sorted list of (hour, minute, days)"""
+        with self._lock:
+            return [(at // 60, at % 60, mask) for at, mask in sorted(self._rules.items())]
+
+    def overrides(self):
+        """Dated overrides as a sorted list of (date, [(hour, minute), ...])"""
+        with self._lock:
+            return [(d, [(at // 60, at % 60) for at in times])
+                    for d, times in sorted(self._overrides.items())]
+
+    def next_deadline(self, now):
+        """First scheduled lock strictly after `now`, or None if nothing is scheduled"""
+        with self._lock:
+            after = now.hour * 60 + now.minute
+            for offset in range(8):
+                day = now.date() + timedelta(days=offset)
+                times = self._overrides.get(day)
+                if times is None:
+                    times = self._by_day[day.weekday()]
+                # Locks fire on the minute, so today only counts later minutes
+                i = bisect.bisect_right(times, after) if offset == 0 else 0
+                if i < len(times):
+                    at = times[i]
+                    return datetime.combine(day, dtime(at // 60, at % 60))
+            return None
+
+    def __len__(self):
+        return len(self._rules)
+
+class PlatformBackend(ABC):
+    """
+    OS-specific actions used by PCTimeControl.
+
+    PCTimeControl only talks to the machine through one of these, so the
+    scheduler, usage accounting and server run anywhere with NullBackend.
+    A backend missing any of the abstract methods can't be created.
+    """
+    name = "base"
+
+    @abstractmethod
+    def lock(self):
+        """Lock the screen"""
+
+    @abstractmethod
+    def is_locked(self):
+        """True if the screen is currently locked"""
+
+    @abstractmethod
+    def shutdown(self, seconds):
+        """Shut the machine down after a warning period"""
+
+    @abstractmethod
+    def cancel_shutdown(self):
+        """Cancel a pending shutdown"""
+
+    @abstractmethod
+    def show_popup(self, title, message):
+        """Show a message to whoever is at the screen, without blocking"""
+
+    def is_workstation_locked(self):
+        """Quick lock guess; backends with a cheaper check than is_locked() override this"""
+        return self.is_locked()
+
+    @abstractmethod
+    def foreground_process(self):
+        """(pid, executable name in lower case) of the app in front, or None"""
+
+    @abstractmethod
+    def terminate_process(self, pid):
+        """Close a process (used to enforce per-app limits)"""
+
+    @abstractmethod
+    def process_snapshot(self):
+        """{pid: executable name in lower case} for every running process"""
+
+    @abstractmethod
+    def capture_screen(self, width):
+        """(width, height, RGB bytes) of the screen scaled down to `width`, or None"""
+
+    @abstractmethod
+    def restart_agent(self, script):
+        """Have the agent started again once this process exits; False if this backend can't"""
+
+class WindowsBackend(PlatformBackend):
+    """The real thing: user32, tasklist, shutdown.exe and tkinter popups"""
+    name = "windows"
+
+    def __init__(self):
+        self.visible_windows = []
+        self._process_names = {}  # pid -> exe name, saves an OpenProcess per sample
+        self._process_entry = None
 
     def _enum_callback(self, hwnd, lParam):
         # build a list of visible, titled windows
@@ -45,15 +574,17 @@ class PCTimeControl:
                 self.visible_windows.append(hwnd)
         return True
 
-    def _check_if_locked(self):
-        return self.is_locked
+    def lock(self):
+        ctypes.windll.user32.LockWorkStation()
 
-    def check_if_locked(self):
+    def is_locked(self):
         """
         Returns True if LogonUI.exe is present (screen locked),
         False otherwise.
         """
+        import subprocess
         try:
+            profiler.spawn("tasklist")
             out = subprocess.check_output(
                 'tasklist /FI "IMAGENAME eq LogonUI.exe" /NH',
                 shell=True,
@@ -67,22 +598,6 @@ class PCTimeControl:
             # fallback to whatever you had before (or assume unlocked)
             return False
 
-    def monitor_activity(self):
-        """Monitor lock/unlock status"""
-        while True:
-            actual_locked = self.check_if_locked()
-
-            # Detect unlock
-            if self.is_locked and not actual_locked:
-                self.is_locked = False
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] PC has been unlocked (detected by activity)")
-
-            # Detect manual lock (not by our script)
-            elif not self.is_locked and actual_locked:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] PC has been locked (detected)")
-
-            time.sleep(3)  # Check every 3 seconds
-
     def is_workstation_locked(self):
         """Check if the workstation is currently locked"""
         # Simple method: check if we can get the foreground window title
@@ -107,17 +622,152 @@ class PCTimeControl:
         except:
             return False
 
-    def add_scheduled_lock(self, hour, minute):
-        """Add a time when the PC should be locked"""
-        self.lock_times.append(dtime(hour, minute))
+    def foreground_process(self):
+        """Foreground window's process via user32/kernel32, no subprocess"""
+        from ctypes import wintypes
 
-    def set_usage_limit(self, minutes):
-        """Set maximum usage time in minutes"""
-        self.usage_limit = minutes
+        user32 = ctypes.windll.user32
+        hwnd = user32.GetForegroundWindow()
+        if not hwnd:
+            return None
+        pid = wintypes.DWORD()
+        user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        pid = pid.value
+        name = self._process_names.get(pid)
+        if name is None:
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return None
+            try:
+                buf = ctypes.create_unicode_buffer(260)
+                size = wintypes.DWORD(len(buf))
+                if not kernel32.QueryFullProcessImageNameW(handle, 0, buf, ctypes.byref(size)):
+                    return None
+                name = os.path.basename(buf.value).lower()
+            finally:
+                kernel32.CloseHandle(handle)
+            if len(self._process_names) > 512:
+                self._process_names.clear()
+            self._process_names[pid] = name
+        return pid, name
 
-    def show_message(self, message, title="PC Time Control"):
+    def forget_processes(self):
+        """Drop the pid -> name cache (pids get reused)"""
+        self._process_names.clear()
+
+    def process_snapshot(self):
+        """One Toolhelp32 snapshot walked in-process - no tasklist, no subprocess"""
+        from ctypes import wintypes
+
+        if self._process_entry is None:
+            class PROCESSENTRY32W(ctypes.Structure):
+                _fields_ = [("dwSize", wintypes.DWORD), ("cntUsage", wintypes.DWORD),
+                            ("th32ProcessID", wintypes.DWORD), ("th32DefaultHeapID", ctypes.c_size_t),
+                            ("th32ModuleID", wintypes.DWORD), ("cntThreads", wintypes.DWORD),
+                            ("th32ParentProcessID", wintypes.DWORD), ("pcPriClassBase", ctypes.c_long),
+                            ("dwFlags", wintypes.DWORD), ("szExeFile", ctypes.c_wchar * 260)]
+            kernel32 = ctypes.windll.kernel32
+            kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+            self._process_entry = PROCESSENTRY32W
+        kernel32 = ctypes.windll.kernel32
+        snapshot = kernel32.CreateToolhelp32Snapshot(0x2, 0)  # TH32CS_SNAPPROCESS
+        if not snapshot or snapshot == wintypes.HANDLE(-1).value:
+            return {}
+        processes = {}
+        try:
+            entry = self._process_entry()
+            entry.dwSize = ctypes.sizeof(entry)
+            more = kernel32.Process32FirstW(snapshot, ctypes.byref(entry))
+            while more:
+                processes[entry.th32ProcessID] = entry.szExeFile.lower()
+                more = kernel32.Process32NextW(snapshot, ctypes.byref(entry))
+        finally:
+            kernel32.CloseHandle(snapshot)
+        return processes
+
+    def capture_screen(self, width):
+        """GDI StretchBlt of the primary screen into a small DIB - one copy, already scaled"""
+        from ctypes import wintypes
+
+        class BITMAPINFOHEADER(ctypes.Structure):
+            _fields_ = [("biSize", wintypes.DWORD), ("biWidth", wintypes.LONG), ("biHeight", wintypes.LONG),
+                        ("biPlanes", wintypes.WORD), ("biBitCount", wintypes.WORD),
+                        ("biCompression", wintypes.DWORD), ("biSizeImage", wintypes.DWORD),
+                        ("biXPelsPerMeter", wintypes.LONG), ("biYPelsPerMeter", wintypes.LONG),
+                        ("biClrUsed", wintypes.DWORD), ("biClrImportant", wintypes.DWORD)]
+
+        user32, gdi32 = ctypes.windll.user32, ctypes.windll.gdi32
+        screen_w, screen_h = user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+        if screen_w <= 0 or screen_h <= 0:
+            return None
+        height = max(1, screen_h * width // screen_w)
+        stride = (width * 3 + 3) & ~3
+        screen_dc = user32.GetDC(0)
+        if not screen_dc:
+            return None  # e.g. the secure desktop is showing
+        mem_dc = gdi32.CreateCompatibleDC(screen_dc)
+        bitmap = gdi32.CreateCompatibleBitmap(screen_dc, width, height)
+        old = gdi32.SelectObject(mem_dc, bitmap)
+        try:
+            gdi32.SetStretchBltMode(mem_dc, 4)  # HALFTONE: average pixels instead of dropping them
+            if not gdi32.StretchBlt(mem_dc, 0, 0, width, height, screen_dc, 0, 0, screen_w, screen_h,
+                                    0x00CC0020):  # SRCCOPY
+                return None
+            header = BITMAPINFOHEADER(biSize=ctypes.sizeof(BITMAPINFOHEADER), biWidth=width,
+                                      biHeight=-height, biPlanes=1, biBitCount=24)  # top-down BGR
+            buf = ctypes.create_string_buffer(stride * height)
+            if not gdi32.GetDIBits(mem_dc, bitmap, 0, height, buf, ctypes.byref(header), 0):
+                return None
+        finally:
+            gdi32.SelectObject(mem_dc, old)
+            gdi32.DeleteObject(bitmap)
+            gdi32.DeleteDC(mem_dc)
+            user32.ReleaseDC(0, screen_dc)
+        bgr = buf.raw
+        if stride != width * 3:
+            bgr = b"".join(bgr[y * stride:y * stride + width * 3] for y in range(height))
+        rgb = bytearray(len(bgr))
+        rgb[0::3], rgb[1::3], rgb[2::3] = bgr[2::3], bgr[1::3], bgr[0::3]
+        return width, height, bytes(rgb)
+
+    def terminate_process(self, pid):
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x0001, False, pid)  # PROCESS_TERMINATE
+        if handle:
+            kernel32.TerminateProcess(handle, 1)
+            kernel32.CloseHandle(handle)
+
+    def restart_agent(self, script):
+        """
+        Leave a detached helper (RESTART_HELPER) behind: once this process has
+        exited it runs the scheduled task, or this same command line if the
+        agent was started by hand, and puts the previous build back if the
+        new one does not confirm it started.
+        """
+        import subprocess
+        profiler.spawn("restart")
+        command = [sys.executable, script] + sys.argv[1:]
+        subprocess.Popen([sys.executable, "-c", RESTART_HELPER, str(os.getpid()), UPDATE_TASK, script,
+                          str(UPDATE_CONFIRM_TIMEOUT)] + command,
+                         creationflags=0x00000008 | 0x00000200,  # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+                         close_fds=True, cwd=os.path.dirname(script))
+        return True
+
+    def shutdown(self, seconds):
+        profiler.spawn("shutdown")
+        os.system(f'shutdown /s /t {seconds} /c "Computer will shutdown in {seconds} seconds"')
+
+    def cancel_shutdown(self):
+        profiler.spawn("shutdown")
+        os.system('shutdown /a')
+
+    def show_popup(self, title, message):
         """Display a message using tkinter"""
         def display():
+            import tkinter as tk
+            from tkinter import messagebox
+
             root = tk.Tk()
             root.withdraw()  # Hide the main window
             root.attributes('-topmost', True)  # Make it appear on top
@@ -127,88 +777,1134 @@ class PCTimeControl:
         # Run in a separate thread to avoid blocking
         threading.Thread(target=display, daemon=True).start()
 
-    def lock_pc(self):
-        """Lock the Windows PC"""
-        self.is_locked = True
-        ctypes.windll.user32.LockWorkStation()
+class NullBackend(PlatformBackend):
+    """
+    In-memory backend for headless runs (Linux CI, load tests, simulators).
 
-    def shutdown_pc(self, seconds=60):
-        """Shutdown PC with warning"""
-        os.system(f'shutdown /s /t {seconds} /c "Computer will shutdown in {seconds} seconds"')
+    Locks, shutdowns and popups only change state on this object, which
+    tests can inspect or drive (e.g. unlock() to play the kid logging back in).
+    """
+    name = "null"
+
+    def __init__(self):
+        self.locked = False
+        self.shutdown_at = None
+        self.popups = deque(maxlen=100)
+        self.calls = Counter()
+        self.foreground = None      # (pid, name) the "kid" is using
+        self.terminated = []
+        self.processes = {}         # pid -> name, the fake process list
+        self._next_pid = 1000
+        # Synthetic screen: a backdrop per "scene" with moving boxes on top
+        self.screen_size = (1920, 1080)
+        self.screen_scene = 0       # change to redraw everything (switching apps)
+        self.screen_boxes = 1       # boxes moving between captures (0 = still screen)
+        self._screen_frame = 0
+        self._backdrop = (None, b"")
+
+    def lock(self):
+        self.calls["lock"] += 1
+        self.locked = True
+
+    def unlock(self):
+        """Simulate someone unlocking the screen"""
+        self.locked = False
+
+    def is_locked(self):
+        self.calls["is_locked"] += 1
+        return self.locked
+
+    def shutdown(self, seconds):
+        self.calls["shutdown"] += 1
+        self.shutdown_at = time.time() + seconds
 
     def cancel_shutdown(self):
-        """Cancel pending shutdown"""
-        os.system('shutdown /a')
+        self.calls["cancel_shutdown"] += 1
+        self.shutdown_at = None
+
+    def foreground_process(self):
+        return None if self.locked else self.foreground
+
+    def terminate_process(self, pid):
+        self.calls["terminate"] += 1
+        self.terminated.append(pid)
+        self.processes.pop(pid, None)
+        if self.foreground and self.foreground[0] == pid:
+            self.foreground = None
+
+    def start_process(self, name):
+        """Simulate a program starting; returns its pid"""
+        self._next_pid += 4
+        self.processes[self._next_pid] = name.lower()
+        return self._next_pid
+
+    def process_snapshot(self):
+        self.calls["process_snapshot"] += 1
+        return dict(self.processes)
+
+    def restart_agent(self, script):
+        self.calls["restart"] += 1
+        return False
+
+    def capture_screen(self, width):
+        self.calls["capture_screen"] += 1
+        height = max(1, self.screen_size[1] * width // self.screen_size[0])
+        key = (width, height, self.screen_scene)
+        if self._backdrop[0] != key:
+            # Soft bands, different per scene, so tiles compress like a real desktop
+            scene = self.screen_scene
+            rows = []
+            for y in range(height):
+                shade = (y * 255 // height + scene * 70) % 256
+                rows.append(bytes(c for x in range(width)
+                                  for c in ((x * 255 // width + scene * 40) % 256, shade, (x // 32 * 48) % 256)))
+            self._backdrop = (key, b"".join(rows))
+        screen = bytearray(self._backdrop[1])
+        stride = width * 3
+        for box in range(self.screen_boxes):
+            size = min(24, width, height)
+            x = (self._screen_frame * 7 + box * 53) % (width - size + 1)
+            y = (self._screen_frame * 3 + box * 31) % (height - size + 1)
+            color = bytes((255, 255 - box * 40 % 256, box * 90 % 256)) * size
+            for row in range(y, y + size):
+                screen[row * stride + x * 3:row * stride + (x + size) * 3] = color
+        self._screen_frame += 1
+        return width, height, bytes(screen)
+
+    def show_popup(self, title, message):
+        self.calls["popup"] += 1
+        self.popups.append((title, message))
+        logging.info(f"Popup: {title}: {message}")
+
+BACKENDS = {"windows": WindowsBackend, "null": NullBackend}
+
+def select_backend(name=None):
+    """
+    Create the platform backend: the given name, else the KIDPC_BACKEND
+    environment variable, else Windows on Windows and null everywhere else.
+    """
+    name = name or os.environ.get("KIDPC_BACKEND")
+    if not name:
+        name = "windows" if sys.platform == "win32" else "null"
+    try:
+        return BACKENDS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown backend {name!r} (choose from {', '.join(BACKENDS)})")
+
+APP_SAMPLE_INTERVAL = 5   # seconds between foreground app samples
+APP_FLUSH_INTERVAL = 60   # seconds between folding samples into the daily totals
+APP_LIMIT_WARNING = 5     # minutes of warning before an app limit closes the app
+
+class AppUsageTracker:
+    """
+    Time per foreground application, for GET_USAGE and per-app limits.
+
+    A sample is one foreground-window lookup (no subprocess, no window
+    enumeration); seconds go into a small pending Counter and are folded
+    into the day's totals once a minute, so a sample is just a dict bump.
+    """
+    def __init__(self, control, interval=APP_SAMPLE_INTERVAL, flush_interval=APP_FLUSH_INTERVAL):
+        self.control = control
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.day = date.today()
+        self.totals = Counter()     # exe name -> seconds today (flushed)
+        self.pending = Counter()    # exe name -> seconds since the last flush
+        self.limits = {}            # exe name -> minutes per day
+        self.warned = set()         # apps already warned today
+        self.reached = set()        # apps whose limit was already announced (and counted) today
+        self._lock = threading.Lock()
+        self._last_sample = None
+        self._last_flush = time.monotonic()
+
+    def run(self):
+        """Sampler loop (runs in its own daemon thread)"""
+        while True:
+            profiler.wakeup("apps")
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error(f"App usage sample failed: {e}")
+            tick_sleep(self.interval)
+
+    def sample(self):
+        """Charge the time since the last sample to the app in front"""
+        now = time.monotonic()
+        elapsed = 0 if self._last_sample is None else now - self._last_sample
+        self._last_sample = now
+        # A long gap means sleep/hibernate, not usage
+        elapsed = min(elapsed, 2 * self.interval * (LOW_POWER_FACTOR if profiler.low_power else 1))
+
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+        if self.control.is_locked:
+            return
+        current = self.control.backend.foreground_process()
+        if current is None:
+            return
+        pid, name = current
+        with self._lock:
+            self.pending[name] += elapsed
+            limit = self.limits.get(name)
+            used = self.totals[name] + self.pending[name]
+        if limit is not None:
+            self.enforce(pid, name, used, limit)
+
+    def enforce(self, pid, name, used, limit):
+        """Warn once near the limit; once it is over, say so once and close the app every time"""
+        if used >= limit * 60:
+            if name not in self.reached:
+                self.reached.add(name)
+                logging.info(f"App limit reached for {name} ({limit} min), closing it")
+                self.control.show_message(f"Time is up for {name} today ({limit} minutes).", "App Limit")
+                self.control.stats.record("limit_hits", detail=name)
+            self.control.backend.terminate_process(pid)
+        elif used >= (limit - APP_LIMIT_WARNING) * 60 and name not in self.warned:
+            self.warned.add(name)
+            left = max(1, round(limit - used / 60))
+            self.control.show_message(f"{name} will close in about {left} minutes.", "App Limit")
+
+    def flush(self):
+        """Fold pending samples into the daily totals, starting a new day at midnight"""
+        with self._lock:
+            today = date.today()
+            if today != self.day:
+                self.day = today
+                self.totals.clear()
+                self.warned.clear()
+                self.reached.clear()
+            self.totals.update(self.pending)
+            self.pending.clear()
+            self._last_flush = time.monotonic()
+        forget = getattr(self.control.backend, "forget_processes", None)
+        if forget:
+            forget()
+
+    def set_limit(self, name, minutes):
+        """Daily limit for one app in minutes; 0 or None removes it"""
+        name = name.strip().lower()
+        with self._lock:
+            if minutes:
+                self.limits[name] = minutes
+            else:
+                self.limits.pop(name, None)
+            self.warned.discard(name)
+            self.reached.discard(name)
+
+    def report(self):
+        """Today's minutes per app (most used first) and the configured limits"""
+        self.flush()
+        with self._lock:
+            apps = {name: round(seconds / 60, 1) for name, seconds in self.totals.most_common()}
+            return {"date": self.day.isoformat(), "apps": apps, "limits": dict(self.limits)}
+
+PROCESS_WATCH_INTERVAL = 2   # seconds between process snapshots while a block is active
+BLOCK_NOTICE_INTERVAL = 60   # seconds before the same blocked app pops up a message again
+
+def parse_window(spec):
+    """'HH:MM-HH:MM[@DAYS]' -> (start minute, end minute, weekday mask); the range may cross midnight"""
+    times, _, days = spec.partition("@")
+    start, _, end = times.partition("-")
+    start_h, start_m, _ = parse_lock_time(start.strip())
+    end_h, end_m, _ = parse_lock_time(end.strip())
+    try:
+        mask = parse_days(days)
+    except ValueError:
+        raise ValueError(f"Invalid days {days}")
+    return start_h * 60 + start_m, end_h * 60 + end_m, mask
+
+def format_window(window):
+    start, end, mask = window
+    return f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}@{format_days(mask)}"
+
+def window_active(window, now):
+    """True if `now` falls in the window (start == end means the whole day)"""
+    start, end, mask = window
+    minute = now.hour * 60 + now.minute
+    today = now.weekday()
+    if start == end:
+        return bool(mask >> today & 1)
+    if start < end:
+        return bool(mask >> today & 1) and start <= minute < end
+    # Overnight: the evening belongs to today, the small hours to yesterday's window
+    if minute >= start:
+        return bool(mask >> today & 1)
+    return minute < end and bool(mask >> ((today - 1) % 7) & 1)
+
+class Blocklist:
+    """
+    Programs that may not run, each always or only in some time windows.
+
+    Patterns are executable names, with * ? [] wildcards allowed. Matching
+    is compiled per set of rules active at the moment: exact names into a
+    set and every wildcard pattern into one combined regex, so checking a
+    process is a set lookup plus at most one regex match. The compiled form
+    is rebuilt only when the rules or the active windows change.
+    """
+    def __init__(self):
+        self.rules = {}             # pattern -> [window, ...], empty for always
+        self.version = 0
+        self._lock = threading.Lock()
+        self._compiled = (None, frozenset(), None)   # (active patterns, exact names, regex)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, pattern, window=None):
+        """Block a pattern always (window None) or in one more window"""
+        pattern = pattern.strip().lower()
+        if not pattern:
+            raise ValueError("Empty pattern")
+        with self._lock:
+            windows = self.rules.get(pattern)
+            if window is None:
+                self.rules[pattern] = []
+            elif windows is None or (windows and window not in windows):
+                self.rules[pattern] = (windows or []) + [window]
+            else:
+                return False
+            self.version += 1
+            return True
+
+    def remove(self, pattern):
+        with self._lock:
+            if self.rules.pop(pattern.strip().lower(), None) is None:
+                return False
+            self.version += 1
+            return True
+
+    def replace(self, rules):
+        """Swap in {pattern: [window, ...]}"""
+        with self._lock:
+            self.rules = {p.strip().lower(): list(w) for p, w in rules.items() if p.strip()}
+            self.version += 1
+
+    def active(self, now):
+        """Patterns blocked at `now`"""
+        with self._lock:
+            return frozenset(pattern for pattern, windows in self.rules.items()
+                             if not windows or any(window_active(w, now) for w in windows))
+
+    def matcher(self, active):
+        """Function name -> matching pattern or None, for the given active patterns"""
+        key, exact, regex = self._compiled
+        if key != active:
+            exact = frozenset(p for p in active if not any(c in p for c in "*?["))
+            globs = sorted(active - exact)
+            regex = re.compile("|".join(fnmatch.translate(p) for p in globs)) if globs else None
+            self._compiled = (active, exact, regex)
+
+        def match(name):
+            if name in exact:
+                return name
+            if regex is not None and regex.match(name):
+                return next(p for p in active - exact if fnmatch.fnmatchcase(name, p))
+            return None
+        return match
+
+    def to_config(self):
+        with self._lock:
+            return {pattern: [format_window(w) for w in windows] for pattern, windows in self.rules.items()}
+
+class ProcessWatcher:
+    """
+    Closes blocked programs.
+
+    Each tick takes one process snapshot from the backend and diffs it
+    against the previous one (a C-level set difference of (pid, name)
+    pairs), so only processes that started since the last tick are
+    matched. Everything running is checked once more whenever the rules or
+    the active windows change. With nothing blocked right now, a tick does
+    not even take a snapshot.
+    """
+    def __init__(self, control, interval=PROCESS_WATCH_INTERVAL):
+        self.control = control
+        self.interval = interval
+        self.blocklist = Blocklist()
+        self.previous = {}
+        self.checked = (None, -1)   # (active patterns, blocklist version) of the last full check
+        self.blocked = Counter()    # name -> times closed today
+        self.day = date.today()
+        self._notified = {}         # name -> time.monotonic() of the last popup
+
+    def run(self):
+        """Watcher loop (runs in its own daemon thread)"""
+        while True:
+            profiler.wakeup("procwatch")
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Process watch failed: {e}")
+            tick_sleep(self.interval)
+
+    def tick(self, now=None):
+        """One check; returns how many processes were looked at"""
+        now = now or datetime.now()
+        if now.date() != self.day:
+            self.day = now.date()
+            self.blocked.clear()
+        active = self.blocklist.active(now) if self.blocklist.rules else frozenset()
+        if not active:
+            self.previous = {}
+            self.checked = (active, self.blocklist.version)
+            return 0
+        snapshot = self.control.backend.process_snapshot()
+        if self.checked != (active, self.blocklist.version):
+            candidates = list(snapshot.items())
+            self.checked = (active, self.blocklist.version)
+        else:
+            candidates = snapshot.items() - self.previous.items()
+        self.previous = snapshot
+        if candidates:
+            match = self.blocklist.matcher(active)
+            for pid, name in candidates:
+                pattern = match(name)
+                if pattern:
+                    self.block(pid, name, pattern)
+        return len(candidates)
 
-    def check_time_limits(self):
-        """Check if any time limits have been reached"""
-        current_time = datetime.now()
+    def block(self, pid, name, pattern):
+        logging.info(f"Closing blocked program {name} (pid {pid}, rule {pattern})")
+        self.control.backend.terminate_process(pid)
+        self.previous.pop(pid, None)
+        self.blocked[name] += 1
+        self.control.stats.record("limit_hits", detail=f"blocked {name}")
+        now = time.monotonic()
+        if now - self._notified.get(name, float("-inf")) >= BLOCK_NOTICE_INTERVAL:
+            self._notified[name] = now
+            self.control.show_message(f"{name} is blocked right now.", "Blocked")
 
-        # Check scheduled lock times
-        for lock_time in self.lock_times:
-            if (current_time.hour == lock_time.hour and
-                current_time.minute == lock_time.minute and
-                current_time.second < 1):
-                return True, "Scheduled lock time reached"
+THUMBNAIL_WIDTH = 320            # pixels across; the height follows the screen's shape
+THUMBNAIL_TILE = 16              # tiles are compared and sent as 16x16 pixel squares
+THUMBNAIL_MIN_INTERVAL = 0.5     # seconds between captures while the screen is changing
+THUMBNAIL_MAX_INTERVAL = 5       # ... and while it is still
+THUMBNAIL_IDLE = 15              # seconds without a THUMBNAIL request before capturing stops
+THUMBNAIL_BANDWIDTH = 64 * 1024  # bytes per second of tile data at most
+
+class ThumbnailStream:
+    """
+    A small live picture of the screen for the panel's control page.
+
+    Captures are cut into tiles; a tile is compressed and given the current
+    sequence number only when its CRC changes, so a viewer that has frame N
+    asks for THUMBNAIL:N and gets just the tiles changed since. Nothing is
+    kept per viewer. A whole band of tiles whose CRC is unchanged is
+    skipped without looking at its tiles.
+
+    Capturing runs only while someone has asked for a frame recently. The
+    interval halves while the screen changes and grows while it is still,
+    and tile bytes are charged to a token bucket: a capture that overspends
+    the bandwidth cap pushes the next one back until it is paid off.
+    """
+    def __init__(self, control, width=THUMBNAIL_WIDTH, bandwidth=THUMBNAIL_BANDWIDTH):
+        self.control = control
+        self.width = width
+        self.interval = THUMBNAIL_MIN_INTERVAL
+        self.budget = TokenBucket(bandwidth, 2 * bandwidth)
+        self.seq = 0
+        self.base_seq = 0           # first frame of the current size; older viewers need it all
+        self.size = (0, 0)
+        self.bands = []             # crc per row of tiles
+        self.tiles = []             # (crc, seq changed, base64 zlib data) per tile, row by row
+        self.sent = 0               # bytes of tile data produced so far
+        self.viewed_at = float("-inf")
+        self.wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._capturing = threading.Lock()
+        self._thread = None
+
+    def request(self, since):
+        """THUMBNAIL reply for a viewer holding frame `since` (None for a new viewer)"""
+        self.viewed_at = time.monotonic()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, daemon=True)
+                self._thread.start()
+        if not self.seq:
+            self.capture()
+        self.wakeup.set()
+        return self.delta(since)
+
+    def delta(self, since):
+        with self._lock:
+            width, height = self.size
+            full = since is None or since < self.base_seq or since > self.seq
+            tiles = {str(i): data for i, (crc, seq, data) in enumerate(self.tiles)
+                     if full or seq > since}
+            return {"seq": self.seq, "w": width, "h": height, "tile": THUMBNAIL_TILE,
+                    "full": full, "interval": self.interval, "tiles": tiles}
+
+    def capture(self):
+        """Take and encode one frame; returns bytes of changed tile data"""
+        with self._capturing:
+            frame = self.control.backend.capture_screen(self.width)
+            if frame is None:
+                return 0
+            return self.encode(*frame)
+
+    def encode(self, width, height, pixels):
+        tile, stride = THUMBNAIL_TILE, width * 3
+        columns, rows = -(-width // tile), -(-height // tile)
+        with self._lock:
+            seq = self.seq + 1
+            if self.size != (width, height):
+                self.size = (width, height)
+                self.base_seq = seq
+                self.bands = [None] * rows
+                self.tiles = [(None, 0, "")] * (columns * rows)
+            view = memoryview(pixels)
+        changed = []
+        for band in range(rows):
+            top, bottom = band * tile, min(height, band * tile + tile)
+            crc = zlib.crc32(view[top * stride:bottom * stride])
+            if crc == self.bands[band]:
+                continue
+            self.bands[band] = crc
+            for column in range(columns):
+                left, right = column * tile * 3, min(stride, (column + 1) * tile * 3)
+                data = b"".join(view[y * stride + left:y * stride + right] for y in range(top, bottom))
+                crc = zlib.crc32(data)
+                index = band * columns + column
+                if crc != self.tiles[index][0]:
+                    changed.append((index, crc, base64.b64encode(zlib.compress(data, 6)).decode()))
+        if not changed:
+            return 0
+        with self._lock:
+            for index, crc, data in changed:
+                self.tiles[index] = (crc, seq, data)
+            self.seq = seq
+        cost = sum(len(data) for _, _, data in changed)
+        self.sent += cost
+        return cost
+
+    def run(self):
+        """Capture loop (runs in its own daemon thread once someone watches)"""
+        while True:
+            if time.monotonic() - self.viewed_at > THUMBNAIL_IDLE:
+                self.interval = THUMBNAIL_MIN_INTERVAL
+                self.wakeup.clear()
+                self.wakeup.wait()
+                continue
+            profiler.wakeup("thumbnail")
+            try:
+                cost = self.capture()
+            except Exception as e:
+                logging.error(f"Screen capture failed: {e}")
+                cost = 0
+            if cost:
+                self.interval = max(THUMBNAIL_MIN_INTERVAL, self.interval / 2)
+            else:
+                self.interval = min(THUMBNAIL_MAX_INTERVAL, self.interval * 1.5)
+            now = time.monotonic()
+            self.budget.refill(now)
+            self.budget.tokens -= cost
+            delay = self.interval
+            if self.budget.tokens < 0:
+                delay = max(delay, -self.budget.tokens / self.budget.rate)
+            time.sleep(delay)
+
+STATS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage_stats.json")
+STATS_METRICS = ("active", "locks", "unlocks", "limit_hits")
+# Rollup -> (bucket key format, buckets kept). Old minutes and hours are
+# dropped; the hour and day buckets they were added to stay.
+STATS_ROLLUPS = {
+    "minute": ("%Y-%m-%dT%H:%M", 2 * 24 * 60),   # 2 days
+    "hour": ("%Y-%m-%dT%H", 90 * 24),            # 90 days
+    "day": ("%Y-%m-%d", 2 * 366),                # 2 years
+}
+STATS_STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+STATS_EVENTS = 500          # recent lock/unlock/limit events kept verbatim
+STATS_SAVE_INTERVAL = 300   # seconds between writes of the stats file
+
+class UsageStats:
+    """
+    Usage history for reports: active seconds, locks, unlocks and limit hits.
+
+    record() adds to the minute, hour and day bucket in one go, so a report
+    is a slice of already-summed buckets instead of a replay of events.
+    Each rollup keeps a fixed number of buckets (oldest dropped first), which
+    keeps the file bounded while older history survives at coarser grain.
+    With no path the history lives in memory only.
+    """
+    def __init__(self, path=STATS_FILE):
+        self.path = path
+        self.rollups = {res: {} for res in STATS_ROLLUPS}  # res -> bucket key -> values in STATS_METRICS order
+        self.events = deque(maxlen=STATS_EVENTS)            # (time, kind, detail)
+        self._lock = threading.Lock()
+        self._keys_minute = None
+        self._keys = None
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.load()
+
+    def _bucket_keys(self, when):
+        """Bucket key per rollup; strftime runs once per minute, not per write"""
+        minute = int(when.timestamp() // 60)
+        if minute != self._keys_minute:
+            self._keys = [(res, when.strftime(fmt)) for res, (fmt, _) in STATS_ROLLUPS.items()]
+            self._keys_minute = minute
+        return self._keys
+
+    def record(self, metric, amount=1, detail=None, when=None):
+        """Add to a metric in every rollup; detail also logs it as an event"""
+        index = STATS_METRICS.index(metric)
+        when = when or datetime.now()
+        with self._lock:
+            for res, key in self._bucket_keys(when):
+                buckets = self.rollups[res]
+                values = buckets.get(key)
+                if values is None:
+                    values = buckets[key] = [0] * len(STATS_METRICS)
+                    # Buckets arrive in time order, so the first one is the oldest
+                    while len(buckets) > STATS_ROLLUPS[res][1]:
+                        del buckets[next(iter(buckets))]
+                values[index] += amount
+            if detail is not None:
+                self.events.append((when.isoformat(timespec="seconds"), metric, detail))
+            self._dirty = True
+
+    def report(self, res="day", count=7):
+        """The last `count` buckets of one rollup, one list per metric (oldest first)"""
+        fmt, kept = STATS_ROLLUPS[res]
+        count = max(1, min(count, kept))
+        now = datetime.now()
+        keys = [(now - STATS_STEPS[res] * i).strftime(fmt) for i in range(count - 1, -1, -1)]
+        zero = [0] * len(STATS_METRICS)
+        with self._lock:
+            rows = [self.rollups[res].get(key, zero) for key in keys]
+        report = {"res": res, "keys": keys}
+        for i, metric in enumerate(STATS_METRICS):
+            report[metric] = [round(row[i]) for row in rows]
+        return report
+
+    def today(self, metric):
+        """Today's running total of one metric"""
+        key = datetime.now().strftime(STATS_ROLLUPS["day"][0])
+        with self._lock:
+            values = self.rollups["day"].get(key)
+            return values[STATS_METRICS.index(metric)] if values else 0
+
+    def recent_events(self, count=50):
+        """Most recent events, newest last"""
+        with self._lock:
+            return list(self.events)[-count:]
+
+    def load(self):
+        """Read the stats file, if any; a damaged file starts a fresh history"""
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for res in STATS_ROLLUPS:
+                self.rollups[res] = {key: list(values) for key, values in data.get(res, {}).items()}
+            self.events.extend(tuple(event) for event in data.get("events", []))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.error(f"Ignoring unreadable stats file {self.path}: {e}")
+
+    def save(self):
+        """Write the stats file atomically"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {res: {key: [round(v, 1) for v in values] for key, values in buckets.items()}
+                    for res, buckets in self.rollups.items()}
+            data["events"] = list(self.events)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.error(f"Could not save stats: {e}")
+
+    def save_if_due(self):
+        """Save when something changed and the last save is old enough"""
+        if self._dirty and time.monotonic() - self._last_save >= STATS_SAVE_INTERVAL:
+            self.save()
+
+WARNING_MINUTES = (10, 5, 1)  # warnings before a lock, in minutes
+LOCK_GRACE = 60               # seconds between "time's up" and the lock when a deadline has already passed
+ENFORCE_MAX_SLEEP = 60        # longest the engine waits without looking at the clock again
+DEADLINE_SLACK = 30           # seconds an event may be early before it is re-armed instead of fired
+LATE_LOCK_LIMIT = 600         # a scheduled lock missed by more than this (PC asleep) is skipped
+
+class EnforcementEngine:
+    """
+    Turns usage limits and scheduled locks into warnings and a lock.
+
+    The next deadline is armed as timed events on a heap - one per staged
+    warning plus the lock - and the thread waits on a Condition until the
+    first one is due. Anything that moves the deadline (EXTEND_TIME,
+    SET_LIMIT, schedule changes, lock/unlock) calls rearm(), which clears
+    the heap and arms again, so nothing sleeps on a stale deadline. Each
+    event also re-checks the deadline when it fires, since usage time only
+    counts while the PC is unlocked and awake.
+    """
+    def __init__(self, control, warnings=WARNING_MINUTES):
+        self.control = control
+        self.warnings = sorted({w for w in warnings if w > 0}, reverse=True)
+        self.events = []            # heap of (timestamp, seq, kind, minutes)
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.dirty = True
+        self.running = False
+        self.deadline = None        # timestamp of the armed deadline
+        self.kind = None            # "schedule" or "usage"
+        self.warned = set()         # warnings already shown for this deadline
+        self.grace_until = None     # lock time once a deadline was found already passed
 
-        # Check usage limit
+    def rearm(self):
+        """Recompute the deadline and its events (safe from any thread)"""
+        with self.cond:
+            self.dirty = True
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _push(self, when, kind, minutes=0):
+        self.seq += 1
+        heapq.heappush(self.events, (when, self.seq, kind, minutes))
+
+    def _arm(self):
+        """Replace the pending events with those for the current deadline (holding cond)"""
+        self.dirty = False
+        self.events.clear()
+        deadline, kind = self.control.next_deadline()
+        now = time.time()
+        if deadline is None:
+            self.deadline = self.kind = self.grace_until = None
+            self.warned.clear()
+            return
+        deadline = deadline.timestamp()
+        # A later deadline (time extended) or a different one starts the warnings over
+        if kind != self.kind or self.deadline is None or deadline > self.deadline + DEADLINE_SLACK:
+            self.warned.clear()
+            self.grace_until = None
+        self.deadline, self.kind = deadline, kind
+
+        if deadline - now < LOCK_GRACE and not self.warned:
+            # Over or nearly over with no warning yet (e.g. unlocked after the
+            # limit, or a limit just lowered): say so, lock shortly after
+            if self.grace_until is None:
+                self.grace_until = now + LOCK_GRACE
+            if 0 not in self.warned:
+                self._push(now, "warn", 0)
+            self._push(self.grace_until, "lock")
+            return
+        for minutes in self.warnings:
+            at = deadline - minutes * 60
+            if at >= now - 1 and minutes not in self.warned:
+                self._push(at, "warn", minutes)
+        self._push(deadline, "lock")
+
+    def _fire(self, kind, minutes, now):
+        """Run one due event, unless the deadline has moved away since it was armed"""
+        deadline, reason_kind = self.control.next_deadline()
+        limit = minutes * 60 if kind == "warn" else 0
+        if self.grace_until is not None and kind == "lock":
+            limit = LOCK_GRACE
+        if deadline is None or deadline.timestamp() > now + limit + DEADLINE_SLACK:
+            self.dirty = True
+            return
+        what = "bedtime" if reason_kind == "schedule" else "daily time limit"
+        if kind == "warn":
+            self.warned.add(minutes)
+            if minutes:
+                plural = "s" if minutes != 1 else ""
+                self.control.show_message(f"Computer will lock in {minutes} minute{plural} ({what}).", "Warning")
+            else:
+                self.control.show_message(f"Time's up ({what})! Computer will lock in 1 minute.", "Warning")
+            return
+
+        if reason_kind == "schedule":
+            reason = "Scheduled lock time reached"
+            self.control.scheduled_lock_done()
+        else:
+            reason = f"Usage limit of {self.control.usage_limit} minutes reached"
+        print(f"Locking PC: {reason}")
+        self.control.stats.record("limit_hits", detail=reason)
+        self.control.lock_pc("limit")
+        self.warned.clear()
+        self.grace_until = None
+        self.dirty = True
+
+    def run(self):
+        """Event loop (blocks; run it in its own thread)"""
+        with self.cond:
+            self.running = True
+            while self.running:
+                profiler.wakeup("enforce")
+                now = time.time()
+                if self.dirty:
+                    self._arm()
+                if self.events and self.events[0][0] <= now:
+                    _, _, kind, minutes = heapq.heappop(self.events)
+                    try:
+                        self._fire(kind, minutes, now)
+                    except Exception as e:
+                        logging.error(f"Enforcement event failed: {e}")
+                    continue
+                timeout = ENFORCE_MAX_SLEEP * (LOW_POWER_FACTOR if profiler.low_power else 1)
+                if self.events:
+                    timeout = min(timeout, self.events[0][0] - now)
+                else:
+                    # Nothing armed: look again now and then (midnight, clock changes)
+                    self.dirty = True
+                self.cond.wait(timeout)
+
+MONITOR_INTERVAL = 3       # seconds between lock state checks
+
+class PCTimeControl:
+    def __init__(self, backend=None, stats_path=STATS_FILE, warnings=WARNING_MINUTES, id_path=AGENT_ID_FILE):
+        self.backend = backend or select_backend()
+        self.agent_id = load_agent_id(id_path)
+        self.stats = UsageStats(stats_path)
+        self.schedule = LockSchedule()
+        self._next_lock = None
+        self._next_lock_version = None
+        self.postponed = None       # (scheduled lock, when it happens instead) after EXTEND_TIME
+        self.usage_limit = None
+        self.extra_time = (date.today(), 0)  # (day, minutes added by EXTEND_TIME that day)
+        self.start_time = datetime.now()
+        self.is_locked = False
+        self._lock_check = threading.Lock()
+        self._lock_checked = False
+        self._lock_checked_at = float("-inf")
+        self.enforcer = EnforcementEngine(self, warnings)
+        self.last_activity = datetime.now()
+        self.monitor_interval = MONITOR_INTERVAL
+
+        # Start monitoring thread
+        self.monitor_thread = threading.Thread(target=self.monitor_activity, daemon=True)
+        self.monitor_thread.start()
+
+        # Per-application usage
+        self.app_usage = AppUsageTracker(self)
+        self.app_usage_thread = threading.Thread(target=self.app_usage.run, daemon=True)
+        self.app_usage_thread.start()
+
+        # Blocked programs
+        self.process_watch = ProcessWatcher(self)
+        self.process_watch_thread = threading.Thread(target=self.process_watch.run, daemon=True)
+        self.process_watch_thread.start()
+
+        # Screen thumbnails, captured only while the panel is watching
+        self.thumbnails = ThumbnailStream(self)
+
+    def _check_if_locked(self):
+        return self.is_locked
+
+    def check_if_locked(self, max_age=0):
+        """
+        Returns True if the screen is actually locked right now.
+
+        With max_age, a check made up to that many seconds ago is reused, and
+        callers arriving while a check runs wait for it instead of starting
+        their own (on Windows each check spawns tasklist).
+        """
+        with self._lock_check:
+            if max_age and time.monotonic() - self._lock_checked_at <= max_age:
+                return self._lock_checked
+            with traced("os.is_locked"):
+                locked = self.backend.is_locked()
+            self._lock_checked, self._lock_checked_at = locked, time.monotonic()
+            return locked
+
+    def update_lock_state(self, locked, how):
+        """Note the lock state; records a lock/unlock event when it changed"""
+        if locked == self.is_locked:
+            return False
+        self.is_locked = locked
+        self.stats.record("locks" if locked else "unlocks", detail=how)
+        # Usage time only runs while unlocked, so the usage deadline moves
+        self.enforcer.rearm()
+        return True
+
+    def monitor_activity(self):
+        """Monitor lock/unlock status and count active (unlocked) time"""
+        last_tick = time.monotonic()
+        while True:
+            profiler.wakeup("monitor")
+            interval = self.monitor_interval
+            actual_locked = self.check_if_locked()
+            now = time.monotonic()
+            # A long gap means sleep/hibernate, not usage
+            elapsed = min(now - last_tick, 2 * interval * (LOW_POWER_FACTOR if profiler.low_power else 1))
+            last_tick = now
+
+            if not actual_locked and not self.is_locked:
+                self.stats.record("active", elapsed)
+
+            # Detect unlock
+            if self.is_locked and not actual_locked:
+                self.update_lock_state(False, "detected")
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] PC has been unlocked (detected by activity)")
+
+            # Detect manual lock (not by our script)
+            elif not self.is_locked and actual_locked:
+                self.update_lock_state(True, "detected")
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] PC has been locked (detected)")
+
+            self.stats.save_if_due()
+            tick_sleep(interval)
+
+    def is_workstation_locked(self):
+        """Check if the workstation is currently locked"""
+        return self.backend.is_workstation_locked()
+
+    def add_scheduled_lock(self, hour, minute, days=ALL_DAYS):
+        """Add a time when the PC should be locked"""
+        added = self.schedule.add(hour, minute, days)
+        self.schedule_changed()
+        return added
+
+    def schedule_changed(self):
+        """Call after changing self.schedule so enforcement picks it up"""
+        self.enforcer.rearm()
+
+    def next_scheduled_lock(self):
+        """Next scheduled lock time, recomputed only when the schedule changes"""
+        now = datetime.now()
+        # A lock missed by a long way (PC was off or asleep) is skipped, unless it was postponed
+        missed = (self._next_lock and now - self._next_lock > timedelta(seconds=LATE_LOCK_LIMIT)
+                  and not (self.postponed and self.postponed[0] == self._next_lock))
+        if self._next_lock_version != self.schedule.version or missed:
+            self._next_lock = self.schedule.next_deadline(now)
+            self._next_lock_version = self.schedule.version
+        return self._next_lock
+
+    def scheduled_lock_done(self):
+        """The scheduled lock has fired: move on to the next one"""
+        now = datetime.now()
+        self.schedule.prune(now.date())
+        self._next_lock = self.schedule.next_deadline(now)
+        self._next_lock_version = self.schedule.version
+        self.postponed = None
+
+    def usage_seconds_today(self):
+        """Seconds the PC has been unlocked today"""
+        return self.stats.today("active")
+
+    def next_deadline(self):
+        """(when, "schedule" or "usage") of the next lock, or (None, None)"""
+        now = datetime.now()
+        candidates = []
+        scheduled = self.next_scheduled_lock()
+        if scheduled:
+            if self.postponed and self.postponed[0] == scheduled:
+                scheduled = self.postponed[1]
+            candidates.append((scheduled, "schedule"))
+        # Usage only runs out while someone is using the PC
+        if self.usage_limit and not self.is_locked:
+            left = (self.usage_limit + self.extra_minutes()) * 60 - self.usage_seconds_today()
+            candidates.append((now + timedelta(seconds=max(0, left)), "usage"))
+        return min(candidates, default=(None, None))
+
+    def set_usage_limit(self, minutes):
+        """Set maximum usage time in minutes"""
+        self.usage_limit = minutes
+        self.enforcer.rearm()
+
+    def extra_minutes(self):
+        """Minutes EXTEND_TIME has added to today's limit"""
+        day, minutes = self.extra_time
+        return minutes if day == date.today() else 0
+
+    def extend_time(self, minutes):
+        """Push the next lock back; False if there is no limit or lock to extend"""
+        extended = False
+        deadline, kind = self.next_deadline()
+        if kind == "schedule":
+            later = max(deadline, datetime.now()) + timedelta(minutes=minutes)
+            self.postponed = (self.next_scheduled_lock(), later)
+            extended = True
         if self.usage_limit:
-            usage_minutes = (current_time - self.start_time).seconds / 60
-            if usage_minutes >= self.usage_limit:
-                return True, f"Usage limit of {self.usage_limit} minutes reached"
+            # Kept apart from the limit itself, which is the panel's setting
+            self.extra_time = (date.today(), self.extra_minutes() + minutes)
+            extended = True
+        self.enforcer.rearm()
+        return extended
 
-        return False, ""
+    def config(self):
+        """Settings the panel manages, in canonical form (see config_hash)"""
+        today = date.today()
+        with self.app_usage._lock:
+            app_limits = dict(self.app_usage.limits)
+        config = {
+            "usage_limit": self.usage_limit or 0,
+            "lock_times": {f"{h:02d}:{m:02d}": format_days(days) for h, m, days in self.schedule.rules()},
+            "overrides": {day.isoformat(): [f"{h:02d}:{m:02d}" for h, m in times]
+                          for day, times in self.schedule.overrides() if day >= today},
+            "app_limits": app_limits,
+        }
+        blocklist = self.process_watch.blocklist.to_config()
+        if blocklist:
+            # Only when set, so hashes from before blocking existed still match
+            config["blocklist"] = blocklist
+        return config
+
+    def apply_config(self, changes):
+        """
+        Apply the sections present in `changes`:
+
+            usage_limit  minutes, 0 for none
+            lock_times   {"HH:MM": "DAYS"}, replaces all recurring locks
+            overrides    {"YYYY-MM-DD": ["HH:MM", ...] or null to clear}
+            app_limits   {"program.exe": minutes, 0 to remove}
+            blocklist    {"pattern": ["HH:MM-HH:MM@DAYS", ...], [] for always}, replaces all
+
+        Everything is validated before anything changes. Raises ValueError.
+        """
+        if not isinstance(changes, dict) or set(changes) - {"usage_limit", "lock_times", "overrides",
+                                                            "app_limits", "blocklist"}:
+            raise ValueError("unknown section")
+        limit = changes.get("usage_limit")
+        if limit is not None and not is_minutes(limit):
+            raise ValueError("usage_limit must be minutes")
+        lock_times = config_section(changes, "lock_times", lambda days: isinstance(days, str))
+        overrides = config_section(changes, "overrides", lambda times: times is None or is_string_list(times))
+        app_limits = config_section(changes, "app_limits", is_minutes)
+        if any(not name.strip() for name in app_limits):
+            raise ValueError("app_limits needs program names")
+        blocklist = config_section(changes, "blocklist", is_string_list)
+
+        rules = None
+        if "lock_times" in changes:
+            rules = [parse_lock_time(f"{at}@{days}") for at, days in lock_times.items()]
+        overrides = [(date.fromisoformat(day), None if times is None else [parse_lock_time(t)[:2] for t in times])
+                     for day, times in overrides.items()]
+        if "blocklist" in changes:
+            blocklist = {pattern: [parse_window(w) for w in windows] for pattern, windows in blocklist.items()}
+        else:
+            blocklist = None
+
+        if limit is not None:
+            self.set_usage_limit(limit or None)
+        if rules is not None:
+            self.schedule.replace(rules)
+        for day, times in overrides:
+            if times is None:
+                self.schedule.clear_override(day)
+            else:
+                self.schedule.set_override(day, times)
+        for name, minutes in app_limits.items():
+            self.app_usage.set_limit(name, minutes)
+        if blocklist is not None:
+            self.process_watch.blocklist.replace(blocklist)
+        self.schedule_changed()
+
+    def show_message(self, message, title="PC Time Control"):
+        """Display a popup message without blocking"""
+        with traced("os.popup"):
+            self.backend.show_popup(title, message)
+
+    def lock_pc(self, how="remote"):
+        """Lock the PC"""
+        self.update_lock_state(True, how)
+        with traced("os.lock"):
+            self.backend.lock()
+        # A status check cached from before the lock is stale now
+        with self._lock_check:
+            self._lock_checked_at = float("-inf")
+
+    def shutdown_pc(self, seconds=60):
+        """Shutdown PC with warning"""
+        with traced("os.shutdown"):
+            self.backend.shutdown(seconds)
+
+    def cancel_shutdown(self):
+        """Cancel pending shutdown"""
+        with traced("os.cancel_shutdown"):
+            self.backend.cancel_shutdown()
 
     def run_monitor(self):
-        """Main monitoring loop"""
+        """Enforce limits and scheduled locks until stopped (blocks, see EnforcementEngine)"""
         print("PC Time Control is running...")
-        while True:
-            should_lock, reason = self.check_time_limits()
-            if should_lock:
-                print(f"Locking PC: {reason}")
-                # Give 1 minute warning
-                self.show_message("Computer will lock in 1 minute!", "Warning")
-                time.sleep(60)
-                self.lock_pc()
-                break
-            time.sleep(1)
+        self.enforcer.run()
 
 # Simple Remote Control Server
 class RemoteControlServer:
-    def __init__(self, port=9999, timeout=60):
+    def __init__(self, port=9999, timeout=CLIENT_TIMEOUT, host='0.0.0.0', key=None,
+                 rate=RATE_LIMIT, burst=RATE_BURST, max_connections=MAX_CONNECTIONS,
+                 max_workers=MAX_WORKERS):
         """
         Initialize the remote control server.
         
         Args:
             port (int): Port number to listen on (default: 9999)
             timeout (int): Socket timeout in seconds (default: 60)
+            host (str): Address to listen on (default: all interfaces)
+            key (bytes): Shared key; when set only signed frames are accepted
+            rate (float): Commands per second per client address, 0 for no limit
+            burst (int): Commands a client address may send at once
+            max_connections (int): Open connections in total
+            max_workers (int): Commands executing at once
         """
+        self.host = host
         self.port = port
+        self.key = key
+        self.seen_nonces = OrderedDict()  # nonce -> arrival time, for replay protection
+        self.nonce_lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self.max_connections = max_connections
+        self.max_in_flight = max_workers + MAX_WAITING
+        self.buckets = {}                 # client address -> TokenBucket
+        self.connections = Counter()      # client address -> open connections
+        self.in_flight = 0                # commands running or waiting for a worker
+        self.workers = threading.Semaphore(max_workers)
+        self.limits_lock = threading.Lock()
+        self.rejected = Counter()         # limit -> BUSY replies sent
+        self.recent_results = OrderedDict()  # request id -> (last used, command, reply), oldest first
+        self.running_ids = {}             # request id -> Event set when its first attempt finishes
+        self.results_lock = threading.Lock()
         self.timeout = timeout
         self.pc_control = None
         self.running = False
+        self.ready = threading.Event()  # set once listening (or failed to start)
         self.server_socket = None
         self.clients = {}
         self.client_id_counter = 0
+        self.config = None                # AgentConfig, for RELOAD
+        self.updates = None               # AgentUpdate, for the UPDATE_* commands
         self.logger = logging.getLogger('RemoteControlServer')
 
     def start_server(self, pc_control):
         """Start the remote control server."""
         self.pc_control = pc_control
         self.running = True
+        listener = None
         
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.settimeout(5)  # Allow periodic checks for self.running
-            self.server_socket.bind(('0.0.0.0', self.port))
-            self.server_socket.listen(5)
+            self.server_socket = self.listen(self.host, self.port)
+            self.ready.set()
             
             self.logger.info(f"Server started on port {self.port}")
             
             while self.running:
+                profiler.wakeup("server")
+                if listener is not self.server_socket:
+                    # rebind() moved us: the old port is closed once its accept has returned
+                    if listener:
+                        listener.close()
+                    listener = self.server_socket
+                    if listener is None:
+                        break
+                listener.settimeout(
+                    ACCEPT_TIMEOUT_LOW_POWER if profiler.low_power else ACCEPT_TIMEOUT)
                 try:
-                    client_socket, client_address = self.server_socket.accept()
+                    client_socket, client_address = listener.accept()
+                    if not self.open_connection(client_address[0]):
+                        self.reject(client_socket)
+                        continue
                     client_socket.settimeout(self.timeout)
                     
                     client_id = self.client_id_counter
@@ -232,6 +1928,8 @@ class RemoteControlServer:
                 except socket.timeout:
                     continue  # Normal timeout for checking self.running
                 except Exception as e:
+                    if self.running and listener is not self.server_socket:
+                        continue
                     self.logger.error(f"Accept error: {e}")
                     break
                 
@@ -239,22 +1937,194 @@ class RemoteControlServer:
             self.logger.error(f"Server error: {e}")
         finally:
             self.stop_server()
+            if listener:
+                listener.close()
+            self.ready.set()
             self.logger.info("Server stopped")
 
+    @staticmethod
+    def listen(host, port):
+        """A listening socket on host:port"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.settimeout(ACCEPT_TIMEOUT)  # Allow periodic checks for self.running
+            sock.bind((host, port))
+            sock.listen(5)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def rebind(self, host, port):
+        """
+        Listen on a new address. Open connections are not touched, and the
+        old address keeps accepting until the accept loop moves over (at most
+        one accept timeout). Raises OSError, keeping the old address, if the
+        new one can't be bound.
+        """
+        sock = self.listen(host, port)
+        self.server_socket, self.host, self.port = sock, host, port
+        self.logger.info(f"Server moved to {host}:{port}")
+
+    def set_timeout(self, timeout):
+        """Idle timeout for new and already open connections"""
+        self.timeout = timeout
+        for client in list(self.clients.values()):
+            try:
+                client['socket'].settimeout(timeout)
+            except OSError:
+                pass  # closed meanwhile
+
+    def set_rate(self, rate, burst):
+        """New per-client rate limit, applied to the clients' current buckets too"""
+        with self.limits_lock:
+            self.rate, self.burst = rate, burst
+            for bucket in self.buckets.values():
+                bucket.rate, bucket.burst = rate, burst
+                bucket.tokens = min(bucket.tokens, burst)
+
+    def open_connection(self, client_ip):
+        """Count a new connection, or return False if it would exceed a limit"""
+        with self.limits_lock:
+            if (sum(self.connections.values()) >= self.max_connections
+                    or self.connections[client_ip] >= MAX_CONNECTIONS_PER_IP):
+                self.rejected["connections"] += 1
+                return False
+            self.connections[client_ip] += 1
+            return True
+
+    def close_connection(self, client_ip):
+        """Forget a connection counted by open_connection"""
+        with self.limits_lock:
+            self.connections[client_ip] -= 1
+            if self.connections[client_ip] <= 0:
+                del self.connections[client_ip]
+
+    def reject(self, client_socket):
+        """Answer BUSY to a connection over the limit without giving it a thread"""
+        try:
+            # Only what has already arrived; the accept loop must not wait on it
+            client_socket.settimeout(0.01)
+            first = client_socket.recv(1024)
+            if first.startswith(b"{"):
+                try:
+                    nonce = json.loads(first.split(b"\n", 1)[0]).get("nonce")
+                except (ValueError, AttributeError):
+                    nonce = None
+                client_socket.sendall(json.dumps({"ok": False, "error": "BUSY", "nonce": nonce}).encode() + b"\n")
+            elif first:
+                client_socket.sendall(b"BUSY")
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def admit(self, client_ip):
+        """Take a token from the client's bucket; False means it is over its rate"""
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        with self.limits_lock:
+            bucket = self.buckets.get(client_ip)
+            if bucket is None:
+                if len(self.buckets) >= MAX_BUCKETS:
+                    # A full bucket is the same as a new one, so it can be forgotten
+                    for ip, old in list(self.buckets.items()):
+                        old.refill(now)
+                        if old.tokens >= old.burst:
+                            del self.buckets[ip]
+                bucket = self.buckets[client_ip] = TokenBucket(self.rate, self.burst)
+            if bucket.take(now):
+                return True
+            self.rejected["rate"] += 1
+            return False
+
+    def execute(self, command):
+        """Run a command in a worker slot; None if the agent is too busy to take it"""
+        with self.limits_lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected["queue"] += 1
+                return None
+            self.in_flight += 1
+        try:
+            with traced("queue"):
+                acquired = self.workers.acquire(timeout=WORKER_WAIT)
+            if not acquired:
+                with self.limits_lock:
+                    self.rejected["wait"] += 1
+                return None
+            try:
+                with traced("dispatch"):
+                    return self.process_command(command)
+            finally:
+                self.workers.release()
+        finally:
+            with self.limits_lock:
+                self.in_flight -= 1
+
+    def run_once(self, request_id, command, run):
+        """
+        Call run() at most once per request id and return its reply.
+
+        A repeat gets the remembered reply; one arriving while the first
+        attempt is still running waits for it. A BUSY (None) result is not
+        remembered, so the client's retry gets to run the command.
+        """
+        while True:
+            with self.results_lock:
+                now = time.monotonic()
+                while self.recent_results:
+                    last_used = next(iter(self.recent_results.values()))[0]
+                    if now - last_used <= IDEMPOTENCY_TTL and len(self.recent_results) <= IDEMPOTENCY_KEYS:
+                        break
+                    self.recent_results.popitem(last=False)
+                done = self.recent_results.get(request_id)
+                if done:
+                    if done[1] != command:
+                        return "Request id already used for a different command"
+                    self.recent_results[request_id] = (now, done[1], done[2])
+                    self.recent_results.move_to_end(request_id)
+                    return done[2]
+                running = self.running_ids.get(request_id)
+                if running is None:
+                    running = self.running_ids[request_id] = threading.Event()
+                    break
+            # Same request is running on another connection
+            if not running.wait(2 * WORKER_WAIT):
+                return None
+
+        response = None
+        try:
+            response = run()
+        finally:
+            with self.results_lock:
+                del self.running_ids[request_id]
+                if response is not None:
+                    self.recent_results[request_id] = (time.monotonic(), command, response)
+            running.set()
+        return response
+
     def handle_client(self, client_socket, client_address, client_id):
         """Handle communication with a connected client."""
         try:
             while self.running:
                 try:
-                    data = client_socket.recv(1024).decode().strip()
+                    raw = client_socket.recv(1024)
+                    profiler.wakeup("client")
+                    if raw.startswith(b"{"):
+                        self.serve_frames(client_socket, raw, client_address, client_id)
+                        break
+                    data = raw.decode().strip()
                     if not data:
                         break  # Client disconnected
+                    if self.key:
+                        client_socket.sendall(b"AUTH_REQUIRED")
+                        break
                         
                     self.logger.info(f"Received from {client_address} (ID: {client_id}): {data}")
-                    response = self.process_command(data)
-                    
-                    if response is not None:
-                        client_socket.sendall(response.encode())
+                    response = self.execute(data) if self.admit(client_address[0]) else None
+                    client_socket.sendall(b"BUSY" if response is None else response.encode())
                         
                 except socket.timeout:
                     # Send keepalive
@@ -265,11 +2135,106 @@ class RemoteControlServer:
                     break
                     
         finally:
+            profiler.thread_done()
             client_socket.close()
+            self.close_connection(client_address[0])
             if client_id in self.clients:
                 del self.clients[client_id]
             self.logger.info(f"Client {client_address} (ID: {client_id}) disconnected")
 
+    def serve_frames(self, client_socket, buffer, client_address, client_id):
+        """Framed mode: one JSON request per line, one JSON reply per line, in order."""
+        # The address the client connected to, which signed frames must name
+        local_address = "%s:%d" % client_socket.getsockname()[:2]
+        while self.running:
+            while b"\n" not in buffer:
+                if len(buffer) > MAX_FRAME:
+                    client_socket.sendall(b'{"ok": false, "error": "FRAME_TOO_LARGE"}\n')
+                    return
+                try:
+                    chunk = client_socket.recv(65536)
+                except socket.timeout:
+                    return  # idle pooled connection, the client will reconnect
+                if not chunk:
+                    return
+                buffer += chunk
+            line, buffer = buffer.split(b"\n", 1)
+            profiler.wakeup("client")
+            reply = self.handle_frame(line, client_address, client_id, local_address)
+            client_socket.sendall(json.dumps(reply).encode() + b"\n")
+
+    def check_frame_auth(self, frame, local_address):
+        """Returns None if a frame is correctly signed, fresh and meant for this PC, else the error code"""
+        mac = frame.get("mac")
+        if not isinstance(mac, str) or not hmac.compare_digest(mac, frame_mac(self.key, frame)):
+            return "AUTH_FAILED"
+        ts, nonce = frame.get("ts"), frame.get("nonce")
+        now = time.time()
+        if not isinstance(ts, int) or abs(now - ts / 1000) > AUTH_WINDOW:
+            return "AUTH_EXPIRED"
+        if frame.get("to") != local_address:
+            return "AUTH_WRONG_PC"
+        with self.nonce_lock:
+            if nonce in self.seen_nonces:
+                return "AUTH_REPLAYED"
+            self.seen_nonces[nonce] = now
+            # Nonces only need remembering while their timestamp is acceptable
+            while self.seen_nonces:
+                oldest = next(iter(self.seen_nonces.values()))
+                if now - oldest <= 2 * AUTH_WINDOW and len(self.seen_nonces) <= MAX_NONCES:
+                    break
+                self.seen_nonces.popitem(last=False)
+        return None
+
+    def handle_frame(self, line, client_address, client_id, local_address):
+        """Check and run one framed request, returning the reply frame"""
+        try:
+            frame = json.loads(line)
+            command = frame["cmd"]
+            request_id = frame.get("id")
+            trace_id = frame.get("trace")
+            if not isinstance(command, str) or not valid_request_id(request_id):
+                raise ValueError
+            if trace_id is not None and not (isinstance(trace_id, str) and 0 < len(trace_id) <= MAX_TRACE_ID):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "BAD_FRAME"}
+        if trace_id is None:
+            reply = self.run_frame(frame, command, request_id, client_address, client_id, local_address)
+        else:
+            trace = current_trace.trace = RequestTrace(trace_id)
+            try:
+                reply = self.run_frame(frame, command, request_id, client_address, client_id, local_address)
+            finally:
+                current_trace.trace = None
+            if reply["ok"]:
+                reply["spans"] = trace.spans
+        if reply["ok"] and self.key:
+            reply["mac"] = frame_mac(self.key, reply)
+        return reply
+
+    def run_frame(self, frame, command, request_id, client_address, client_id, local_address):
+        """Admit, authenticate and run a parsed frame; returns the unsigned reply"""
+        nonce = frame.get("nonce")
+        # Before the signature check, so a flood costs as little as possible
+        if not self.admit(client_address[0]):
+            return {"ok": False, "error": "BUSY", "nonce": nonce}
+        if self.key:
+            with traced("auth"):
+                error = self.check_frame_auth(frame, local_address)
+            if error:
+                self.logger.warning(f"Rejected frame from {client_address} (ID: {client_id}): {error}")
+                return {"ok": False, "error": error, "nonce": nonce}
+
+        self.logger.info(f"Received from {client_address} (ID: {client_id}): {command[:200]}")
+        if request_id is None:
+            response = self.execute(command)
+        else:
+            response = self.run_once(request_id, command, lambda: self.execute(command))
+        if response is None:
+            return {"ok": False, "error": "BUSY", "nonce": nonce}
+        return {"ok": True, "resp": response, "nonce": nonce}
+
     def process_command(self, command):
         """Process incoming commands and return responses."""
         try:
@@ -285,10 +2250,12 @@ class RemoteControlServer:
                 import platform
                 return platform.node()
                 
+            elif command == "GET_ID":
+                return self.pc_control.agent_id
+
             elif command == "GET_STATUS":
-                actual_locked = self.pc_control.check_if_locked()
-                if actual_locked != self.pc_control.is_locked:
-                    self.pc_control.is_locked = actual_locked
+                actual_locked = self.pc_control.check_if_locked(STATUS_MAX_AGE)
+                if self.pc_control.update_lock_state(actual_locked, "detected"):
                     self.logger.info(f"Status changed to: {'LOCKED' if actual_locked else 'UNLOCKED'}")
                 return "LOCKED" if actual_locked else "UNLOCKED"
                 
@@ -307,34 +2274,252 @@ class RemoteControlServer:
                     
             elif command.startswith("ADD_LOCK_TIME:"):
                 try:
-                    time_str = command.split(":", 1)[1]
-                    hour, minute = map(int, time_str.split(":"))
-                    self.pc_control.add_scheduled_lock(hour, minute)
-                    return f"Lock time added: {hour:02d}:{minute:02d}"
+                    hour, minute, days = parse_lock_time(command.split(":", 1)[1])
+                except ValueError:
+                    return "Invalid time format (use HH:MM or HH:MM@MON-FRI)"
+                try:
+                    if not self.pc_control.add_scheduled_lock(hour, minute, days):
+                        return f"Lock time already set: {hour:02d}:{minute:02d} {format_days(days)}"
+                except ValueError as e:
+                    return str(e)
+                return f"Lock time added: {hour:02d}:{minute:02d} {format_days(days)}"
+
+            elif command.startswith("REMOVE_LOCK_TIME:"):
+                try:
+                    hour, minute, days = parse_lock_time(command.split(":", 1)[1])
+                except ValueError:
+                    return "Invalid time format (use HH:MM or HH:MM@MON-FRI)"
+                if self.pc_control.schedule.remove(hour, minute, days):
+                    self.pc_control.schedule_changed()
+                    return f"Lock time removed: {hour:02d}:{minute:02d} {format_days(days)}"
+                return f"No lock time at {hour:02d}:{minute:02d} {format_days(days)}"
+
+            elif command.startswith("REPLACE_LOCK_TIMES:"):
+                specs = [p for p in command.split(":", 1)[1].split(";") if p.strip()]
+                try:
+                    rules = [parse_lock_time(spec) for spec in specs]
+                    self.pc_control.schedule.replace(rules)
+                    self.pc_control.schedule_changed()
+                except ValueError as e:
+                    return f"Invalid lock times: {e} (use HH:MM@DAYS;HH:MM@DAYS)"
+                return f"Lock times replaced ({len(self.pc_control.schedule)} set)"
+
+            elif command.startswith("LOCK_OVERRIDE:"):
+                # LOCK_OVERRIDE:YYYY-MM-DD:HH:MM[,HH:MM] | :NONE | :CLEAR
+                try:
+                    day_str, _, times = command.split(":", 1)[1].partition(":")
+                    day = date.fromisoformat(day_str)
+                    times = times.strip().upper()
+                    if times == "CLEAR":
+                        self.pc_control.schedule.clear_override(day)
+                        self.pc_control.schedule_changed()
+                        return f"Override cleared for {day}"
+                    parsed = [] if times == "NONE" else [
+                        parse_lock_time(t)[:2] for t in times.split(",")]
+                    self.pc_control.schedule.set_override(day, parsed)
+                    self.pc_control.schedule_changed()
                 except ValueError:
-                    return "Invalid time format (use HH:MM)"
+                    return "Invalid override (use YYYY-MM-DD:HH:MM[,HH:MM], :NONE or :CLEAR)"
+                if not parsed:
+                    return f"No scheduled lock on {day}"
+                return f"Override set for {day}: " + ", ".join(f"{h:02d}:{m:02d}" for h, m in parsed)
+
+            elif command == "LIST_LOCK_TIMES":
+                schedule = self.pc_control.schedule
+                lines = [f"{h:02d}:{m:02d} {format_days(days)}" for h, m, days in schedule.rules()]
+                lines += [f"{day}: " + (", ".join(f"{h:02d}:{m:02d}" for h, m in times) or "NONE")
+                          for day, times in schedule.overrides()]
+                next_lock = self.pc_control.next_scheduled_lock()
+                if next_lock:
+                    lines.append(f"Next lock: {next_lock:%Y-%m-%d %H:%M}")
+                return "\n".join(lines) if lines else "No lock times set"
                     
             elif command.startswith("EXTEND_TIME:"):
                 try:
                     minutes = int(command.split(":", 1)[1])
-                    if self.pc_control.usage_limit:
-                        self.pc_control.usage_limit += minutes
+                    if self.pc_control.extend_time(minutes):
                         return f"Extended time by {minutes} minutes"
                     return "No time limit set to extend"
                 except ValueError:
                     return "Invalid time value"
                     
+            elif command.startswith("BATCH:"):
+                # Several commands in one round trip, replies in the same order.
+                # An entry is a command, or {"cmd": ..., "id": ...} to run it once per id.
+                try:
+                    commands = json.loads(command.split(":", 1)[1])
+                    if not isinstance(commands, list):
+                        raise ValueError
+                except ValueError:
+                    return "Invalid batch (use a JSON list of commands)"
+                replies = []
+                for entry in commands:
+                    cmd, request_id = entry, None
+                    if isinstance(entry, dict):
+                        cmd, request_id = entry.get("cmd"), entry.get("id")
+                    if not isinstance(cmd, str) or cmd.startswith("BATCH:") or not valid_request_id(request_id):
+                        replies.append("Invalid batch entry")
+                    elif request_id is None:
+                        replies.append(self.process_command(cmd))
+                    else:
+                        reply = self.run_once(request_id, cmd, lambda: self.process_command(cmd))
+                        replies.append("BUSY" if reply is None else reply)
+                return json.dumps(replies)
+                    
+            elif command == "GET_CONFIG_HASH":
+                return config_hash(self.pc_control.config())
+
+            elif command == "GET_CONFIG":
+                return json.dumps(self.pc_control.config(), sort_keys=True)
+
+            elif command.startswith("APPLY_CONFIG:"):
+                try:
+                    self.pc_control.apply_config(json.loads(command.split(":", 1)[1]))
+                except (ValueError, TypeError) as e:
+                    return f"Invalid config: {e}"
+                return config_hash(self.pc_control.config())
+
+            elif command == "GET_USAGE":
+                return json.dumps(self.pc_control.app_usage.report())
+
+            elif command.startswith("SET_APP_LIMIT:"):
+                try:
+                    name, minutes = command.split(":", 1)[1].rsplit(":", 1)
+                    minutes = int(minutes)
+                    if not name.strip() or minutes < 0:
+                        raise ValueError
+                except ValueError:
+                    return "Invalid app limit (use SET_APP_LIMIT:<program.exe>:<minutes>)"
+                self.pc_control.app_usage.set_limit(name, minutes)
+                if minutes:
+                    return f"Limit for {name.strip().lower()} set to {minutes} minutes a day"
+                return f"Limit for {name.strip().lower()} removed"
+
+            elif command.startswith("BLOCK_APP:"):
+                # BLOCK_APP:<pattern>[@HH:MM-HH:MM[@DAYS]]
+                pattern, _, window = command.split(":", 1)[1].partition("@")
+                try:
+                    window = parse_window(window) if window else None
+                    added = self.pc_control.process_watch.blocklist.add(pattern, window)
+                except ValueError:
+                    return "Invalid block (use BLOCK_APP:<program.exe or pattern>[@HH:MM-HH:MM[@DAYS]])"
+                when = format_window(window) if window else "always"
+                if not added:
+                    return f"Already blocked: {pattern.strip().lower()} {when}"
+                return f"Blocked {pattern.strip().lower()} {when}"
+
+            elif command.startswith("UNBLOCK_APP:"):
+                pattern = command.split(":", 1)[1].strip().lower()
+                if self.pc_control.process_watch.blocklist.remove(pattern):
+                    return f"Unblocked {pattern}"
+                return f"{pattern} was not blocked"
+
+            elif command == "LIST_BLOCKED":
+                watch = self.pc_control.process_watch
+                return json.dumps({"rules": watch.blocklist.to_config(),
+                                   "active": sorted(watch.blocklist.active(datetime.now())),
+                                   "closed_today": dict(watch.blocked)})
+
+            elif command == "THUMBNAIL" or command.startswith("THUMBNAIL:"):
+                # THUMBNAIL[:<seq the viewer has>] - tiles changed since then
+                since = command.partition(":")[2].strip()
+                if since and not since.isdigit():
+                    return "Invalid frame number"
+                return json.dumps(self.pc_control.thumbnails.request(int(since) if since else None),
+                                  separators=(",", ":"))
+
+            elif command == "UPDATE_STATUS" or command.startswith(("UPDATE_BEGIN:", "UPDATE_CHUNK:",
+                                                                   "UPDATE_COMMIT:")):
+                return self.handle_update(command)
+
+            elif command == "RELOAD":
+                if self.config is None:
+                    return "No config file in use"
+                try:
+                    changed, problems = self.config.reload()
+                except ValueError as e:
+                    return f"Invalid config: {e}"
+                reply = f"Reloaded: {', '.join(changed)}" if changed else "Nothing changed"
+                return "; ".join([reply] + problems)
+
+            elif command.startswith("GET_STATS"):
+                # GET_STATS[:MINUTE|HOUR|DAY|EVENTS[:<count>]], default the last 7 days
+                res, _, count = command.partition(":")[2].partition(":")
+                res = (res or "DAY").lower()
+                try:
+                    count = int(count) if count else (50 if res == "events" else 7)
+                except ValueError:
+                    return "Invalid count"
+                if res == "events":
+                    return json.dumps(self.pc_control.stats.recent_events(count))
+                if res not in STATS_ROLLUPS:
+                    return "Invalid stats resolution (use MINUTE, HOUR, DAY or EVENTS)"
+                return json.dumps(self.pc_control.stats.report(res, count))
+
+            elif command == "PROFILE":
+                report = profiler.report()
+                with self.limits_lock:
+                    report["connections"] = sum(self.connections.values())
+                    report["busy_replies"] = dict(self.rejected)
+                return json.dumps(report)
+
+            elif command.startswith("PROFILE:"):
+                mode = command.split(":", 1)[1].upper()
+                if mode == "ON":
+                    profiler.reset()
+                    profiler.enabled = True
+                elif mode == "OFF":
+                    profiler.enabled = False
+                elif mode == "RESET":
+                    profiler.reset()
+                else:
+                    return "Invalid profile mode (use ON, OFF or RESET)"
+                return f"Profiling {mode.lower()}"
+
+            elif command.startswith("POWER:"):
+                mode = command.split(":", 1)[1].upper()
+                if mode not in ("LOW", "NORMAL"):
+                    return "Invalid power mode (use LOW or NORMAL)"
+                profiler.low_power = (mode == "LOW")
+                self.logger.info(f"Power mode set to {mode}")
+                return f"Power mode: {mode}"
+
             elif command == "HELP":
                 return (
                     "Available commands:\n"
                     "LOCK - Lock the PC\n"
                     "SHUTDOWN - Shutdown the PC\n"
                     "GET_NAME - Get PC name\n"
+                    "GET_ID - Get this PC's agent ID (stays the same if its IP changes)\n"
                     "GET_STATUS - Check if PC is locked\n"
                     "MESSAGE:<text> - Show popup message\n"
                     "SET_LIMIT:<minutes> - Set usage limit\n"
-                    "ADD_LOCK_TIME:HH:MM - Add scheduled lock\n"
-                    "EXTEND_TIME:<minutes> - Extend usage time"
+                    "ADD_LOCK_TIME:HH:MM[@DAYS] - Add scheduled lock (DAYS: MON-FRI, SAT,SUN, WEEKDAYS...)\n"
+                    "REMOVE_LOCK_TIME:HH:MM[@DAYS] - Remove scheduled lock\n"
+                    "REPLACE_LOCK_TIMES:HH:MM@DAYS;... - Replace all scheduled locks\n"
+                    "LOCK_OVERRIDE:YYYY-MM-DD:HH:MM[,HH:MM]|NONE|CLEAR - Different locks for one date\n"
+                    "LIST_LOCK_TIMES - Show scheduled locks and the next one\n"
+                    "EXTEND_TIME:<minutes> - Extend usage time\n"
+                    "BATCH:[\"CMD\" or {\"cmd\": ..., \"id\": ...}, ...] - Run several commands, JSON list of replies\n"
+                    "GET_USAGE - Minutes per app today and app limits (JSON)\n"
+                    "SET_APP_LIMIT:<program.exe>:<minutes> - Daily limit for one app (0 removes)\n"
+                    "BLOCK_APP:<pattern>[@HH:MM-HH:MM[@DAYS]] - Close a program (wildcards ok) always or in a window\n"
+                    "UNBLOCK_APP:<pattern> - Stop blocking a program\n"
+                    "LIST_BLOCKED - Block rules, which are active now and programs closed today (JSON)\n"
+                    "THUMBNAIL[:<seq>] - Small picture of the screen: tiles changed since frame <seq> (JSON)\n"
+                    "GET_CONFIG_HASH - Short hash of the settings the panel manages\n"
+                    "GET_CONFIG - Limits, lock times, overrides, app limits and blocked apps (JSON)\n"
+                    "APPLY_CONFIG:<json> - Change any of those sections, returns the new hash\n"
+                    "GET_STATS[:DAY|HOUR|MINUTE[:<count>]] - Active seconds, locks, unlocks, limit hits (JSON)\n"
+                    "GET_STATS:EVENTS[:<count>] - Recent lock/unlock/limit events (JSON)\n"
+                    "PROFILE - Wakeups, CPU, subprocesses and memory (JSON)\n"
+                    "PROFILE:ON|OFF|RESET - Control profiling\n"
+                    "POWER:LOW|NORMAL - Poll less often and coalesce timers to save battery\n"
+                    "RELOAD - Apply agent_config.json now (it is also picked up when saved)\n"
+                    "UPDATE_STATUS - Running build and any new build being received (JSON)\n"
+                    "UPDATE_BEGIN:<size>:<sha256> - Start or resume receiving a new pc_control.py (JSON)\n"
+                    "UPDATE_CHUNK:<offset>:<base64> - Next part of the new build, returns the next offset (JSON)\n"
+                    "UPDATE_COMMIT:<sha256> - Check the new build, swap it in and restart"
                 )
                 
             else:
@@ -344,6 +2529,31 @@ class RemoteControlServer:
             self.logger.error(f"Command processing error: {e}")
             return f"Error processing command: {e}"
 
+    def handle_update(self, command):
+        """The UPDATE_* commands (see AgentUpdate)"""
+        if self.updates is None:
+            return "Updates are not enabled"
+        if not self.key:
+            # Without signed commands anyone on the network could replace the agent
+            return "Updates need a shared key (pc_control.py --make-key)"
+        name, _, args = command.partition(":")
+        try:
+            if name == "UPDATE_STATUS":
+                return json.dumps(self.updates.status())
+            if name == "UPDATE_BEGIN":
+                size, _, sha256 = args.partition(":")
+                return json.dumps(self.updates.begin(int(size), sha256.strip().lower()))
+            if name == "UPDATE_CHUNK":
+                offset, _, data = args.partition(":")
+                offset = self.updates.chunk(int(offset), base64.b64decode(data, validate=True))
+                return json.dumps({"offset": offset})
+            self.updates.commit(args.strip().lower())
+        except ValueError as e:
+            return f"Update failed: {e}"
+        if self.updates.restart(self):
+            return "Update installed, restarting"
+        return "Update installed, restart required"
+
     def stop_server(self):
         """Stop the server and clean up resources."""
         self.running = False
@@ -368,37 +2578,447 @@ class RemoteControlServer:
         """Destructor to ensure proper cleanup."""
         self.stop_server()
 
+# Settings that can be changed without restarting the agent. agent_config.json
+# next to the script holds any of AGENT_SETTINGS; saving it (or RELOAD) applies
+# the changes to the running agent. Command-line flags override the file.
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_config.json")
+CONFIG_WATCH_INTERVAL = 5  # seconds between checks of the config file's timestamp
+AGENT_SETTINGS = {
+    "host": "0.0.0.0",
+    "port": 9999,
+    "client_timeout": CLIENT_TIMEOUT,
+    "monitor_interval": MONITOR_INTERVAL,
+    "app_sample_interval": APP_SAMPLE_INTERVAL,
+    "process_watch_interval": PROCESS_WATCH_INTERVAL,
+    "rate_limit": RATE_LIMIT,
+    "rate_burst": RATE_BURST,
+    "max_connections": MAX_CONNECTIONS,
+    "warnings": list(WARNING_MINUTES),
+    "log_file": log_file,
+    "log_level": "INFO",
+}
+
+def check_settings(settings):
+    """Raise ValueError unless every setting is known and sensible"""
+    unknown = set(settings) - set(AGENT_SETTINGS)
+    if unknown:
+        raise ValueError(f"unknown setting {sorted(unknown)[0]}")
+
+    def number(name, minimum, integer=False):
+        value = settings[name]
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)) or value < minimum:
+            raise ValueError(f"{name} must be {'a whole number' if integer else 'a number'} of at least {minimum}")
+
+    for name in ("client_timeout", "monitor_interval", "app_sample_interval", "process_watch_interval"):
+        number(name, 0.1)
+    number("port", 1, integer=True)
+    number("rate_limit", 0)
+    number("rate_burst", 1)
+    number("max_connections", 1, integer=True)
+    if settings["port"] > 65535:
+        raise ValueError("port must be at most 65535")
+    if not isinstance(settings["host"], str) or not settings["host"]:
+        raise ValueError("host must be an address")
+    warnings = settings["warnings"]
+    if not isinstance(warnings, list) or any(isinstance(w, bool) or not isinstance(w, int) or w < 1
+                                             for w in warnings):
+        raise ValueError("warnings must be a list of minutes")
+    if not isinstance(settings["log_file"], str) or not settings["log_file"]:
+        raise ValueError("log_file must be a path")
+    if settings["log_level"] not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+        raise ValueError("log_level must be DEBUG, INFO, WARNING or ERROR")
+
+class AgentConfig:
+    """
+    The agent's settings: defaults, then agent_config.json, then command-line
+    flags. reload() reads the file again and applies only what changed, in
+    place - running threads pick up new intervals on their next tick, open
+    connections stay open, timers keep running.
+    """
+    def __init__(self, path=CONFIG_FILE, overrides=None):
+        self.path = path
+        self.overrides = dict(overrides or {})
+        self.settings = None        # what is applied now
+        self.control = None
+        self.server = None
+        self.stamp = None           # (mtime, size) of the file when last read
+        self._lock = threading.Lock()
+
+    def read(self):
+        """Settings from the file, checked; raises ValueError"""
+        settings = dict(AGENT_SETTINGS)
+        try:
+            with open(self.path) as f:
+                self.stamp = self.file_stamp()
+                data = json.load(f)
+        except FileNotFoundError:
+            self.stamp = None
+            data = {}
+        if not isinstance(data, dict):
+            raise ValueError("the file must hold a JSON object")
+        settings.update(data)
+        settings.update(self.overrides)
+        check_settings(settings)
+        return settings
+
+    def load(self):
+        """
+        Settings for startup: a broken file is skipped, never fatal. Returns
+        (settings, problem or None). The caller logs the problem: the log
+        file is one of the settings, so logging isn't set up yet.
+        """
+        try:
+            self.settings = self.read()
+        except ValueError as e:
+            self.settings = {**AGENT_SETTINGS, **self.overrides}
+            return self.settings, f"Ignoring {self.path}: {e}"
+        return self.settings, None
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def attach(self, control, server):
+        """Apply the loaded settings to the running agent and start watching the file"""
+        self.control, self.server = control, server
+        server.config = self
+        self.apply(self.settings, set(AGENT_SETTINGS) - {"host", "port", "log_file", "log_level"})
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def reload(self):
+        """
+        Read the file and apply what changed. Returns (changed setting names,
+        problems); raises ValueError, changing nothing, if the file is invalid.
+        """
+        with self._lock:
+            settings = self.read()
+            changed = [name for name in AGENT_SETTINGS if settings[name] != self.settings[name]]
+            problems = self.apply(settings, changed)
+            if any(name in changed for name in ("host", "port")) and problems:
+                # Still on the old address
+                settings["host"], settings["port"] = self.settings["host"], self.settings["port"]
+                changed = [name for name in changed if name not in ("host", "port")]
+            self.settings = settings
+        if changed:
+            logging.info(f"Settings reloaded: {', '.join(changed)}")
+        return changed, problems
+
+    def apply(self, settings, changed):
+        """Push settings into the running objects; returns problems that kept one from applying"""
+        control, server, problems = self.control, self.server, []
+        if "monitor_interval" in changed:
+            control.monitor_interval = settings["monitor_interval"]
+        if "app_sample_interval" in changed:
+            control.app_usage.interval = settings["app_sample_interval"]
+        if "process_watch_interval" in changed:
+            control.process_watch.interval = settings["process_watch_interval"]
+        if "warnings" in changed:
+            control.enforcer.warnings = sorted(set(settings["warnings"]), reverse=True)
+            control.enforcer.rearm()
+        if "client_timeout" in changed:
+            server.set_timeout(settings["client_timeout"])
+        if "rate_limit" in changed or "rate_burst" in changed:
+            server.set_rate(settings["rate_limit"], settings["rate_burst"])
+        if "max_connections" in changed:
+            server.max_connections = settings["max_connections"]
+        if "log_file" in changed or "log_level" in changed:
+            switch_logging(settings["log_file"], settings["log_level"])
+        if "host" in changed or "port" in changed:
+            try:
+                server.rebind(settings["host"], settings["port"])
+            except OSError as e:
+                logging.error(f"Could not listen on {settings['host']}:{settings['port']}: {e}")
+                problems.append(f"still on port {server.port} ({e})")
+        return problems
+
+    def watch(self):
+        """Reload whenever the file is saved (runs in its own daemon thread)"""
+        while True:
+            tick_sleep(CONFIG_WATCH_INTERVAL)
+            profiler.wakeup("config")
+            if self.file_stamp() == self.stamp:
+                continue
+            try:
+                self.reload()
+            except ValueError as e:
+                self.stamp = self.file_stamp()  # don't log the same broken file every tick
+                logging.error(f"Ignoring {self.path}: {e}")
+
+# Self-update over the control channel. The panel sends a new pc_control.py
+# in chunks (UPDATE_BEGIN, UPDATE_CHUNK, UPDATE_COMMIT). It is staged next to
+# this script, so a transfer cut off part way resumes where it stopped, even
+# across agent restarts; then it is checked against its SHA-256, compiled,
+# renamed over the script in one step, and the agent restarts through its
+# scheduled task. Needs a shared key: otherwise anyone on the network could
+# replace the agent.
+AGENT_SCRIPT = os.path.abspath(__file__)
+UPDATE_TASK = "KidPCMonitor"         # the scheduled task scripts/install.py creates
+UPDATE_CHUNK = 64 * 1024             # bytes per UPDATE_CHUNK (base64 keeps it well under MAX_FRAME)
+UPDATE_MAX_SIZE = 8 * 1024 * 1024
+UPDATE_RESTART_DELAY = 1             # seconds from the COMMIT reply to stopping
+UPDATE_CONFIRM_TIMEOUT = 120         # seconds the new build has to start before it is rolled back
+
+# Runs detached (python -c) while the agent exits after an update, see
+# WindowsBackend.restart_agent. Arguments: agent pid, task name, script,
+# confirm timeout, then the agent's own command line.
+RESTART_HELPER = r"""
+import ctypes, json, os, subprocess, sys, time
+pid, task, script, timeout = int(sys.argv[1]), sys.argv[2], sys.argv[3], float(sys.argv[4])
+command = sys.argv[5:]
+kernel32 = ctypes.windll.kernel32
+
+def start():
+    # Through the task, so it runs as installed; by hand if it was started by hand
+    if subprocess.run(["schtasks", "/run", "/tn", task], capture_output=True).returncode == 0:
+        return None
+    return subprocess.Popen(command, creationflags=0x00000008, cwd=os.path.dirname(script))
+
+def stop(started):
+    if started is None:
+        subprocess.run(["schtasks", "/end", "/tn", task], capture_output=True)
+    else:
+        started.kill()
+
+handle = kernel32.OpenProcess(0x00100000, False, pid)  # SYNCHRONIZE
+if handle:
+    kernel32.WaitForSingleObject(handle, 30000)
+    kernel32.CloseHandle(handle)
+started = start()
+deadline = time.monotonic() + timeout
+while os.path.exists(script + ".updated") and time.monotonic() < deadline:
+    time.sleep(1)
+if os.path.exists(script + ".updated"):
+    # The new build never said it was listening: go back to the previous one
+    stop(started)
+    os.replace(script + ".bak", script)
+    os.remove(script + ".updated")
+    start()
+"""
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class AgentUpdate:
+    """
+    A new build of the agent script arriving over the control channel.
+
+    Chunks are appended to <script>.new and the expected size and checksum
+    kept in <script>.new.json, so the offset to resume from is simply how
+    much is staged. commit() keeps the running build as <script>.bak and
+    renames the new one over the script; the new agent removes
+    <script>.updated once it is listening, and until then the restart
+    helper may put the old build back.
+    """
+    def __init__(self, script=AGENT_SCRIPT):
+        self.script = script
+        self.staging = script + ".new"
+        self.meta_path = script + ".new.json"
+        self.backup = script + ".bak"
+        self.marker = script + ".updated"
+        self.build = file_sha256(script)    # the running build
+        self.installed = None               # a build installed since, waiting for a restart
+        self.size = self.sha256 = None      # the build being received
+        self.offset = 0
+        self._lock = threading.Lock()
+        self.resume()
+
+    def resume(self):
+        """Pick up a transfer staged before the agent restarted"""
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            size, sha256 = int(meta["size"]), str(meta["sha256"])
+            offset = os.path.getsize(self.staging)
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        if offset <= size:
+            self.size, self.sha256, self.offset = size, sha256, offset
+
+    def confirm(self):
+        """Call once the agent is listening: tells the restart helper the update worked"""
+        try:
+            with open(self.marker) as f:
+                installed = json.load(f).get("sha256")
+        except (OSError, ValueError, AttributeError):
+            return
+        os.remove(self.marker)
+        if installed == self.build:
+            logging.info(f"Running updated build {self.build[:12]}")
+        else:
+            logging.warning(f"Update to build {str(installed)[:12]} was not installed, still on {self.build[:12]}")
+
+    def status(self):
+        with self._lock:
+            return {"build": self.build, "installed": self.installed, "sha256": self.sha256,
+                    "size": self.size, "offset": self.offset, "chunk": UPDATE_CHUNK}
+
+    def reset(self):
+        """Forget the build being received (caller holds the lock)"""
+        for path in (self.staging, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.size = self.sha256 = None
+        self.offset = 0
+
+    def begin(self, size, sha256):
+        """Start receiving a build, or carry on with the same one; returns status()"""
+        if not 0 < size <= UPDATE_MAX_SIZE:
+            raise ValueError(f"size must be 1 to {UPDATE_MAX_SIZE} bytes")
+        if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+            raise ValueError("checksum must be a hex SHA-256")
+        with self._lock:
+            if (size, sha256) != (self.size, self.sha256):
+                self.reset()
+                open(self.staging, "wb").close()
+                tmp = self.meta_path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"size": size, "sha256": sha256}, f)
+                os.replace(tmp, self.meta_path)
+                self.size, self.sha256 = size, sha256
+        return self.status()
+
+    def chunk(self, offset, data):
+        """
+        Append data if it starts where the staged bytes end; a chunk for any
+        other offset (a resend, or one after a lost chunk) is ignored.
+        Returns the offset to send from next.
+        """
+        with self._lock:
+            if self.sha256 is None:
+                raise ValueError("no update started (send UPDATE_BEGIN first)")
+            if offset == self.offset and data:
+                if offset + len(data) > self.size:
+                    raise ValueError("chunk runs past the end of the update")
+                with open(self.staging, "ab") as f:
+                    f.write(data)
+                self.offset += len(data)
+            return self.offset
+
+    def commit(self, sha256):
+        """Check the staged build and swap it in; raises ValueError if it is not right"""
+        with self._lock:
+            if self.sha256 is None or sha256 != self.sha256:
+                raise ValueError("that build is not the one being received")
+            if self.offset != self.size:
+                raise ValueError(f"only {self.offset} of {self.size} bytes received")
+            if file_sha256(self.staging) != sha256:
+                self.reset()
+                raise ValueError("checksum mismatch, send the build again")
+            with open(self.staging, "rb") as f:
+                source = f.read()
+            try:
+                compile(source, self.script, "exec")
+            except SyntaxError as e:
+                self.reset()
+                raise ValueError(f"the new build does not compile: {e}")
+            shutil.copy2(self.script, self.backup)
+            tmp = self.marker + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"sha256": sha256, "previous": self.build}, f)
+            os.replace(tmp, self.marker)
+            os.replace(self.staging, self.script)
+            os.remove(self.meta_path)
+            self.installed = sha256
+            self.size = self.sha256 = None
+            self.offset = 0
+        logging.info(f"Installed build {sha256[:12]} (previous build kept as {self.backup})")
+
+    def restart(self, server):
+        """
+        Hand over to the installed build: True if the agent stops shortly (once
+        the COMMIT reply is out) and is started again, False if this backend
+        can't restart it. Until it is restarted the old build keeps running,
+        and status() says so.
+        """
+        if not server.pc_control.backend.restart_agent(self.script):
+            logging.warning(f"Build {self.installed[:12]} is installed and runs once the agent is restarted")
+            return False
+        logging.info("Restarting into the new build")
+        threading.Timer(UPDATE_RESTART_DELAY, server.stop_server).start()
+        return True
+
 # Main
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Kid PC Monitor agent")
+    parser.add_argument("--config", default=CONFIG_FILE,
+                        help="settings file, reloaded when saved (default: agent_config.json next to this script)")
+    parser.add_argument("--port", type=int, help="port to listen on (default: 9999)")
+    parser.add_argument("--host", help="address to listen on (default: all)")
+    parser.add_argument("--backend", help="platform backend: windows or null (default: by platform)")
+    parser.add_argument("--key-file", default=KEY_FILE, help="shared key file (default: agent.key next to this script)")
+    parser.add_argument("--make-key", action="store_true", help="write a new random key to the key file and exit")
+    parser.add_argument("--rate-limit", type=float,
+                        help=f"commands per second per client address, 0 for no limit (default: {RATE_LIMIT})")
+    parser.add_argument("--warnings", help="minutes before a lock to warn, comma separated (default: 10,5,1)")
+    parser.add_argument("--id-file", default=AGENT_ID_FILE, help="agent ID file (default: agent_id next to this script)")
+    parser.add_argument("--stats-file", default=STATS_FILE, help="usage history file (default: usage_stats.json next to this script)")
+    args = parser.parse_args()
+
+    if args.make_key:
+        with open(args.key_file, "w") as f:
+            f.write(secrets.token_hex(32))
+        print(f"New key written to {args.key_file} - copy it next to web_panel.py and to every PC")
+        sys.exit(0)
+
+    # Flags given on the command line win over the config file
+    overrides = {"host": args.host, "port": args.port, "rate_limit": args.rate_limit}
+    if args.warnings is not None:
+        try:
+            overrides["warnings"] = [int(w) for w in args.warnings.split(",") if w.strip()]
+        except ValueError:
+            parser.error("--warnings takes minutes like 10,5,1")
+    config = AgentConfig(args.config, {k: v for k, v in overrides.items() if v is not None})
+    try:
+        check_settings({**AGENT_SETTINGS, **config.overrides})
+    except ValueError as e:
+        parser.error(str(e))
+    settings, problem = config.load()
+    setup_logging(settings["log_file"], settings["log_level"])
+    if problem:
+        logging.error(problem)
+
     # Create control instance
-    control = PCTimeControl()
+    control = PCTimeControl(select_backend(args.backend), args.stats_file, settings["warnings"], args.id_file)
     
     # Add network connectivity check
     def check_port_availability(port):
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('0.0.0.0', port))
+                s.bind((settings["host"], port))
             return True
         except socket.error:
             return False
     
-    if not check_port_availability(9999):
+    if not check_port_availability(settings["port"]):
         control.show_message(
-            f"Port 9999 is already in use or blocked!\n"
+            f"Port {settings['port']} is already in use or blocked!\n"
             f"Check your firewall or other running applications.",
             "Network Error"
         )
         sys.exit(1)
     
     # Start remote control server
-    remote = RemoteControlServer()
+    remote = RemoteControlServer(port=settings["port"], host=settings["host"], key=load_key(args.key_file),
+                                 timeout=settings["client_timeout"], rate=settings["rate_limit"],
+                                 burst=settings["rate_burst"], max_connections=settings["max_connections"])
     server_thread = threading.Thread(target=remote.start_server, args=(control,))
     server_thread.daemon = True
     server_thread.start()
     
-    # Verify server started
-    time.sleep(1)  # Give server time to start
-    if not remote.running:
+    # Verify server started: wait for it to signal instead of guessing a delay
+    if not remote.ready.wait(5) or not remote.running:
         control.show_message(
             "Failed to start network server!\n"
             "Check firewall settings and try again.",
@@ -406,15 +3026,31 @@ if __name__ == "__main__":
         )
         sys.exit(1)
     
+    # Intervals from the config file, and reload it when it is saved
+    config.attach(control, remote)
+
+    # New builds sent over the network (UPDATE_* commands); listening now, so
+    # a build that just restarted tells the restart helper it is fine
+    remote.updates = AgentUpdate()
+    remote.updates.confirm()
+    
+    # Enforce usage limits and scheduled locks
+    enforcer_thread = threading.Thread(target=control.run_monitor, daemon=True)
+    enforcer_thread.start()
+    
     print("Server is running. Press Ctrl+C to stop.")
     
     try:
-        # Keep main thread alive while server runs
+        # Keep main thread alive while server runs (it stops to restart after an update)
         while remote.running:
             time.sleep(1)
+        control.enforcer.stop()
+        control.stats.save()
     except KeyboardInterrupt:
         print("\nShutting down server...")
         remote.stop_server()
+        control.enforcer.stop()
+        control.stats.save()
         server_thread.join(2)  # Wait up to 2 seconds for thread to finish
         print("Server stopped.")
     except Exception as e:
@@ -1,20 +1,168 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for
 import socket
+import errno
 import threading
 import ipaddress
 import time
-from datetime import datetime
+import json
+import os
+import queue
+import hashlib
+import secrets
+import random
+import sqlite3
+import base64
+import struct
+import zlib
+from array import array
+from collections import deque
+from contextlib import closing
+from datetime import datetime, date
+
+from agent_client import (AgentClient, AgentError, AgentBusy, Trace, load_key, trace_span,
+                          ROLLOUT_CONCURRENCY)
+# The agent's own parsers, so a policy edit reads days and times exactly as the PC will
+from pc_control import format_days, format_window, parse_days, parse_lock_time, parse_window
 
 app = Flask(__name__)
 
-# Store discovered PCs
-discovered_pcs = {}
+# Discovered PCs live in a PCRegistry (discovered_pcs, below)
 last_scan_time = None
 
-# Custom PC names (optional) - Add your kids' PC names here
+# Every change to discovered_pcs bumps state_version so API clients can ask
+# for only what changed since their last poll (see /api/pcs)
+state_version = 0
+state_changed = threading.Condition()
+removed_pcs = {}  # ip -> state_version at which the PC disappeared
+
+# Longest time /api/pcs will hold a long-poll request open
+MAX_LONG_POLL = 30
+
+# discovered_pcs has a single writer thread. Everything else posts changes to
+# state_updates; the writer merges whatever has piled up and applies it under
+# one lock, so a burst of probes costs one version bump per PC, not one each.
+state_updates = queue.Queue()
+state_writer = None
+state_writer_lock = threading.Lock()
+
+# Concurrent status checks of the same PC share one probe (see probe_status)
+status_probes = {}        # ip -> StatusProbe in flight
+status_probes_lock = threading.Lock()
+
+# Per-host health tracking (see HostHealth). Timeouts adapt to each PC's
+# measured latency, and PCs that keep failing are skipped until a background
+# re-probe finds them again.
+MIN_TIMEOUT = 0.5         # seconds, floor for adaptive timeouts
+# Commands the agent does real work for (writing config files, running a
+# batch, replacing itself) get a higher floor, so one that usually answers
+# fast is not given up on when it occasionally takes longer
+SLOW_COMMAND_TIMEOUTS = {'APPLY_CONFIG': 2, 'BATCH': 2, 'UPDATE_COMMIT': 2}
+FAILURES_TO_OPEN = 3      # consecutive failures before a PC is marked offline
+REPROBE_MIN = 5           # seconds until the first background re-probe
+REPROBE_MAX = 120         # re-probe backoff cap
+host_health = {}
+host_health_lock = threading.Lock()
+health_prober = None
+
+# Shared key for signing commands (same agent.key as on the PCs, see
+# pc_control.py --make-key). Without one, commands are sent unsigned.
+KEY_FILE = 'agent.key'
+
+# An agent over its rate or concurrency limits answers BUSY without running
+# the command, so it is safe to try again after a short pause
+BUSY_RETRIES = 2
+BUSY_RETRY_DELAY = 0.25   # seconds, doubled for each retry
+
+# Settings commands for PCs that are asleep or off are kept here (and on disk)
+# and delivered in one BATCH round trip as soon as the PC is seen again
+QUEUE_FILE = 'command_queue.json'
+QUEUEABLE_COMMANDS = ('SET_LIMIT:', 'ADD_LOCK_TIME:', 'REMOVE_LOCK_TIME:', 'EXTEND_TIME:',
+                      'SET_APP_LIMIT:')
+# Commands that leave the PC the same however often they run. Others
+# (EXTEND_TIME) are only queued when they surely never reached the PC: the
+# agent forgets request ids after 10 minutes, and a PC can be away longer.
+REPEATABLE_COMMANDS = ('SET_LIMIT:', 'ADD_LOCK_TIME:', 'REMOVE_LOCK_TIME:', 'SET_APP_LIMIT:')
+MAX_BATCH_BYTES = 60000   # keep each BATCH frame well under the agent's MAX_FRAME
+command_queue = {}        # ip -> list of {'id', 'command', 'queued_at'}
+command_queue_lock = threading.Lock()
+flushing_hosts = set()
+
+# Desired settings per PC (policies.json). The panel is the source of truth:
+# a background reconciler compares each PC's GET_CONFIG_HASH with the
+# policy's hash and, only when they differ, fetches the PC's config and
+# sends just the sections that changed with APPLY_CONFIG. A PC with no
+# policy yet has its current settings adopted as version 1.
+POLICIES_FILE = 'policies.json'
+RECONCILE_INTERVAL = 60   # seconds between hash checks of every PC
+CONFIG_HASH_LENGTH = 16   # must match pc_control.py
+policies = {}             # ip -> {'version', 'config', 'hash', 'synced_version', 'synced_at'}
+policies_lock = threading.Lock()
+reconcile_wakeup = threading.Event()
+reconciler = None
+
+# Per-PC daily history for the report pages, filled from each agent's
+# GET_STATS and refreshed in the background when a report is opened
+HISTORY_FILE = 'usage_history.json'
+HISTORY_COLUMNS = ('active', 'locks', 'unlocks', 'limit_hits')
+HISTORY_DAYS = 732        # days asked for the first time a PC is seen (all the agent keeps)
+HISTORY_REFRESH = 300     # seconds before an opened report asks the PCs for new days
+history = {}              # ip -> DailyHistory
+history_lock = threading.Lock()
+history_refreshed = 0     # time.monotonic() of the last refresh
+history_refreshing = False
+
+# Every /action goes into an append-only SQLite log with its result and
+# latency. Requests only put a row on audit_queue; one writer thread inserts
+# whatever has piled up in a single transaction, along with per-PC daily
+# totals (action_days) so failure rates don't scan the raw rows.
+AUDIT_DB = 'audit.db'
+AUDIT_BATCH = 500         # most rows per insert transaction
+AUDIT_PAGE = 50           # default /api/audit page size
+AUDIT_MAX_PAGE = 500
+AUDIT_MAX_RESPONSE = 500  # characters of each reply kept
+AUDIT_COLUMNS = ('ts', 'pc', 'hostname', 'action', 'detail', 'success', 'queued',
+                 'response', 'latency_ms', 'client', 'request_id')
+audit_queue = queue.Queue()
+audit_writer = None
+audit_writer_lock = threading.Lock()
+
+# Request tracing. /action gives each request a trace id that goes to the
+# agent in the frame's "trace" field; the panel times its own steps and the
+# agent answers with its spans. Every /action reply carries its breakdown;
+# /api/traces keeps every slow request and a sample of the rest.
+TRACE_KEEP = 200          # traces kept in each buffer
+TRACE_SLOW_MS = 500       # requests at least this slow are always kept
+TRACE_SAMPLE = 0.1        # share of the faster ones kept
+slow_traces = deque(maxlen=TRACE_KEEP)
+sampled_traces = deque(maxlen=TRACE_KEEP)
+traces_lock = threading.Lock()
+
+# Agent updates. The panel's own copy of pc_control.py (next to this file) is
+# sent to the PCs a few at a time; /api/update starts a rollout and reports
+# each PC's progress. Only one rollout runs at a time.
+AGENT_BUILD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pc_control.py')
+MAX_ROLLOUT_CONCURRENCY = 16
+rollout = None            # the latest rollout, see start_rollout
+rollout_lock = threading.Lock()
+
+# Screen thumbnails for the control page. The panel keeps the last frame
+# of each PC it has been asked for and patches in the tiles the agent says
+# changed (THUMBNAIL:<seq>), then hands browsers a PNG.
+THUMBNAIL_REUSE = 0.25    # seconds a fetched frame is served to other viewers as is
+thumbnails = {}           # ip -> Thumbnail
+thumbnails_lock = threading.Lock()
+
+# Custom PC names (optional) - Add your kids' PC names here, keyed by the
+# PC's agent ID (GET_ID), its computer name or its IP address
 CUSTOM_PC_NAMES = {
     # Example: '192.168.1.105': 'Tommy\'s Laptop',
-    # Example: '192.168.1.112': 'Sarah\'s Desktop',
+    # Example: 'SARAH-DESKTOP': 'Sarah\'s Desktop',
+}
+
+# Groups for the dashboard filter and group actions (optional), keyed the same way
+PC_GROUPS = {
+    # Example: 'SARAH-DESKTOP': 'Upstairs',
+    # Example: '3f9a1c0d5e7b2a64': 'Upstairs',
 }
 
 def get_local_ip():
@@ -32,24 +180,828 @@ def check_pc_status(ip, port=9999):
     """Check if a PC is locked"""
     try:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Checking status of {ip}")
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(2)
-        s.connect((ip, port))
-        s.send(b"GET_STATUS")
-        status = s.recv(1024).decode().strip()
-        s.close()
+        status = exchange(ip, "GET_STATUS", port, max_timeout=2)
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Status of {ip}: {status}")
         return status
     except Exception as e:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Error checking {ip}: {e}")
         return "UNKNOWN"
 
-def scan_for_servers(port=9999):
-    """Scan the local network for PCs running the control server"""
-    global discovered_pcs, last_scan_time
-    local_ip = get_local_ip()
-    network = ipaddress.ip_network(f"{local_ip}/24", strict=False)
-    discovered_pcs = {}
+def pc_setting(table, agent_id, name, ip):
+    """A PC's entry in CUSTOM_PC_NAMES or PC_GROUPS, looked up by agent ID, name, then IP"""
+    for key in (agent_id, name, ip):
+        if key and key in table:
+            return table[key]
+    return None
+
+class PCRecord:
+    """One PC the panel knows about. agent_id stays the same when DHCP moves it to a new IP."""
+    __slots__ = ('agent_id', 'ip', 'hostname', 'group', 'status', 'locked', 'last_seen', 'version')
+
+    def __init__(self, agent_id, ip, hostname, group=None, status='online', locked=False, last_seen=None):
+        self.agent_id = agent_id
+        self.ip = ip
+        self.hostname = hostname
+        self.group = group
+        self.status = status
+        self.locked = locked
+        self.last_seen = last_seen
+        self.version = 0
+
+    @property
+    def state(self):
+        """'offline', 'locked' or 'unlocked'"""
+        if self.status == 'offline':
+            return 'offline'
+        return 'locked' if self.locked else 'unlocked'
+
+class PCRegistry:
+    """
+    Every known PC by agent ID, with indexes by IP, hostname, group and state.
+
+    The indexes are moved along with each field change, so finding a PC or
+    picking all of a group's unlocked PCs is a few dict/set lookups however
+    big the fleet. Read it like a dict keyed by IP (get, items, in); only the
+    state writer thread changes it (see update_pc_state).
+    """
+    INDEXED = ('hostname', 'group', 'state')
+
+    def __init__(self):
+        self.records = {}    # agent_id -> PCRecord
+        self.by_ip = {}      # ip -> PCRecord
+        self.indexes = {name: {} for name in self.INDEXED}   # index -> key -> {agent_id}
+
+    @staticmethod
+    def _keys(record):
+        return {'hostname': (record.hostname or '').lower(), 'group': record.group, 'state': record.state}
+
+    def _index(self, record, keys):
+        for name, key in keys.items():
+            self.indexes[name].setdefault(key, set()).add(record.agent_id)
+
+    def _unindex(self, record, keys):
+        for name, key in keys.items():
+            ids = self.indexes[name].get(key)
+            if ids is not None:
+                ids.discard(record.agent_id)
+                if not ids:
+                    del self.indexes[name][key]
+
+    def get(self, ip, default=None):
+        return self.by_ip.get(ip, default)
+
+    def __contains__(self, ip):
+        return ip in self.by_ip
+
+    def __iter__(self):
+        return iter(list(self.by_ip))
+
+    def __len__(self):
+        return len(self.by_ip)
+
+    def items(self):
+        return list(self.by_ip.items())
+
+    def add(self, record):
+        """Add a PC whose agent ID is new"""
+        self.records[record.agent_id] = record
+        self.by_ip[record.ip] = record
+        self._index(record, self._keys(record))
+
+    def remove(self, record):
+        self._unindex(record, self._keys(record))
+        del self.records[record.agent_id]
+        if self.by_ip.get(record.ip) is record:
+            del self.by_ip[record.ip]
+
+    def update(self, record, **fields):
+        """Change a PC's fields and re-index what moved; returns the fields that changed"""
+        changed = {k: v for k, v in fields.items() if getattr(record, k) != v}
+        if not changed:
+            return changed
+        old_keys = self._keys(record)
+        if 'ip' in changed and self.by_ip.get(record.ip) is record:
+            del self.by_ip[record.ip]
+        for name, value in changed.items():
+            setattr(record, name, value)
+        if 'ip' in changed:
+            self.by_ip[record.ip] = record
+        new_keys = self._keys(record)
+        moved = [name for name in self.INDEXED if old_keys[name] != new_keys[name]]
+        if moved:
+            self._unindex(record, {name: old_keys[name] for name in moved})
+            self._index(record, {name: new_keys[name] for name in moved})
+        return changed
+
+    def find(self, key):
+        """A PC by agent ID, IP or hostname (any case), or None"""
+        record = self.records.get(key) or self.by_ip.get(key)
+        if record is None:
+            ids = self.indexes['hostname'].get(str(key).lower())
+            if ids:
+                record = self.records[next(iter(ids))]
+        return record
+
+    def select(self, **criteria):
+        """PCs matching every given index key, e.g. select(group='Upstairs', state='unlocked')"""
+        ids = None
+        for name, key in criteria.items():
+            if key is None:
+                continue
+            if name == 'hostname':
+                key = key.lower()
+            matches = self.indexes[name].get(key, ())
+            ids = set(matches) if ids is None else ids.intersection(matches)
+        if ids is None:
+            return list(self.records.values())
+        return [self.records[agent_id] for agent_id in ids]
+
+    def counts(self, name):
+        """Number of PCs per key of one index, e.g. counts('state')"""
+        return {key: len(ids) for key, ids in self.indexes[name].items()}
+
+discovered_pcs = PCRegistry()
+
+def pc_name(ip, default=None):
+    """Dashboard name of a PC"""
+    record = discovered_pcs.get(ip)
+    return record.hostname if record else default
+
+def _bump_version():
+    """Advance the state version (caller must hold state_changed)"""
+    global state_version
+    state_version += 1
+    state_changed.notify_all()
+    return state_version
+
+def update_pc_state(ip, **fields):
+    """Apply field changes to a known PC, bumping the version if anything changed (writer thread only)"""
+    with state_changed:
+        pc = discovered_pcs.get(ip)
+        if pc is None:
+            return False
+        # last_seen moves on every probe, it alone is not worth a new version
+        if 'last_seen' in fields:
+            pc.last_seen = fields.pop('last_seen')
+        if not discovered_pcs.update(pc, **fields):
+            return False
+        pc.version = _bump_version()
+        return True
+
+def _replace_pcs(pcs):
+    """
+    Apply the result of a network scan (ip -> fields including agent_id),
+    versioning adds and removals (writer thread only). Returns the
+    (old ip, new ip) of PCs that moved.
+    """
+    moves = []
+    with state_changed:
+        old_ips = set(discovered_pcs.by_ip)
+        found = {}
+        for ip, info in pcs.items():
+            agent_id = info['agent_id']
+            if agent_id in found:
+                # Two PCs with one ID (a cloned disk): tell them apart by address
+                agent_id = f"{agent_id}@{ip}"
+            found[agent_id] = (ip, info)
+        for record in list(discovered_pcs.records.values()):
+            if record.agent_id not in found:
+                discovered_pcs.remove(record)
+        for agent_id, (ip, info) in found.items():
+            fields = {k: v for k, v in info.items() if k not in ('agent_id', 'locked', 'last_seen')}
+            record = discovered_pcs.records.get(agent_id)
+            if record is None:
+                record = PCRecord(agent_id, ip, last_seen=info.get('last_seen'), **fields)
+                discovered_pcs.add(record)
+            else:
+                # Keep what we already know about lock state until re-probed
+                record.last_seen = info.get('last_seen')
+                if record.ip != ip:
+                    moves.append((record.ip, ip))
+                if not discovered_pcs.update(record, ip=ip, **fields):
+                    continue
+            removed_pcs.pop(ip, None)
+            record.version = _bump_version()
+        for ip in old_ips - set(discovered_pcs.by_ip):
+            removed_pcs[ip] = _bump_version()
+    return moves
+
+def state_writer_loop():
+    """The only thread that changes discovered_pcs"""
+    while True:
+        batch = [state_updates.get()]
+        while True:
+            try:
+                batch.append(state_updates.get_nowait())
+            except queue.Empty:
+                break
+        merged = {}   # ip -> fields, later posts win
+        done = []
+        moves = []
+        with state_changed:
+            for kind, payload, event in batch:
+                if kind == 'update':
+                    ip, fields = payload
+                    merged.setdefault(ip, {}).update(fields)
+                elif kind == 'replace':
+                    # Apply what came before the scan result, then the scan itself
+                    for ip, fields in merged.items():
+                        update_pc_state(ip, **fields)
+                    merged = {}
+                    moves += _replace_pcs(payload)
+                if event:
+                    done.append(event)
+            for ip, fields in merged.items():
+                update_pc_state(ip, **fields)
+        if moves:
+            move_pc_state(moves)
+        for event in done:
+            event.set()
+
+def _post(kind, payload, wait):
+    """Hand a change to the writer thread, starting it on first use"""
+    global state_writer
+    if state_writer is None:
+        with state_writer_lock:
+            if state_writer is None:
+                state_writer = threading.Thread(target=state_writer_loop, daemon=True)
+                state_writer.start()
+    event = threading.Event() if wait else None
+    state_updates.put((kind, payload, event))
+    if event:
+        event.wait(5)
+
+def post_state(ip, **fields):
+    """Queue field changes for a known PC (applied by the writer thread)"""
+    _post('update', (ip, fields), wait=False)
+
+def replace_pcs(pcs):
+    """Swap in the result of a network scan, returning once it is applied"""
+    _post('replace', pcs, wait=True)
+
+def sync_state():
+    """Wait until everything posted so far has been applied"""
+    _post('sync', None, wait=True)
+
+class StatusProbe:
+    """One GET_STATUS in flight; callers for the same PC wait on it"""
+    __slots__ = ('done', 'status')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.status = "UNKNOWN"
+
+def probe_status(ip):
+    """Check a PC's lock status, sharing the probe with concurrent callers"""
+    with status_probes_lock:
+        probe = status_probes.get(ip)
+        leader = probe is None
+        if leader:
+            probe = status_probes[ip] = StatusProbe()
+    if not leader:
+        probe.done.wait()
+        return probe.status
+    try:
+        probe.status = check_pc_status(ip)
+        if probe.status in ("LOCKED", "UNLOCKED"):
+            post_state(ip, locked=(probe.status == "LOCKED"))
+    finally:
+        with status_probes_lock:
+            del status_probes[ip]
+        probe.done.set()
+    return probe.status
+
+def pc_to_json(ip, info):
+    """JSON-friendly copy of one PCRecord"""
+    return {
+        'ip': ip,
+        'agent_id': info.agent_id,
+        'hostname': info.hostname,
+        'group': info.group,
+        'status': info.status,
+        'locked': info.locked,
+        'last_seen': info.last_seen.isoformat() if info.last_seen else None,
+        'version': info.version,
+    }
+
+class HostUnavailable(ConnectionError):
+    """Raised instead of connecting when a PC's circuit breaker is open"""
+
+# Frames, signing and pooled connections to the agents (see agent_client.py)
+SHARED_KEY = load_key(KEY_FILE)
+agents = AgentClient(SHARED_KEY)
+
+def keep_trace(trace):
+    """Keep a finished trace: always if slow, otherwise now and then"""
+    slow = trace.total_ms >= TRACE_SLOW_MS
+    if slow:
+        worst = sorted(trace.spans, key=lambda span: -span[2])[:3]
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Slow {trace.action} on {trace.pc}: "
+              f"{trace.total_ms:.0f} ms ({', '.join(f'{name} {ms:.0f} ms' for name, _, ms in worst)})")
+    elif random.random() >= TRACE_SAMPLE:
+        return
+    with traces_lock:
+        (slow_traces if slow else sampled_traces).append(trace)
+
+def command_kind(command):
+    """The command's name without its arguments, which its latency is estimated by"""
+    return command.split(':', 1)[0]
+
+class HostHealth:
+    """
+    Latency estimates and circuit breaker for one PC.
+
+    The smoothed round trip time and its variance are kept the same way TCP
+    estimates its retransmission timeout, so a PC that answers quickly gets
+    a shorter timeout (never under MIN_TIMEOUT, or the command's entry in
+    SLOW_COMMAND_TIMEOUTS) while a slow one keeps the full allowance. The
+    round trip includes the agent's own work, which differs a lot between
+    commands (GET_NAME vs. a lock check or APPLY_CONFIG), so each command
+    name has its own estimate.
+    """
+    def __init__(self):
+        self.rtt = {}             # command name -> [smoothed round trip time, its variance] (seconds)
+        self.failures = 0         # consecutive failures
+        self.open_until = None    # monotonic time of next re-probe; None = closed
+        self.backoff = REPROBE_MIN
+        self.lock = threading.Lock()
+
+    def timeout(self, ceiling, kind):
+        """Timeout to use for the next `kind` command"""
+        with self.lock:
+            if kind not in self.rtt:
+                return ceiling
+            srtt, rttvar = self.rtt[kind]
+            floor = SLOW_COMMAND_TIMEOUTS.get(kind, MIN_TIMEOUT)
+            return min(max(srtt + 4 * rttvar, floor), ceiling)
+
+    def is_open(self):
+        """True while the PC is considered offline"""
+        return self.open_until is not None
+
+    def record_success(self, rtt=None, kind=None):
+        """Feed a successful round trip of a `kind` command; returns True if the circuit was open"""
+        with self.lock:
+            if rtt is not None and kind:
+                estimate = self.rtt.get(kind)
+                if estimate is None:
+                    self.rtt[kind] = [rtt, rtt / 2]
+                else:
+                    srtt, rttvar = estimate
+                    estimate[1] = 0.75 * rttvar + 0.25 * abs(srtt - rtt)
+                    estimate[0] = 0.875 * srtt + 0.125 * rtt
+            was_open = self.open_until is not None
+            self.failures = 0
+            self.open_until = None
+            self.backoff = REPROBE_MIN
+            return was_open
+
+    def record_failure(self, kind=None):
+        """Feed a failed `kind` command; returns True if this opened the circuit"""
+        with self.lock:
+            self.failures += 1
+            # Widen the next timeout in case we simply gave up too early
+            estimate = self.rtt.get(kind)
+            if estimate is not None:
+                estimate[1] = max(estimate[1] * 2, estimate[0])
+            if self.open_until is not None:
+                self.backoff = min(self.backoff * 2, REPROBE_MAX)
+                self.open_until = time.monotonic() + self.backoff
+                return False
+            if self.failures >= FAILURES_TO_OPEN:
+                self.open_until = time.monotonic() + self.backoff
+                return True
+            return False
+
+def get_health(ip):
+    """HostHealth for an IP, created on first use"""
+    with host_health_lock:
+        health = host_health.get(ip)
+        if health is None:
+            health = host_health[ip] = HostHealth()
+        return health
+
+def mark_online(ip, rtt=None, kind=None):
+    """Record that a PC answered, closing its circuit if it was open"""
+    if get_health(ip).record_success(rtt, kind):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {ip} is reachable again")
+        reconcile_wakeup.set()
+    post_state(ip, status='online', last_seen=datetime.now())
+    if ip in command_queue and ip not in flushing_hosts:
+        threading.Thread(target=flush_command_queue, args=(ip,), daemon=True).start()
+
+def mark_failed(ip, kind=None):
+    """Record that a PC did not answer, opening its circuit if needed"""
+    if get_health(ip).record_failure(kind):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {ip} looks offline, "
+              f"re-probing in the background")
+        post_state(ip, status='offline')
+        start_health_prober()
+
+def exchange(host, command, port=9999, max_timeout=5, request_id=None, trace=None):
+    """Send one command and return the reply, tracking the PC's health"""
+    health = get_health(host)
+    if health.is_open():
+        wait = max(0, int(health.open_until - time.monotonic()))
+        raise HostUnavailable(f"PC appears to be offline (next check in {wait}s)")
+
+    kind = command_kind(command)
+    for attempt in range(BUSY_RETRIES + 1):
+        start = time.monotonic()
+        try:
+            response = agents.send(host, command, health.timeout(max_timeout, kind), request_id, trace, port)
+            break
+        except AgentBusy:
+            # Nothing was run; give the agent a moment before trying again
+            mark_online(host)
+            if attempt == BUSY_RETRIES:
+                raise
+            with trace_span(trace, 'busy_wait'):
+                time.sleep(BUSY_RETRY_DELAY * 2 ** attempt)
+        except AgentError:
+            # It answered, so it is up - just not happy with the request
+            mark_online(host)
+            raise
+        except Exception:
+            agents.drop(host, port)
+            mark_failed(host, kind)
+            raise
+    mark_online(host, time.monotonic() - start, kind)
+    return response
+
+def load_command_queue():
+    """Load pending commands saved by a previous run"""
+    global command_queue
+    try:
+        with open(QUEUE_FILE) as f:
+            command_queue = json.load(f)
+    except FileNotFoundError:
+        command_queue = {}
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read {QUEUE_FILE}: {e}")
+        command_queue = {}
+
+def save_command_queue():
+    """Write pending commands to disk (caller must hold command_queue_lock)"""
+    tmp = QUEUE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(command_queue, f, indent=1)
+    os.replace(tmp, QUEUE_FILE)
+
+def is_queueable(command):
+    """Only settings are worth delivering late - a LOCK hours later is not"""
+    return command.startswith(QUEUEABLE_COMMANDS)
+
+def may_have_run(error):
+    """False only for connection errors that show the command never reached the agent"""
+    if isinstance(error, (HostUnavailable, ConnectionRefusedError)):
+        return False
+    return getattr(error, 'errno', None) not in (errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+def queue_command(ip, command, request_id=None):
+    """Queue a command for later delivery, dropping ones it makes redundant"""
+    with command_queue_lock:
+        pending = command_queue.setdefault(ip, [])
+        if request_id and any(c['id'] == request_id for c in pending):
+            return  # a retry of a request that is already queued
+        if command.startswith('SET_LIMIT:'):
+            # Only the latest limit matters
+            pending[:] = [c for c in pending if not c['command'].startswith('SET_LIMIT:')]
+        elif command.startswith('SET_APP_LIMIT:'):
+            # Same for each app's limit
+            prefix = command.rsplit(':', 1)[0] + ':'
+            pending[:] = [c for c in pending if not c['command'].startswith(prefix)]
+        elif command.startswith(('ADD_LOCK_TIME:', 'REMOVE_LOCK_TIME:')):
+            if any(c['command'] == command for c in pending):
+                return
+            # Adding then removing the same time (or the reverse) - last one wins
+            verb, spec = command.split(':', 1)
+            opposite = ('REMOVE_LOCK_TIME:' if verb == 'ADD_LOCK_TIME' else 'ADD_LOCK_TIME:') + spec
+            pending[:] = [c for c in pending if c['command'] != opposite]
+        pending.append({
+            # Also the id the agent sees, so a command that did arrive before
+            # the PC dropped off is not run a second time on delivery
+            'id': request_id or f"{time.time_ns()}-{len(pending)}",
+            'command': command,
+            'queued_at': datetime.now().isoformat(),
+        })
+        save_command_queue()
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Queued for {ip}: {command}")
+
+def pending_commands(ip):
+    """Commands still waiting for a PC"""
+    with command_queue_lock:
+        return list(command_queue.get(ip, []))
+
+def _batch_command(entries):
+    """BATCH command for queued entries, each run once per queue id"""
+    return 'BATCH:' + json.dumps([{'cmd': e['command'], 'id': e['id']} for e in entries])
+
+def _batches(entries):
+    """Split queued entries into BATCH commands that fit in one agent read"""
+    batch = []
+    for entry in entries:
+        if batch and len(_batch_command(batch + [entry])) > MAX_BATCH_BYTES:
+            yield batch
+            batch = []
+        batch.append(entry)
+    if batch:
+        yield batch
+
+def flush_command_queue(ip, port=9999):
+    """Deliver everything queued for a PC, in order, one round trip per batch"""
+    with command_queue_lock:
+        if ip in flushing_hosts or not command_queue.get(ip):
+            return
+        flushing_hosts.add(ip)
+    try:
+        for batch in _batches(pending_commands(ip)):
+            payload = _batch_command(batch)
+            try:
+                replies = json.loads(exchange(ip, payload, port, max_timeout=5))
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Queue delivery to {ip} failed: {e}")
+                if isinstance(e, OSError) and may_have_run(e):
+                    drop_unrepeatable(ip, batch)
+                return
+            delivered = {e['id'] for e in batch}
+            with command_queue_lock:
+                remaining = [c for c in command_queue.get(ip, []) if c['id'] not in delivered]
+                if remaining:
+                    command_queue[ip] = remaining
+                else:
+                    command_queue.pop(ip, None)
+                save_command_queue()
+            for entry, reply in zip(batch, replies):
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Delivered to {ip}: {entry['command']} -> {reply}")
+    finally:
+        with command_queue_lock:
+            flushing_hosts.discard(ip)
+
+def drop_unrepeatable(ip, batch):
+    """
+    Take commands that must not run twice out of the queue after a batch got
+    no reply: the PC may have run them, and by the next delivery it may no
+    longer remember their ids.
+    """
+    with command_queue_lock:
+        pending = command_queue.get(ip, [])
+        dropped = [c for c in batch if not c['command'].startswith(REPEATABLE_COMMANDS)]
+        if not dropped:
+            return
+        ids = {c['id'] for c in dropped}
+        pending[:] = [c for c in pending if c['id'] not in ids]
+        if not pending:
+            command_queue.pop(ip, None)
+        save_command_queue()
+    for entry in dropped:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Not retrying {entry['command']} on {ip}: "
+              f"no reply, it may have run already")
+
+def send_or_queue(ip, command, request_id=None, trace=None):
+    """
+    Send a settings command, queueing it if the PC can't be reached.
+
+    Returns (success, response, queued).
+    """
+    # Queued commands are delivered later under this same id
+    request_id = request_id or secrets.token_hex(8)
+    if pending_commands(ip):
+        # Keep order: anything new goes behind what is already waiting
+        queue_command(ip, command, request_id)
+        with trace_span(trace, 'queue'):
+            flush_command_queue(ip)
+        if not pending_commands(ip):
+            return True, "Delivered with earlier queued settings", False
+        return True, "PC is offline - will apply when it is back online", True
+
+    try:
+        return True, exchange(ip, command, max_timeout=5, request_id=request_id, trace=trace), False
+    except OSError as e:
+        if is_queueable(command) and (command.startswith(REPEATABLE_COMMANDS) or not may_have_run(e)):
+            queue_command(ip, command, request_id)
+            return True, "PC is offline - will apply when it is back online", True
+        if is_queueable(command):
+            return False, f"No reply from the PC, so it may or may not have run the command ({e})", False
+        return False, str(e), False
+    except Exception as e:
+        return False, str(e), False
+
+def canonical_config(config):
+    """A policy's config in the agent's canonical form (see GET_CONFIG)"""
+    today = date.today().isoformat()
+    canonical = {
+        'usage_limit': config.get('usage_limit') or 0,
+        'lock_times': dict(config.get('lock_times', {})),
+        'overrides': {day: times for day, times in config.get('overrides', {}).items() if day >= today},
+        'app_limits': dict(config.get('app_limits', {})),
+    }
+    if config.get('blocklist'):
+        # Left out when empty, like the agent does
+        canonical['blocklist'] = {pattern: list(windows) for pattern, windows in config['blocklist'].items()}
+    return canonical
+
+def config_hash(config):
+    """Short hash of a canonical config dict, as the agent computes it"""
+    data = json.dumps(config, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(data).hexdigest()[:CONFIG_HASH_LENGTH]
+
+def config_diff(current, desired):
+    """APPLY_CONFIG changes that turn the PC's config into the desired one"""
+    changes = {}
+    if current.get('usage_limit') != desired['usage_limit']:
+        changes['usage_limit'] = desired['usage_limit']
+    if current.get('lock_times') != desired['lock_times']:
+        changes['lock_times'] = desired['lock_times']
+    have, want = current.get('overrides', {}), desired['overrides']
+    overrides = {day: times for day, times in want.items() if have.get(day) != times}
+    overrides.update({day: None for day in have if day not in want})
+    if overrides:
+        changes['overrides'] = overrides
+    have, want = current.get('app_limits', {}), desired['app_limits']
+    app_limits = {name: minutes for name, minutes in want.items() if have.get(name) != minutes}
+    app_limits.update({name: 0 for name in have if name not in want})
+    if app_limits:
+        changes['app_limits'] = app_limits
+    if current.get('blocklist', {}) != desired.get('blocklist', {}):
+        changes['blocklist'] = desired.get('blocklist', {})
+    return changes
+
+def load_policies():
+    """Load the policies saved by a previous run"""
+    global policies
+    try:
+        with open(POLICIES_FILE) as f:
+            policies = json.load(f)
+    except FileNotFoundError:
+        policies = {}
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read {POLICIES_FILE}: {e}")
+        policies = {}
+
+def save_policies():
+    """Write the policies to disk (caller must hold policies_lock)"""
+    tmp = POLICIES_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(policies, f, indent=1, sort_keys=True)
+    os.replace(tmp, POLICIES_FILE)
+
+def _set_policy(ip, config, version, synced):
+    """Store a new policy version (caller must hold policies_lock)"""
+    config = canonical_config(config)
+    config_id = config_hash(config)
+    policies[ip] = {
+        'version': version,
+        'config': config,
+        'hash': config_id,
+        'synced_version': version if synced else policies.get(ip, {}).get('synced_version'),
+        'synced_at': datetime.now().isoformat() if synced else policies.get(ip, {}).get('synced_at'),
+    }
+    save_policies()
+    return config_id
+
+def edit_policy(ip, change):
+    """
+    Change a PC's desired settings: change(config) edits a copy in place.
+    The reconciler pushes the result, now if the PC is up or when it is back.
+    Returns False (policy unchanged) if change raises ValueError.
+    """
+    with policies_lock:
+        policy = policies.get(ip)
+        config = json.loads(json.dumps(policy['config'])) if policy else canonical_config({})
+        try:
+            change(config)
+        except ValueError:
+            return False
+        _set_policy(ip, config, (policy['version'] if policy else 0) + 1, False)
+    start_reconciler()
+    reconcile_wakeup.set()
+    return True
+
+def set_policy_lock_time(config, lock_time, add):
+    """Add or remove 'HH:MM[@DAYS]' in a config, the way the agent's schedule does"""
+    at, _, days = lock_time.partition('@')
+    hour, minute = map(int, at.split(':'))
+    at = f"{hour:02d}:{minute:02d}"
+    lock_times = config['lock_times']
+    old = parse_days(lock_times[at]) if at in lock_times else 0
+    mask = old | parse_days(days) if add else old & ~parse_days(days)
+    if mask:
+        lock_times[at] = format_days(mask)
+    else:
+        lock_times.pop(at, None)
+
+def set_policy_block(config, pattern, window, add):
+    """Block or unblock a program in a config, the way the agent's blocklist does (window as format_window)"""
+    blocklist = config.setdefault('blocklist', {})
+    if not add:
+        blocklist.pop(pattern, None)
+    elif window is None:
+        blocklist[pattern] = []
+    elif blocklist.get(pattern) != []:
+        if window not in blocklist.setdefault(pattern, []):
+            blocklist[pattern].append(window)
+
+def reconcile_pc(ip, port=9999):
+    """
+    Bring one PC in line with its policy. Returns 'in sync', 'adopted',
+    'applied' or raises if the PC can't be reached or refuses the change.
+    """
+    remote_hash = exchange(ip, 'GET_CONFIG_HASH', port, max_timeout=2).strip()
+    with policies_lock:
+        policy = policies.get(ip)
+        if policy and remote_hash == policy['hash']:
+            if policy['synced_version'] != policy['version']:
+                policy['synced_version'] = policy['version']
+                policy['synced_at'] = datetime.now().isoformat()
+                save_policies()
+            return 'in sync'
+
+    current = json.loads(exchange(ip, 'GET_CONFIG', port, max_timeout=2))
+    with policies_lock:
+        policy = policies.get(ip)
+        if policy is None:
+            # First time: whatever the PC has now becomes its policy
+            _set_policy(ip, current, 1, True)
+            return 'adopted'
+        desired, version = policy['config'], policy['version']
+    changes = config_diff(current, canonical_config(desired))
+    reply = exchange(ip, 'APPLY_CONFIG:' + json.dumps(changes, separators=(',', ':')), port, max_timeout=5).strip()
+    if reply.startswith('Invalid'):
+        raise AgentError(reply)
+    with policies_lock:
+        policy = policies.get(ip)
+        if policy and policy['version'] == version and reply == policy['hash']:
+            policy['synced_version'] = version
+            policy['synced_at'] = datetime.now().isoformat()
+            save_policies()
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Synced settings to {ip}: {', '.join(changes) or 'nothing'}")
+    return 'applied'
+
+def reconcile_loop():
+    """Check every reachable PC against its policy, then wait for a change or the interval"""
+    while True:
+        reconcile_wakeup.clear()
+        ips = [ip for ip, info in discovered_pcs.items()
+               if info.status != 'offline' and not get_health(ip).is_open()]
+        threads = [threading.Thread(target=_reconcile_quietly, args=(ip,)) for ip in ips]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        reconcile_wakeup.wait(RECONCILE_INTERVAL)
+
+def _reconcile_quietly(ip):
+    try:
+        reconcile_pc(ip)
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Settings sync with {ip} failed: {e}")
+
+def start_reconciler():
+    """Start the background reconciler thread once"""
+    global reconciler
+    with policies_lock:
+        if reconciler is None:
+            reconciler = threading.Thread(target=reconcile_loop, daemon=True)
+            reconciler.start()
+
+def health_probe_loop(port=9999):
+    """Background re-probe of offline PCs, backing off while they stay down"""
+    while True:
+        now = time.monotonic()
+        with host_health_lock:
+            due = [ip for ip, h in host_health.items()
+                   if h.open_until is not None and h.open_until <= now]
+        for ip in due:
+            try:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.settimeout(1)
+                result = s.connect_ex((ip, port))
+                s.close()
+            except OSError:
+                result = -1
+            if result == 0:
+                # A connect says nothing about how long commands take
+                mark_online(ip)
+            else:
+                mark_failed(ip)
+        time.sleep(1)
+
+def start_health_prober():
+    """Start the background re-probe thread once"""
+    global health_prober
+    with host_health_lock:
+        if health_prober is None:
+            health_prober = threading.Thread(target=health_probe_loop, daemon=True)
+            health_prober.start()
+
+def scan_for_servers(port=9999, network=None):
+    """Scan the local network (or the given one) for PCs running the control server"""
+    global last_scan_time
+    if network is None:
+        network = f"{get_local_ip()}/24"
+    network = ipaddress.ip_network(network, strict=False)
+    found = {}
     
     def check_host(ip):
         try:
@@ -58,29 +1010,21 @@ def scan_for_servers(port=9999):
             result = s.connect_ex((str(ip), port))
             s.close()
             if result == 0:
-                # Try to get hostname from the PC directly
-                hostname = CUSTOM_PC_NAMES.get(str(ip), None)
+                agent_id, name = identify_pc(str(ip), port)
+                hostname = pc_setting(CUSTOM_PC_NAMES, agent_id, name, str(ip)) or name
                 if not hostname:
                     try:
-                        # First try to get name from the control server
-                        s2 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s2.settimeout(1)
-                        s2.connect((str(ip), port))
-                        s2.send(b"GET_NAME")
-                        hostname = s2.recv(1024).decode().strip()
-                        s2.close()
-                        if not hostname:
-                            raise Exception("Empty name")
+                        # Fallback to system hostname resolution
+                        hostname = socket.gethostbyaddr(str(ip))[0]
+                        hostname = hostname.split('.')[0].upper()
                     except:
-                        try:
-                            # Fallback to system hostname resolution
-                            hostname = socket.gethostbyaddr(str(ip))[0]
-                            hostname = hostname.split('.')[0].upper()
-                        except:
-                            hostname = f"PC at {ip}"
+                        hostname = f"PC at {ip}"
                 
-                discovered_pcs[str(ip)] = {
+                found[str(ip)] = {
+                    # Agents too old for GET_ID are known by their address
+                    'agent_id': agent_id or f"ip-{ip}",
                     'hostname': hostname,
+                    'group': pc_setting(PC_GROUPS, agent_id, name, str(ip)),
                     'status': 'online',
                     'locked': False,  # Will update in separate check
                     'last_seen': datetime.now()
@@ -97,32 +1041,511 @@ def scan_for_servers(port=9999):
     for t in threads:
         t.join()
     
+    replace_pcs(found)
+    for ip in found:
+        mark_online(ip)
     last_scan_time = datetime.now()
+    start_reconciler()
+    reconcile_wakeup.set()
     return discovered_pcs
 
-def send_command(host, command, port=9999):
+def identify_pc(ip, port=9999):
+    """(agent ID, computer name) of an agent, in one round trip; None for what it can't tell"""
+    try:
+        agent_id, name = json.loads(exchange(ip, 'BATCH:["GET_ID","GET_NAME"]', port, max_timeout=1))
+    except Exception:
+        # Older agents: no BATCH, so no GET_ID either
+        try:
+            return None, exchange(ip, "GET_NAME", port, max_timeout=1).strip() or None
+        except Exception:
+            return None, None
+    if agent_id.startswith("Unknown command"):
+        agent_id = None
+    return agent_id, name.strip() or None
+
+def move_pc_state(moves):
+    """Carry policies, queued commands and history over when PCs get new IPs"""
+    for table, lock, save in ((policies, policies_lock, save_policies),
+                              (command_queue, command_queue_lock, save_command_queue),
+                              (history, history_lock, save_history)):
+        with lock:
+            # Take everything out first, so PCs that swapped addresses don't overwrite each other
+            carried = {new: table.pop(old) for old, new in moves if old in table}
+            if carried:
+                table.update(carried)
+                save()
+    for old, new in moves:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {pc_name(new, new)} moved from {old} to {new}")
+
+def send_command(host, command, port=9999, request_id=None, trace=None):
     """Send a command to the remote PC"""
     try:
-        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client.settimeout(5)
-        client.connect((host, port))
-        client.send(command.encode())
-        response = client.recv(1024)
-        client.close()
-        return True, response.decode()
+        return True, exchange(host, command, port, max_timeout=5, request_id=request_id, trace=trace)
     except Exception as e:
         return False, str(e)
 
+def format_app_usage(usage):
+    """Readable lines from a GET_USAGE reply"""
+    limits = usage.get('limits', {})
+    lines = []
+    for app_name, minutes in usage.get('apps', {}).items():
+        limit = limits.get(app_name)
+        lines.append(f"{app_name}: {minutes:g} min" + (f" (limit {limit})" if limit else ""))
+    for app_name, limit in limits.items():
+        if app_name not in usage.get('apps', {}):
+            lines.append(f"{app_name}: not used yet (limit {limit})")
+    return "\n".join(lines) or "No app usage recorded today"
+
+def format_blocked(blocked):
+    """Readable lines from a LIST_BLOCKED reply"""
+    active = set(blocked.get('active', []))
+    lines = []
+    for pattern, windows in blocked.get('rules', {}).items():
+        when = ', '.join(windows) or 'always'
+        lines.append(f"{pattern}: {when}" + (" (blocked now)" if pattern in active else ""))
+    for name, count in blocked.get('closed_today', {}).items():
+        lines.append(f"{name} closed {count} time(s) today")
+    return "\n".join(lines) or "No programs blocked"
+
+def encode_png(width, height, pixels):
+    """8-bit RGB pixels -> PNG bytes (no filtering, one IDAT chunk)"""
+    stride = width * 3
+    rows = b''.join(b'\x00' + pixels[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 6))
+            + chunk(b'IEND', b''))
+
+class Thumbnail:
+    """The panel's copy of one PC's screen, rebuilt from THUMBNAIL replies"""
+    __slots__ = ('lock', 'seq', 'width', 'height', 'pixels', 'png', 'interval', 'fetched_at')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = None
+        self.width = self.height = 0
+        self.pixels = bytearray()
+        self.png = None
+        self.interval = 2.0
+        self.fetched_at = float('-inf')
+
+    def apply(self, reply):
+        """Patch changed tiles into the frame"""
+        width, height, tile = reply['w'], reply['h'], reply['tile']
+        if reply['full'] or (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.pixels = bytearray(width * height * 3)
+        stride, columns = width * 3, -(-width // tile)
+        for index, data in reply['tiles'].items():
+            top, left = divmod(int(index), columns)
+            top, left = top * tile, left * tile * 3
+            span = min(stride, left + tile * 3) - left
+            data = zlib.decompress(base64.b64decode(data))
+            for row in range(len(data) // span):
+                offset = (top + row) * stride + left
+                self.pixels[offset:offset + span] = data[row * span:(row + 1) * span]
+        if reply['tiles'] or reply['seq'] != self.seq:
+            self.png = None
+        self.seq = reply['seq']
+        self.interval = reply['interval']
+
+def fetch_thumbnail(ip, port=9999):
+    """Bring the panel's copy of a PC's screen up to date; returns its Thumbnail"""
+    with thumbnails_lock:
+        thumb = thumbnails.setdefault(ip, Thumbnail())
+    with thumb.lock:
+        # Several viewers of one PC share a fetch
+        if time.monotonic() - thumb.fetched_at >= THUMBNAIL_REUSE:
+            command = 'THUMBNAIL' if thumb.seq is None else f'THUMBNAIL:{thumb.seq}'
+            thumb.apply(json.loads(exchange(ip, command, port, max_timeout=3)))
+            thumb.fetched_at = time.monotonic()
+        if thumb.png is None and thumb.width:
+            thumb.png = encode_png(thumb.width, thumb.height, thumb.pixels)
+    return thumb
+
+def fetch_reports(commands):
+    """
+    Ask PCs for their pre-aggregated stats, all in parallel.
+
+    commands maps ip -> GET_STATS command. Returns (reports, errors):
+    ip -> report dict from the agent, ip -> error text.
+    """
+    reports, errors = {}, {}
+
+    def fetch(ip):
+        try:
+            reports[ip] = json.loads(exchange(ip, commands[ip], max_timeout=2))
+        except Exception as e:
+            errors[ip] = str(e)
+
+    threads = [threading.Thread(target=fetch, args=(ip,)) for ip in commands]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return reports, errors
+
+class DailyHistory:
+    """
+    One PC's usage per day as flat array columns; index 0 is first_day.
+
+    Reports work on whole slices - sum(), count(), max(), extended slices
+    for weekdays and bytes.split() for streaks - so a year of data costs a
+    handful of C-level calls rather than a Python loop per day.
+    """
+    __slots__ = ('first_day', 'columns', 'within_limits')
+
+    def __init__(self, first_day):
+        self.first_day = first_day                      # date ordinal of index 0
+        self.columns = {name: array('l') for name in HISTORY_COLUMNS}
+        self.within_limits = bytearray()                # 1 for each day without a limit hit
+
+    def __len__(self):
+        return len(self.within_limits)
+
+    @property
+    def last_day(self):
+        return self.first_day + len(self) - 1
+
+    def put(self, day, values):
+        """Set one day's values (day is a date ordinal), growing the columns as needed"""
+        offset = day - self.first_day
+        if offset < 0:
+            return
+        missing = offset + 1 - len(self)
+        if missing > 0:
+            for column in self.columns.values():
+                column.frombytes(bytes(missing * column.itemsize))
+            self.within_limits.extend(b'\x01' * missing)
+        for name, column in self.columns.items():
+            column[offset] = int(values.get(name, 0))
+        self.within_limits[offset] = 0 if values.get('limit_hits') else 1
+
+    def to_json(self):
+        data = {name: column.tolist() for name, column in self.columns.items()}
+        data['first_day'] = date.fromordinal(self.first_day).isoformat()
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        pc_history = cls(date.fromisoformat(data['first_day']).toordinal())
+        for name, column in pc_history.columns.items():
+            column.extend(data.get(name, []))
+        length = min(len(column) for column in pc_history.columns.values())
+        for column in pc_history.columns.values():
+            del column[length:]
+        pc_history.within_limits = bytearray(0 if hits else 1 for hits in pc_history.columns['limit_hits'])
+        return pc_history
+
+    def summary(self, days, today=None):
+        """Totals, averages, streaks and a chart series for the `days` days up to today"""
+        today = (today or date.today()).toordinal()
+        start = today - days + 1
+        lo = min(max(0, start - self.first_day), len(self))
+        hi = min(max(0, today + 1 - self.first_day), len(self))
+        active = self.columns['active'][lo:hi]
+        used_days = len(active) - active.count(0)
+        total = sum(active)
+
+        # Streaks count days up to the newest day this PC reported
+        flags = bytes(self.within_limits[lo:hi])
+        streak = len(flags) - len(flags.rstrip(b'\x01'))
+        best_streak = max(map(len, flags.split(b'\x00')), default=0)
+
+        busiest = max(active, default=0)
+        busiest_day = (date.fromordinal(self.first_day + lo + active.index(busiest)).isoformat()
+                       if busiest else None)
+
+        # Weekday averages via step-7 slices; each weekday is averaged over the weeks in range
+        weekday_minutes = [0] * 7
+        if hi > lo:
+            first_weekday = date.fromordinal(self.first_day + lo).weekday()
+            for weekday in range(7):
+                column = active[(weekday - first_weekday) % 7::7]
+                if column:
+                    weekday_minutes[weekday] = round(sum(column) / len(column) / 60)
+
+        # Chart: a bar per day, or per week beyond a month
+        step = 1 if days <= 31 else 7
+        base = self.first_day + lo  # day of active[0]
+        bars = []
+        for first in range(start, today + 1, step):
+            chunk = active[max(0, first - base):max(0, first + step - base)]
+            bars.append({'day': date.fromordinal(first).isoformat(), 'minutes': round(sum(chunk) / 60)})
+
+        return {
+            'days': days,
+            'total_minutes': round(total / 60),
+            'used_days': used_days,
+            'avg_minutes': round(total / 60 / days),
+            'avg_used_minutes': round(total / 60 / used_days) if used_days else 0,
+            'busiest_day': busiest_day,
+            'busiest_minutes': round(busiest / 60),
+            'locks': sum(self.columns['locks'][lo:hi]),
+            'unlocks': sum(self.columns['unlocks'][lo:hi]),
+            'limit_hits': sum(self.columns['limit_hits'][lo:hi]),
+            'streak': streak,
+            'best_streak': best_streak,
+            'weekday_minutes': weekday_minutes,
+            'bars': bars,
+        }
+
+def load_history():
+    """Load the report cache saved by a previous run"""
+    global history
+    try:
+        with open(HISTORY_FILE) as f:
+            history = {ip: DailyHistory.from_json(data) for ip, data in json.load(f).items()}
+    except FileNotFoundError:
+        history = {}
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not read {HISTORY_FILE}: {e}")
+        history = {}
+
+def save_history():
+    """Write the report cache to disk (caller must hold history_lock)"""
+    tmp = HISTORY_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({ip: pc_history.to_json() for ip, pc_history in history.items()}, f, separators=(',', ':'))
+    os.replace(tmp, HISTORY_FILE)
+
+def ingest_report(ip, report):
+    """Merge a GET_STATS:DAY reply into the PC's history (caller must hold history_lock)"""
+    keys = [date.fromisoformat(key).toordinal() for key in report.get('keys', [])]
+    columns = [report.get(name, []) for name in HISTORY_COLUMNS]
+    rows = [dict(zip(HISTORY_COLUMNS, values)) for values in zip(*columns)]
+    pc_history = history.get(ip)
+    if pc_history is None:
+        # Start at the first day with anything in it, not two years of zeros
+        used = [day for day, row in zip(keys, rows) if any(row.values())]
+        pc_history = history[ip] = DailyHistory(used[0] if used else date.today().toordinal())
+    for day, row in zip(keys, rows):
+        pc_history.put(day, row)
+
+def refresh_history():
+    """Fetch the days each PC has added since the last refresh"""
+    global history_refreshed, history_refreshing
+    today = date.today().toordinal()
+    commands = {}
+    with history_lock:
+        for ip, info in discovered_pcs.items():
+            if info.status == 'offline':
+                continue
+            # The newest cached day was partial when fetched, so it is asked for again
+            count = today - history[ip].last_day + 1 if ip in history else HISTORY_DAYS
+            commands[ip] = f"GET_STATS:DAY:{min(max(count, 1), HISTORY_DAYS)}"
+    try:
+        reports, _ = fetch_reports(commands)
+        with history_lock:
+            for ip, report in reports.items():
+                ingest_report(ip, report)
+            if reports:
+                save_history()
+            history_refreshed = time.monotonic()
+    finally:
+        history_refreshing = False
+
+def refresh_history_if_stale(force=False):
+    """Start a background refresh when the cache is old; never waits for the PCs"""
+    global history_refreshing
+    with history_lock:
+        if history_refreshing:
+            return
+        if not force and time.monotonic() - history_refreshed < HISTORY_REFRESH and history_refreshed:
+            return
+        history_refreshing = True
+    threading.Thread(target=refresh_history, daemon=True).start()
+
+def audit_connection(path=None):
+    """
+    New connection to the audit log (one per thread; sqlite3 objects aren't
+    shared). Wrap it in closing(): using the connection itself as a context
+    manager only commits, it doesn't close.
+    """
+    conn = sqlite3.connect(path or AUDIT_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_audit_db(path=None):
+    """Create the audit table and its indexes if they are missing"""
+    with closing(audit_connection(path)) as conn, conn:
+        # WAL lets /api/audit read while the writer inserts
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS actions (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            pc TEXT,
+            hostname TEXT,
+            action TEXT,
+            detail TEXT,
+            success INTEGER,
+            queued INTEGER,
+            response TEXT,
+            latency_ms REAL,
+            client TEXT,
+            request_id TEXT)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS actions_pc_ts ON actions (pc, ts)')
+        conn.execute('CREATE INDEX IF NOT EXISTS actions_action_ts ON actions (action, ts)')
+        conn.execute('CREATE INDEX IF NOT EXISTS actions_ts ON actions (ts)')
+        conn.execute('''CREATE TABLE IF NOT EXISTS action_days (
+            pc TEXT,
+            day TEXT,
+            commands INTEGER,
+            failures INTEGER,
+            latency_ms REAL,
+            last_ts REAL,
+            PRIMARY KEY (pc, day))''')
+
+AUDIT_INSERT = (f"INSERT INTO actions ({', '.join(AUDIT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(AUDIT_COLUMNS))})")
+AUDIT_ADD_DAY = ('''INSERT INTO action_days VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (pc, day) DO UPDATE SET
+        commands = commands + excluded.commands,
+        failures = failures + excluded.failures,
+        latency_ms = latency_ms + excluded.latency_ms,
+        last_ts = MAX(last_ts, excluded.last_ts)''')
+
+def insert_audit_rows(conn, rows):
+    """Insert audit rows (tuples in AUDIT_COLUMNS order) and add them to the daily totals"""
+    conn.executemany(AUDIT_INSERT, rows)
+    days = {}
+    for row in rows:
+        ts, pc, success, latency_ms = row[0], row[1], row[5], row[8]
+        key = (pc, date.fromtimestamp(ts).isoformat())
+        total = days.setdefault(key, [0, 0, 0.0, ts])
+        total[0] += 1
+        total[1] += not success
+        total[2] += latency_ms or 0
+        total[3] = max(total[3], ts)
+    conn.executemany(AUDIT_ADD_DAY, [key + tuple(total) for key, total in days.items()])
+
+def audit_writer_loop():
+    """Insert queued audit rows, as many per transaction as have piled up"""
+    conn = audit_connection()
+    conn.execute('PRAGMA synchronous=NORMAL')
+    while True:
+        rows = [audit_queue.get()]
+        while len(rows) < AUDIT_BATCH:
+            try:
+                rows.append(audit_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with conn:
+                insert_audit_rows(conn, rows)
+        except sqlite3.Error as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Could not write {len(rows)} audit rows: {e}")
+        for _ in rows:
+            audit_queue.task_done()
+
+def record_action(**fields):
+    """Queue one audit row; never waits for the disk"""
+    global audit_writer
+    if audit_writer is None:
+        with audit_writer_lock:
+            if audit_writer is None:
+                audit_writer = threading.Thread(target=audit_writer_loop, daemon=True)
+                audit_writer.start()
+    audit_queue.put(tuple(fields.get(column) for column in AUDIT_COLUMNS))
+
+def parse_audit_time(value):
+    """Epoch seconds from ?since= / ?until=: a number or an ISO date/time"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def query_audit(pc=None, action=None, since=None, until=None, failed=False, cursor=None,
+                limit=AUDIT_PAGE):
+    """
+    One page of the audit log, newest first. Pages are keyset-paginated on
+    (ts, id): the cursor is the last row's "ts:id", so a page deep in years of
+    history is an index seek, not an OFFSET scan. Returns (rows, next cursor).
+    """
+    where, args = [], []
+    if pc:
+        where.append('pc = ?')
+        args.append(pc)
+    if action:
+        where.append('action = ?')
+        args.append(action)
+    if since is not None:
+        where.append('ts >= ?')
+        args.append(since)
+    if until is not None:
+        where.append('ts < ?')
+        args.append(until)
+    if failed:
+        where.append('success = 0')
+    if cursor:
+        ts, _, row_id = cursor.partition(':')
+        where.append('(ts, id) < (?, ?)')
+        args += [float(ts), int(row_id)]
+    sql = 'SELECT * FROM actions'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ts DESC, id DESC LIMIT ?'
+    args.append(limit + 1)
+    with closing(audit_connection()) as conn:
+        rows = [dict(row) for row in conn.execute(sql, args)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['ts']!r}:{rows[-1]['id']}"
+    return rows, next_cursor
+
+def audit_summary(since=None):
+    """Per-PC command counts, failures and average latency from the day of `since` on"""
+    sql = ('SELECT pc, SUM(commands) AS commands, SUM(failures) AS failures, '
+           'SUM(latency_ms) / SUM(commands) AS avg_latency_ms, MAX(last_ts) AS last_ts '
+           'FROM action_days')
+    args = []
+    if since is not None:
+        sql += ' WHERE day >= ?'
+        args.append(date.fromtimestamp(since).isoformat())
+    with closing(audit_connection()) as conn:
+        rows = [dict(row) for row in conn.execute(sql + ' GROUP BY pc', args)]
+    for row in rows:
+        row['failure_rate'] = round(row['failures'] / row['commands'], 4) if row['commands'] else 0.0
+        row['avg_latency_ms'] = round(row['avg_latency_ms'] or 0, 1)
+    return rows
+
+def report_days():
+    """Report period from ?days=, one of a week, a month or a year"""
+    days = request.args.get('days', 7, type=int)
+    return days if days in (7, 30, 365) else 7
+
 @app.route('/')
 def index():
-    """Main page showing all discovered PCs"""
-    # Update lock status for all PCs
-    for ip in discovered_pcs:
-        status = check_pc_status(ip)
-        discovered_pcs[ip]['locked'] = (status == "LOCKED")
+    """Main page showing all discovered PCs (?group= and ?state= narrow it down)"""
+    group = request.args.get('group') or None
+    state = request.args.get('state') or None
+    with state_changed:
+        targets = [record.ip for record in discovered_pcs.select(group=group, state=state)]
+    # Update lock status for those PCs, all at once
+    threads = [threading.Thread(target=probe_status, args=(ip,)) for ip in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sync_state()
     
+    with state_changed:
+        # A PC that just changed state may no longer match the filter
+        pcs = {record.ip: record for record in sorted(discovered_pcs.select(group=group, state=state),
+                                                      key=lambda record: record.hostname or '')}
+        groups = sorted(name for name in discovered_pcs.counts('group') if name)
     return render_template('index.html', 
-                         pcs=discovered_pcs, 
+                         pcs=pcs, 
+                         groups=groups,
+                         group=group,
+                         state=state,
                          last_scan=last_scan_time)
 
 @app.route('/scan')
@@ -134,42 +1557,400 @@ def scan():
 @app.route('/control/<ip>')
 def control(ip):
     """Control page for a specific PC"""
-    pc_info = discovered_pcs.get(ip, {'hostname': 'Unknown', 'status': 'unknown'})
     # Check current lock status
-    status = check_pc_status(ip)
-    pc_info['locked'] = (status == "LOCKED")
+    status = probe_status(ip)
+    record = discovered_pcs.get(ip)
+    pc_info = pc_to_json(ip, record) if record else {'hostname': 'Unknown', 'status': 'unknown'}
+    if status in ("LOCKED", "UNLOCKED"):
+        pc_info['locked'] = (status == "LOCKED")
     
     return render_template('control.html', ip=ip, pc_info=pc_info)
 
+@app.route('/control/<ip>/thumbnail.png')
+def thumbnail(ip):
+    """
+    The PC's screen as a small PNG. With ?seq=N (the frame the browser
+    already has) an unchanged screen gets 204 and no image.
+    """
+    try:
+        thumb = fetch_thumbnail(ip)
+    except ValueError:
+        return "This PC's agent can't send screen pictures yet", 501
+    except Exception as e:
+        return f"Screen not available: {e}", 503
+    headers = {'Cache-Control': 'no-store', 'X-Thumbnail-Seq': str(thumb.seq),
+               'X-Thumbnail-Interval': str(thumb.interval)}
+    if not thumb.width or request.args.get('seq', type=int) == thumb.seq:
+        return Response(status=204, headers=headers)
+    return Response(thumb.png, mimetype='image/png', headers=headers)
+
 @app.route('/action', methods=['POST'])
 def action():
-    """Execute an action on a PC"""
+    """
+    Execute an action on a PC, or on several at once: instead of "ip", give
+    "group" and/or "state" (offline, locked, unlocked), or "pcs" - a list of
+    agent IDs, IPs or hostnames.
+    """
+    received = time.perf_counter()
     data = request.json
-    ip = data.get('ip')
-    action_type = data.get('action')
+    # One trace id for the whole request, shared by every PC it goes to
+    trace_id = secrets.token_hex(8)
+    
+    # Set by the page once per tap and kept across its retries
+    request_id = data.get('request_id')
+    if not isinstance(request_id, str) or not 0 < len(request_id) <= 64:
+        request_id = None
+    
+    if data.get('ip'):
+        return jsonify(run_action(data['ip'], data, request_id, request.remote_addr, trace_id, received))
+    
+    with state_changed:
+        if isinstance(data.get('pcs'), list):
+            records = [discovered_pcs.find(key) for key in data['pcs']]
+            targets = sorted({record.ip for record in records if record})
+        elif data.get('group') or data.get('state'):
+            targets = sorted(record.ip for record in
+                             discovered_pcs.select(group=data.get('group'), state=data.get('state')))
+        else:
+            return jsonify({'success': False, 'response': "No PC given", 'queued': False})
     
+    results = {}
+    client = request.remote_addr
+    def run(ip):
+        # The same request id is fine: each PC (and queue) keeps its own
+        results[ip] = run_action(ip, data, request_id, client, trace_id, received)
+    threads = [threading.Thread(target=run, args=(ip,)) for ip in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done = sum(1 for result in results.values() if result['success'])
+    return jsonify({
+        'success': bool(results) and done == len(results),
+        'response': f"Done on {done} of {len(results)} PCs",
+        'queued': any(result['queued'] for result in results.values()),
+        'results': results,
+        'trace': trace_id,
+    })
+
+def run_action(ip, data, request_id, client, trace_id=None, received=None):
+    """One /action on one PC, written to the audit log; returns the JSON reply with its timing"""
+    start = time.perf_counter()
+    action_type = data.get('action')
+    trace = Trace(trace_id or secrets.token_hex(8), ip, action_type, received)
+    if received:
+        trace.add('panel', received, start)
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Action request: {action_type} for {ip}")
+    queued = False
     
     if action_type == 'lock':
-        success, response = send_command(ip, "LOCK")
+        success, response = send_command(ip, "LOCK", request_id=request_id, trace=trace)
         # Update our local status immediately
-        if success and ip in discovered_pcs:
-            discovered_pcs[ip]['locked'] = True
+        if success:
+            post_state(ip, locked=True)
     elif action_type == 'shutdown':
-        success, response = send_command(ip, "SHUTDOWN")
+        success, response = send_command(ip, "SHUTDOWN", request_id=request_id, trace=trace)
     elif action_type == 'message':
         message = data.get('message', '')
-        success, response = send_command(ip, f"MESSAGE:{message}")
+        success, response = send_command(ip, f"MESSAGE:{message}", request_id=request_id, trace=trace)
     elif action_type == 'set_limit':
         minutes = data.get('minutes', 120)
-        success, response = send_command(ip, f"SET_LIMIT:{minutes}")
-    elif action_type == 'add_lock_time':
+        success, response, queued = send_or_queue(ip, f"SET_LIMIT:{minutes}", request_id, trace)
+        if success:
+            edit_policy(ip, lambda config: config.update(usage_limit=max(0, int(minutes))))
+    elif action_type == 'extend_time':
+        minutes = data.get('minutes', 15)
+        success, response, queued = send_or_queue(ip, f"EXTEND_TIME:{minutes}", request_id, trace)
+    elif action_type in ('add_lock_time', 'remove_lock_time'):
         lock_time = data.get('time', '21:00')
-        success, response = send_command(ip, f"ADD_LOCK_TIME:{lock_time}")
+        days = data.get('days')
+        if days and days != 'DAILY':
+            lock_time = f"{lock_time}@{days}"
+        try:
+            # Checked here too: a queued command and the policy would take anything
+            parse_lock_time(lock_time)
+        except ValueError:
+            success, response = False, "Invalid time format (use HH:MM and days like MON-FRI)"
+        else:
+            success, response, queued = send_or_queue(ip, f"{action_type.upper()}:{lock_time}", request_id, trace)
+            if success and not response.startswith(('Invalid', 'Too many')):
+                edit_policy(ip, lambda config: set_policy_lock_time(config, lock_time, action_type == 'add_lock_time'))
+    elif action_type == 'list_lock_times':
+        success, response = send_command(ip, "LIST_LOCK_TIMES", trace=trace)
+    elif action_type == 'get_usage':
+        success, response = send_command(ip, "GET_USAGE", trace=trace)
+        if success:
+            response = format_app_usage(json.loads(response))
+    elif action_type == 'set_app_limit':
+        app_name = data.get('app', '').strip().lower()
+        minutes = data.get('minutes', 0)
+        success, response, queued = send_or_queue(ip, f"SET_APP_LIMIT:{app_name}:{minutes}", request_id, trace)
+        if success and app_name and not response.startswith('Invalid'):
+            def set_app_limit(config):
+                if int(minutes) > 0:
+                    config['app_limits'][app_name] = int(minutes)
+                else:
+                    config['app_limits'].pop(app_name, None)
+            edit_policy(ip, set_app_limit)
+    elif action_type in ('block_app', 'unblock_app'):
+        pattern = data.get('app', '').strip().lower()
+        window = None
+        if action_type == 'block_app' and data.get('start') and data.get('end'):
+            window = f"{data['start']}-{data['end']}@{data.get('days') or 'DAILY'}"
+        try:
+            # Checked here too: a queued command and the policy would take anything
+            if not pattern:
+                raise ValueError("no program")
+            window = window and format_window(parse_window(window))
+        except ValueError:
+            success, response = False, "Invalid block (give a program, and times as HH:MM with days like MON-FRI)"
+        else:
+            command = f"{action_type.upper()}:{pattern}" + (f"@{window}" if window else "")
+            success, response, queued = send_or_queue(ip, command, request_id, trace)
+            if success and not response.startswith('Invalid'):
+                edit_policy(ip, lambda config: set_policy_block(config, pattern, window, action_type == 'block_app'))
+    elif action_type == 'list_blocked':
+        success, response = send_command(ip, "LIST_BLOCKED", trace=trace)
+        if success:
+            response = format_blocked(json.loads(response))
     else:
         success, response = False, "Unknown action"
     
-    return jsonify({'success': success, 'response': response})
+    detail = {k: v for k, v in data.items() if k not in ('ip', 'action', 'request_id')}
+    record_action(ts=time.time(), pc=ip, hostname=pc_name(ip),
+                  action=action_type, detail=json.dumps(detail) if detail else None,
+                  success=int(bool(success)), queued=int(bool(queued)),
+                  response=str(response)[:AUDIT_MAX_RESPONSE],
+                  latency_ms=round((time.perf_counter() - start) * 1000, 2),
+                  client=client, request_id=request_id)
+    trace.finish()
+    keep_trace(trace)
+    return {'success': success, 'response': response, 'queued': queued, 'trace': trace.to_json()}
+
+@app.route('/api/traces')
+def api_traces():
+    """
+    Kept request traces, newest first: every /action slower than
+    TRACE_SLOW_MS and a TRACE_SAMPLE share of the rest.
+
+    Query args:
+        slow (bool): only the slow ones
+        pc, trace, action: filters
+        limit (int): at most this many (default 50)
+    """
+    with traces_lock:
+        traces = list(slow_traces) if request.args.get('slow') else [*slow_traces, *sampled_traces]
+    for field in ('pc', 'trace', 'action'):
+        wanted = request.args.get(field)
+        if wanted:
+            key = 'trace_id' if field == 'trace' else field
+            traces = [t for t in traces if getattr(t, key) == wanted]
+    traces.sort(key=lambda t: t.ts, reverse=True)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 2 * TRACE_KEEP)
+    return jsonify({'slow_ms': TRACE_SLOW_MS, 'sample': TRACE_SAMPLE,
+                    'traces': [t.to_json() for t in traces[:limit]]})
+
+@app.route('/api/pcs')
+def api_pcs():
+    """
+    JSON view of the cached PC state. Never probes the PCs itself.
+
+    Query args:
+        since (int): only return PCs changed after this version
+        wait (float): with since, hold the request up to this many seconds
+                      until something changes (long-poll)
+
+    Returns 304 with no body when nothing changed since `since`.
+    """
+    since = request.args.get('since', type=int)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_LONG_POLL)
+
+    with state_changed:
+        # A version from the future means the panel restarted: send everything
+        if since is not None and since > state_version:
+            since = None
+        if since is not None and wait:
+            state_changed.wait_for(lambda: state_version > since, timeout=wait)
+        if since is not None and state_version <= since:
+            return '', 304
+
+        pcs = {ip: pc_to_json(ip, info) for ip, info in discovered_pcs.items()
+               if since is None or info.version > since}
+        removed = [ip for ip, version in removed_pcs.items()
+                   if since is not None and version > since]
+        version = state_version
+
+    return jsonify({
+        'version': version,
+        'full': since is None,
+        'last_scan': last_scan_time.isoformat() if last_scan_time else None,
+        'pcs': pcs,
+        'removed': removed,
+    })
+
+@app.route('/api/reports/weekly')
+def api_reports_weekly():
+    """Last 7 days for every PC: active minutes, locks, unlocks and limit hits per day"""
+    reports, errors = fetch_reports({ip: "GET_STATS:DAY:7" for ip in list(discovered_pcs)})
+    pcs = {}
+    for ip, report in reports.items():
+        active = [round(seconds / 60) for seconds in report.get('active', [])]
+        pcs[ip] = {
+            'hostname': pc_name(ip, ip),
+            'days': report.get('keys', []),
+            'active_minutes': active,
+            'total_minutes': sum(active),
+            'locks': report.get('locks', []),
+            'unlocks': report.get('unlocks', []),
+            'limit_hits': report.get('limit_hits', []),
+        }
+    return jsonify({'pcs': pcs, 'errors': errors})
+
+@app.route('/reports')
+def reports():
+    """Usage report for every PC over a week, month or year, from the cache"""
+    days = report_days()
+    refresh_history_if_stale(request.args.get('refresh') == '1')
+    with history_lock:
+        summaries = {ip: pc_history.summary(days) for ip, pc_history in history.items()}
+    names = {ip: pc_name(ip, ip) for ip in summaries}
+    return render_template('reports.html', days=days, summaries=summaries, names=names,
+                           refreshing=history_refreshing)
+
+@app.route('/reports/<ip>')
+def report(ip):
+    """One PC's report with a bar per day (or week) and weekday averages"""
+    days = report_days()
+    refresh_history_if_stale()
+    with history_lock:
+        summary = history[ip].summary(days) if ip in history else None
+    peak = max([bar['minutes'] for bar in summary['bars']] + [1]) if summary else 1
+    return render_template('report.html', ip=ip, days=days, summary=summary, peak=peak,
+                           hostname=pc_name(ip, ip),
+                           weekdays=['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+
+@app.route('/api/reports')
+def api_reports():
+    """Cached report summaries for every PC (?days=7|30|365)"""
+    days = report_days()
+    refresh_history_if_stale()
+    with history_lock:
+        return jsonify({ip: pc_history.summary(days) for ip, pc_history in history.items()})
+
+@app.route('/api/audit')
+def api_audit():
+    """
+    Every /action, newest first.
+
+    Query args:
+        pc, action: only this PC / action
+        since, until: epoch seconds or ISO date/time
+        failed=1: only failed commands
+        limit: page size (default 50, max 500)
+        cursor: the `next` value from the previous page
+    """
+    try:
+        rows, next_cursor = query_audit(
+            pc=request.args.get('pc'), action=request.args.get('action'),
+            since=parse_audit_time(request.args.get('since')),
+            until=parse_audit_time(request.args.get('until')),
+            failed=request.args.get('failed') == '1', cursor=request.args.get('cursor'),
+            limit=min(max(request.args.get('limit', AUDIT_PAGE, type=int), 1), AUDIT_MAX_PAGE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'entries': rows, 'next': next_cursor})
+
+@app.route('/api/audit/summary')
+def api_audit_summary():
+    """Per-PC command counts and failure rates (?since=, default the last 30 days)"""
+    try:
+        since = parse_audit_time(request.args.get('since'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if since is None:
+        since = time.time() - 30 * 86400
+    return jsonify({'since': since, 'pcs': audit_summary(since)})
+
+def start_rollout(ips, concurrency, client):
+    """Send AGENT_BUILD_FILE to the PCs in the background; None if a rollout is already running"""
+    global rollout
+    with open(AGENT_BUILD_FILE, 'rb') as f:
+        data = f.read()
+    with rollout_lock:
+        if rollout and not rollout['finished']:
+            return None
+        rollout = current = {
+            'build': hashlib.sha256(data).hexdigest(), 'size': len(data), 'concurrency': concurrency,
+            'started': time.time(), 'finished': None,
+            'pcs': {ip: {'hostname': pc_name(ip, ip), 'stage': 'waiting', 'sent': 0, 'error': None}
+                    for ip in ips},
+        }
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Updating {len(ips)} PCs to build {current['build'][:12]}")
+    threading.Thread(target=run_rollout, args=(current, data, client), daemon=True).start()
+    return current
+
+def run_rollout(current, data, client):
+    """Roll out one build, keeping each PC's progress in `current` for /api/update"""
+    started = {}
+
+    def progress(ip, stage, sent, size):
+        started.setdefault(ip, time.perf_counter())
+        with rollout_lock:
+            current['pcs'][ip].update(stage=stage, sent=sent)
+
+    def done(ip, result):
+        failed = isinstance(result, Exception)
+        with rollout_lock:
+            current['pcs'][ip].update(stage='failed' if failed else result,
+                                      sent=current['pcs'][ip]['sent'] if failed else len(data),
+                                      error=str(result) if failed else None)
+        record_action(ts=time.time(), pc=ip, hostname=pc_name(ip), action='update',
+                      detail=json.dumps({'build': current['build'][:12]}), success=int(not failed), queued=0,
+                      response=(str(result) if failed else f"Build {current['build'][:12]} {result}")[:AUDIT_MAX_RESPONSE],
+                      latency_ms=round((time.perf_counter() - started.get(ip, time.perf_counter())) * 1000, 2),
+                      client=client)
+
+    results = agents.roll_out(list(current['pcs']), data, current['concurrency'], progress, done)
+    with rollout_lock:
+        current['finished'] = time.time()
+    failed = sum(isinstance(result, Exception) for result in results.values())
+    installed = sum(result == 'installed' for result in results.values())
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Update to build {current['build'][:12]} finished: "
+          f"{len(results) - failed - installed} PCs up to date, {installed} waiting for a restart, "
+          f"{failed} failed")
+
+@app.route('/api/update', methods=['GET', 'POST'])
+def api_update():
+    """
+    POST starts sending this panel's pc_control.py to the PCs ({"pcs": [...]},
+    default every PC not offline; "concurrency", default 4). GET shows the
+    latest rollout, per PC: stage (waiting, checking, sending, installing,
+    restarting, then done, current, installed or failed), bytes sent and any
+    error. "installed" means the PC can't restart its agent by itself and
+    still runs the old build until someone does.
+    """
+    if request.method == 'POST':
+        if not SHARED_KEY:
+            return jsonify({'error': "Updates need a shared key (pc_control.py --make-key)"}), 400
+        data = request.get_json(silent=True) or {}
+        ips = data.get('pcs')
+        if ips is None:
+            with state_changed:
+                ips = sorted(record.ip for record in discovered_pcs.select() if record.status != 'offline')
+        if not ips or not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+            return jsonify({'error': "No PCs to update"}), 400
+        try:
+            concurrency = min(max(int(data.get('concurrency', ROLLOUT_CONCURRENCY)), 1), MAX_ROLLOUT_CONCURRENCY)
+        except (TypeError, ValueError):
+            return jsonify({'error': "concurrency must be a number"}), 400
+        if start_rollout(ips, concurrency, request.remote_addr) is None:
+            return jsonify({'error': "An update is already running"}), 409
+    with rollout_lock:
+        if rollout is None:
+            return jsonify({'running': False})
+        return jsonify({**rollout, 'running': not rollout['finished'],
+                        'pcs': {ip: dict(state) for ip, state in rollout['pcs'].items()}}), \
+            202 if request.method == 'POST' else 200
 
 # HTML Templates
 INDEX_TEMPLATE = '''
@@ -209,6 +1990,25 @@ INDEX_TEMPLATE = '''
         .scan-btn:hover {
             background-color: #45a049;
         }
+        .report-btn {
+            margin-top: -10px;
+            background-color: #2196F3;
+        }
+        .report-btn:hover {
+            background-color: #1976D2;
+        }
+        .update-btn {
+            margin-top: -10px;
+            background-color: #607D8B;
+        }
+        .update-btn:hover {
+            background-color: #455A64;
+        }
+        .rollout div {
+            padding: 3px 0;
+            font-size: 14px;
+            color: #333;
+        }
         .pc-card {
             background: white;
             padding: 20px;
@@ -246,6 +2046,36 @@ INDEX_TEMPLATE = '''
             background-color: #ff9800;
             color: white;
         }
+        .status.offline {
+            background-color: #9e9e9e;
+            color: white;
+        }
+        .filters {
+            margin: 0 0 10px;
+        }
+        .filters a {
+            display: inline-block;
+            padding: 5px 12px;
+            margin: 3px 2px;
+            border-radius: 15px;
+            background: white;
+            color: #333;
+            text-decoration: none;
+            font-size: 14px;
+        }
+        .filters a.active {
+            background-color: #2196F3;
+            color: white;
+        }
+        .lock-all-btn {
+            margin-top: 0;
+            background-color: #ff9800;
+        }
+        .pc-group {
+            float: right;
+            color: #666;
+            font-size: 13px;
+        }
         .last-scan {
             text-align: center;
             color: #666;
@@ -254,28 +2084,120 @@ INDEX_TEMPLATE = '''
         }
     </style>
     <script>
-        // Auto-refresh every 30 seconds
-        setTimeout(function() {
-            location.reload();
+        // Auto-refresh every 30 seconds (not while agents are being updated)
+        var rolloutRunning = false;
+        setInterval(function() {
+            if (!rolloutRunning) location.reload();
         }, 30000);
-    </script>
-</head>
-<body>
-    <div class="container">
-        <h1>👨‍👩‍👧‍👦 Kids PC Control Panel</h1>
-        
-        <button onclick="location.href='/scan'" class="scan-btn">
-            🔍 Scan for PCs
-        </button>
-        
-        {% if pcs %}
-            <h2>Available PCs:</h2>
-            {% for ip, info in pcs.items() %}
-            <div class="pc-card" onclick="location.href='/control/{{ ip }}'">
-                <div class="pc-name">💻 {{ info.hostname }}</div>
-                <div class="pc-ip">{{ ip }}</div>
-                {% if info.locked %}
-                <span class="status locked">🔒 LOCKED</span>
+
+        var STAGES = {waiting: '⏳ waiting', checking: '🔎 checking', sending: '📤 sending',
+                      installing: '📦 installing', restarting: '🔄 restarting', done: '✅ updated',
+                      current: '✅ already up to date', installed: '⚠️ installed, restart the agent to use it',
+                      failed: '❌ '};
+
+        function updateAgents() {
+            if (!confirm("Send this panel's pc_control.py to every online PC? Each one restarts to use it.")) return;
+            fetch('/api/update', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: '{}'
+            }).then(r => r.json()).then(data => {
+                if (data.error) {
+                    alert(data.error);
+                    return;
+                }
+                showRollout(data);
+            });
+        }
+
+        function showRollout(data) {
+            rolloutRunning = data.running;
+            var box = document.getElementById('rollout');
+            box.innerHTML = '';
+            var title = document.createElement('div');
+            title.textContent = 'Update to build ' + data.build.slice(0, 12) + (data.running ? '...' : ' finished');
+            box.appendChild(title);
+            Object.keys(data.pcs).forEach(function(ip) {
+                var pc = data.pcs[ip];
+                var text = '💻 ' + pc.hostname + ': ' + STAGES[pc.stage];
+                if (pc.stage === 'sending') text += ' ' + Math.floor(pc.sent * 100 / data.size) + '%';
+                if (pc.error) text += pc.error;
+                var line = document.createElement('div');
+                line.textContent = text;
+                box.appendChild(line);
+            });
+            if (data.running) {
+                setTimeout(function() {
+                    fetch('/api/update').then(r => r.json()).then(showRollout);
+                }, 1000);
+            }
+        }
+
+        // Pick up an update started earlier (or from another phone)
+        fetch('/api/update').then(r => r.json()).then(data => {
+            if (data.running) showRollout(data);
+        });
+
+        function lockShown() {
+            if (!confirm('Lock every unlocked PC shown?')) return;
+            fetch('/action', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    action: 'lock',
+                    group: {{ group|tojson }},
+                    state: 'unlocked',
+                    request_id: Date.now().toString(36) + Math.random().toString(36).slice(2)
+                })
+            }).then(r => r.json()).then(data => {
+                alert(data.response);
+                location.reload();
+            });
+        }
+    </script>
+</head>
+<body>
+    <div class="container">
+        <h1>👨‍👩‍👧‍👦 Kids PC Control Panel</h1>
+        
+        <button onclick="location.href='/scan'" class="scan-btn">
+            🔍 Scan for PCs
+        </button>
+        <button onclick="location.href='/reports'" class="scan-btn report-btn">
+            📈 Usage Reports
+        </button>
+        <button onclick="updateAgents()" class="scan-btn update-btn">
+            ⬆️ Update Agents
+        </button>
+        <div id="rollout" class="rollout"></div>
+        
+        {% if groups or state %}
+        <div class="filters">
+            <a href="/" class="{{ 'active' if not group and not state }}">All</a>
+            {% for name in groups %}
+            <a href="/?group={{ name|urlencode }}" class="{{ 'active' if group == name }}">{{ name }}</a>
+            {% endfor %}
+            <a href="/?state=unlocked{% if group %}&group={{ group|urlencode }}{% endif %}"
+               class="{{ 'active' if state == 'unlocked' }}">Unlocked</a>
+            <a href="/?state=offline{% if group %}&group={{ group|urlencode }}{% endif %}"
+               class="{{ 'active' if state == 'offline' }}">Offline</a>
+        </div>
+        {% endif %}
+        {% if group %}
+        <button onclick="lockShown()" class="scan-btn lock-all-btn">🔒 Lock all of {{ group }}</button>
+        {% endif %}
+        
+        {% if pcs %}
+            <h2>Available PCs:</h2>
+            {% for ip, info in pcs.items() %}
+            <div class="pc-card" onclick="location.href='/control/{{ ip }}'">
+                {% if info.group %}<span class="pc-group">{{ info.group }}</span>{% endif %}
+                <div class="pc-name">💻 {{ info.hostname }}</div>
+                <div class="pc-ip">{{ ip }}</div>
+                {% if info.status == 'offline' %}
+                <span class="status offline">○ OFFLINE</span>
+                {% elif info.locked %}
+                <span class="status locked">🔒 LOCKED</span>
                 {% else %}
                 <span class="status online">● ONLINE</span>
                 {% endif %}
@@ -381,7 +2303,7 @@ CONTROL_TEMPLATE = '''
         .btn-limit:hover {
             background-color: #7b1fa2;
         }
-        input[type="text"], input[type="number"], input[type="time"] {
+        input[type="text"], input[type="number"], input[type="time"], select {
             width: 100%;
             padding: 10px;
             margin: 10px 0;
@@ -403,6 +2325,7 @@ CONTROL_TEMPLATE = '''
             background-color: #d0d0d0;
         }
         .status-message {
+            white-space: pre-line;
             padding: 15px;
             margin: 15px 0;
             border-radius: 5px;
@@ -417,6 +2340,18 @@ CONTROL_TEMPLATE = '''
             background-color: #f8d7da;
             color: #721c24;
         }
+        .timing {
+            font-size: 12px;
+            color: #666;
+            text-align: center;
+            margin: -10px 0 15px;
+        }
+        .screen {
+            display: none;
+            width: 100%;
+            border-radius: 5px;
+            background-color: #000;
+        }
     </style>
 </head>
 <body>
@@ -433,6 +2368,15 @@ CONTROL_TEMPLATE = '''
         {% endif %}
         
         <div id="status-message" class="status-message"></div>
+        <div id="timing" class="timing"></div>
+        
+        <div class="action-group">
+            <div class="action-title">📺 Screen</div>
+            <img id="screen" class="screen" alt="Screen of {{ pc_info.hostname }}">
+            <button class="btn btn-message" id="watch-button" onclick="toggleWatch()">
+                Watch Screen
+            </button>
+        </div>
         
         <div class="action-group">
             <div class="action-title">🔒 Quick Actions</div>
@@ -465,18 +2409,115 @@ CONTROL_TEMPLATE = '''
             <button class="btn btn-limit" onclick="setLimit()">
                 Set Time Limit
             </button>
+            <div>Extra time today:</div>
+            <div style="text-align: center;">
+                <span class="quick-limit" onclick="extendTime(15)">+15 min</span>
+                <span class="quick-limit" onclick="extendTime(30)">+30 min</span>
+                <span class="quick-limit" onclick="extendTime(60)">+1 hour</span>
+            </div>
         </div>
         
         <div class="action-group">
             <div class="action-title">🕐 Set Lock Time</div>
             <input type="time" id="lock-time" value="21:00">
-            <button class="btn btn-limit" onclick="setLockTime()">
+            <select id="lock-days">
+                <option value="DAILY">Every day</option>
+                <option value="WEEKDAYS">School nights (Mon-Fri)</option>
+                <option value="WEEKENDS">Weekends</option>
+            </select>
+            <button class="btn btn-limit" onclick="setLockTime('add_lock_time')">
                 Set Bedtime Lock
             </button>
+            <button class="btn btn-limit" onclick="setLockTime('remove_lock_time')">
+                Remove This Lock Time
+            </button>
+            <button class="btn btn-limit" onclick="performAction('list_lock_times')">
+                Show Lock Times
+            </button>
+        </div>
+        
+        <div class="action-group">
+            <div class="action-title">📊 Apps Today</div>
+            <button class="btn btn-message" onclick="performAction('get_usage')">
+                Show App Usage
+            </button>
+            <input type="text" id="app-name" placeholder="Program, e.g. minecraft.exe">
+            <input type="number" id="app-minutes" placeholder="Minutes per day (0 removes the limit)">
+            <button class="btn btn-limit" onclick="setAppLimit()">
+                Set App Limit
+            </button>
+        </div>
+        
+        <div class="action-group">
+            <div class="action-title">🚫 Blocked Programs</div>
+            <input type="text" id="block-app" placeholder="Program, e.g. roblox*.exe">
+            <div>Only between (leave empty to block all day):</div>
+            <input type="time" id="block-start">
+            <input type="time" id="block-end">
+            <select id="block-days">
+                <option value="DAILY">Every day</option>
+                <option value="WEEKDAYS">School days (Mon-Fri)</option>
+                <option value="WEEKENDS">Weekends</option>
+            </select>
+            <button class="btn btn-limit" onclick="blockApp('block_app')">
+                Block Program
+            </button>
+            <button class="btn btn-limit" onclick="blockApp('unblock_app')">
+                Unblock Program
+            </button>
+            <button class="btn btn-message" onclick="performAction('list_blocked')">
+                Show Blocked Programs
+            </button>
         </div>
     </div>
     
     <script>
+        // Each tap gets a request id. A failed request keeps its id, so tapping
+        // again sends the same id and the PC won't run the command twice.
+        let pendingRequest = null;
+        
+        function postAction(body) {
+            const key = JSON.stringify(body);
+            if (!pendingRequest || pendingRequest.key !== key) {
+                pendingRequest = {
+                    key: key,
+                    id: Date.now().toString(36) + Math.random().toString(36).slice(2)
+                };
+            }
+            const request = pendingRequest;
+            body.request_id = request.id;
+            return fetch('/action', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(body)
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success && pendingRequest === request) {
+                    pendingRequest = null;
+                }
+                showTiming(data.trace);
+                return data;
+            })
+            .catch(() => {
+                return {success: false, response: 'No answer - tap again to retry'};
+            });
+        }
+        
+        // Where the time went: the panel's steps, then the PC's (agent.*)
+        function showTiming(trace) {
+            const timingEl = document.getElementById('timing');
+            if (!trace || !trace.spans) {
+                timingEl.textContent = '';
+                return;
+            }
+            const parts = trace.spans
+                .filter(span => span[2] >= 0.1)
+                .map(span => span[0] + ' ' + span[2].toFixed(1));
+            timingEl.textContent = '⏱ ' + trace.total_ms.toFixed(0) + ' ms: ' + parts.join(' · ');
+            timingEl.title = 'Trace ' + trace.trace;
+        }
+        
         function showStatus(message, isSuccess) {
             const statusEl = document.getElementById('status-message');
             statusEl.textContent = message;
@@ -488,15 +2529,10 @@ CONTROL_TEMPLATE = '''
         }
         
         function performAction(action) {
-            fetch('/action', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({
-                    ip: '{{ ip }}',
-                    action: action
-                })
+            postAction({
+                ip: '{{ ip }}',
+                action: action
             })
-            .then(response => response.json())
             .then(data => {
                 showStatus(data.response, data.success);
                 // Reload page after 2 seconds to update lock status
@@ -521,16 +2557,11 @@ CONTROL_TEMPLATE = '''
                 return;
             }
             
-            fetch('/action', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({
-                    ip: '{{ ip }}',
-                    action: 'message',
-                    message: message
-                })
+            postAction({
+                ip: '{{ ip }}',
+                action: 'message',
+                message: message
             })
-            .then(response => response.json())
             .then(data => {
                 showStatus(data.response, data.success);
                 if (data.success) {
@@ -539,11 +2570,113 @@ CONTROL_TEMPLATE = '''
             });
         }
         
+        function extendTime(minutes) {
+            postAction({
+                ip: '{{ ip }}',
+                action: 'extend_time',
+                minutes: minutes
+            })
+            .then(data => {
+                showStatus(data.response, data.success);
+            });
+        }
+        
         function setQuickLimit(minutes) {
             document.getElementById('limit-minutes').value = minutes;
             setLimit();
         }
         
+        function setAppLimit() {
+            const app = document.getElementById('app-name').value;
+            const minutes = document.getElementById('app-minutes').value;
+            if (!app || minutes === '') {
+                showStatus('Please enter a program and minutes', false);
+                return;
+            }
+            
+            postAction({
+                ip: '{{ ip }}',
+                action: 'set_app_limit',
+                app: app,
+                minutes: parseInt(minutes)
+            })
+            .then(data => {
+                showStatus(data.response, data.success);
+            });
+        }
+        
+        // The PC only takes pictures while someone is watching. It says how
+        // soon to ask again: often while the screen changes, rarely when it is still.
+        let watching = false;
+        let screenSeq = null;
+        let screenTimer = null;
+        
+        function toggleWatch() {
+            watching = !watching;
+            document.getElementById('watch-button').textContent = watching ? 'Stop Watching' : 'Watch Screen';
+            document.getElementById('screen').style.display = watching ? 'block' : 'none';
+            clearTimeout(screenTimer);
+            if (watching) {
+                refreshScreen();
+            }
+        }
+        
+        function refreshScreen() {
+            if (document.hidden) {
+                screenTimer = setTimeout(refreshScreen, 2000);
+                return;
+            }
+            fetch('/control/{{ ip }}/thumbnail.png' + (screenSeq === null ? '' : '?seq=' + screenSeq))
+            .then(response => {
+                const wait = parseFloat(response.headers.get('X-Thumbnail-Interval')) || 2;
+                if (!response.ok) {
+                    return response.text().then(text => {
+                        showStatus(text, false);
+                        return 5;
+                    });
+                }
+                if (response.status === 204) {
+                    return wait;
+                }
+                screenSeq = response.headers.get('X-Thumbnail-Seq');
+                return response.blob().then(blob => {
+                    const screen = document.getElementById('screen');
+                    const old = screen.src;
+                    screen.src = URL.createObjectURL(blob);
+                    if (old) {
+                        URL.revokeObjectURL(old);
+                    }
+                    return wait;
+                });
+            })
+            .catch(() => 5)
+            .then(wait => {
+                if (watching) {
+                    screenTimer = setTimeout(refreshScreen, Math.max(wait, 0.5) * 1000);
+                }
+            });
+        }
+        
+        function blockApp(action) {
+            const app = document.getElementById('block-app').value;
+            if (!app) {
+                showStatus('Please enter a program', false);
+                return;
+            }
+            
+            postAction({
+                ip: '{{ ip }}',
+                action: action,
+                app: app,
+                start: document.getElementById('block-start').value,
+                end: document.getElementById('block-end').value,
+                days: document.getElementById('block-days').value
+            })
+            .then(data => {
+                showStatus(data.response, data.success);
+            });
+        }
+        
         function setLimit() {
             const minutes = document.getElementById('limit-minutes').value;
             if (!minutes) {
@@ -551,38 +2684,30 @@ CONTROL_TEMPLATE = '''
                 return;
             }
             
-            fetch('/action', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({
-                    ip: '{{ ip }}',
-                    action: 'set_limit',
-                    minutes: parseInt(minutes)
-                })
+            postAction({
+                ip: '{{ ip }}',
+                action: 'set_limit',
+                minutes: parseInt(minutes)
             })
-            .then(response => response.json())
             .then(data => {
                 showStatus(data.response, data.success);
             });
         }
         
-        function setLockTime() {
+        function setLockTime(action) {
             const time = document.getElementById('lock-time').value;
+            const days = document.getElementById('lock-days').value;
             if (!time) {
                 showStatus('Please select a time', false);
                 return;
             }
             
-            fetch('/action', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({
-                    ip: '{{ ip }}',
-                    action: 'add_lock_time',
-                    time: time
-                })
+            postAction({
+                ip: '{{ ip }}',
+                action: action,
+                time: time,
+                days: days
             })
-            .then(response => response.json())
             .then(data => {
                 showStatus(data.response, data.success);
             });
@@ -592,8 +2717,251 @@ CONTROL_TEMPLATE = '''
 </html>
 '''
 
+REPORTS_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Usage Reports</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+            background-color: #f0f0f0;
+        }
+        .container {
+            max-width: 600px;
+            margin: 0 auto;
+        }
+        h1 {
+            color: #333;
+            text-align: center;
+        }
+        .back-btn {
+            display: inline-block;
+            padding: 10px 20px;
+            background-color: #666;
+            color: white;
+            text-decoration: none;
+            border-radius: 5px;
+            margin-bottom: 20px;
+        }
+        .periods {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 10px;
+        }
+        .periods a {
+            flex: 1;
+            text-align: center;
+            padding: 10px;
+            border-radius: 5px;
+            background: white;
+            color: #333;
+            text-decoration: none;
+        }
+        .periods a.active {
+            background-color: #2196F3;
+            color: white;
+        }
+        .pc-card {
+            background: white;
+            padding: 20px;
+            margin: 10px 0;
+            border-radius: 10px;
+            box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+            cursor: pointer;
+        }
+        .pc-name {
+            font-size: 18px;
+            font-weight: bold;
+            color: #333;
+        }
+        .stats {
+            display: grid;
+            grid-template-columns: 1fr 1fr;
+            gap: 5px;
+            margin-top: 10px;
+            color: #555;
+            font-size: 14px;
+        }
+        .note {
+            text-align: center;
+            color: #666;
+            font-size: 14px;
+            margin-top: 20px;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <a href="/" class="back-btn">← Back</a>
+        <h1>📈 Usage Reports</h1>
+        <div class="periods">
+            <a href="/reports?days=7" class="{{ 'active' if days == 7 }}">Week</a>
+            <a href="/reports?days=30" class="{{ 'active' if days == 30 }}">Month</a>
+            <a href="/reports?days=365" class="{{ 'active' if days == 365 }}">Year</a>
+        </div>
+        
+        {% for ip, s in summaries.items() %}
+        <div class="pc-card" onclick="location.href='/reports/{{ ip }}?days={{ days }}'">
+            <div class="pc-name">💻 {{ names[ip] }}</div>
+            <div class="stats">
+                <div>Total: {{ s.total_minutes // 60 }}h {{ s.total_minutes % 60 }}m</div>
+                <div>Per day: {{ s.avg_minutes }} min</div>
+                <div>Days used: {{ s.used_days }}</div>
+                <div>Limits hit: {{ s.limit_hits }}</div>
+                <div>Within limits: {{ s.streak }} days in a row</div>
+                <div>Best: {{ s.best_streak }} days</div>
+            </div>
+        </div>
+        {% else %}
+            <p style="text-align: center; color: #666;">
+                No history yet. Scan for PCs, then come back in a minute.
+            </p>
+        {% endfor %}
+        
+        <div class="note">
+            {% if refreshing %}Fetching the latest numbers from the PCs... reload in a moment.{% endif %}
+            <a href="/reports?days={{ days }}&refresh=1">Refresh now</a>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+REPORT_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Report {{ hostname }}</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+            background-color: #f0f0f0;
+        }
+        .container {
+            max-width: 600px;
+            margin: 0 auto;
+        }
+        h1 {
+            color: #333;
+            text-align: center;
+            font-size: 24px;
+        }
+        .back-btn {
+            display: inline-block;
+            padding: 10px 20px;
+            background-color: #666;
+            color: white;
+            text-decoration: none;
+            border-radius: 5px;
+            margin-bottom: 20px;
+        }
+        .periods {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 10px;
+        }
+        .periods a {
+            flex: 1;
+            text-align: center;
+            padding: 10px;
+            border-radius: 5px;
+            background: white;
+            color: #333;
+            text-decoration: none;
+        }
+        .periods a.active {
+            background-color: #2196F3;
+            color: white;
+        }
+        .action-group {
+            background: white;
+            padding: 20px;
+            margin: 15px 0;
+            border-radius: 10px;
+            box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+        }
+        .action-title {
+            font-size: 18px;
+            font-weight: bold;
+            margin-bottom: 15px;
+            color: #333;
+        }
+        .chart {
+            display: flex;
+            align-items: flex-end;
+            gap: 2px;
+            height: 150px;
+        }
+        .bar {
+            flex: 1;
+            background-color: #2196F3;
+            min-height: 1px;
+        }
+        .stats div {
+            padding: 4px 0;
+            color: #555;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <a href="/reports?days={{ days }}" class="back-btn">← Back</a>
+        <h1>📈 {{ hostname }}</h1>
+        <div class="periods">
+            <a href="?days=7" class="{{ 'active' if days == 7 }}">Week</a>
+            <a href="?days=30" class="{{ 'active' if days == 30 }}">Month</a>
+            <a href="?days=365" class="{{ 'active' if days == 365 }}">Year</a>
+        </div>
+        
+        {% if summary %}
+        <div class="action-group">
+            <div class="action-title">Minutes per {{ 'day' if days <= 31 else 'week' }}</div>
+            <div class="chart">
+                {% for bar in summary.bars %}
+                <div class="bar" style="height: {{ (100 * bar.minutes / peak)|round(1) }}%"
+                     title="{{ bar.day }}: {{ bar.minutes }} min"></div>
+                {% endfor %}
+            </div>
+        </div>
+        
+        <div class="action-group stats">
+            <div class="action-title">Summary</div>
+            <div>Total: {{ summary.total_minutes // 60 }}h {{ summary.total_minutes % 60 }}m</div>
+            <div>Average: {{ summary.avg_minutes }} min a day ({{ summary.avg_used_minutes }} on days used)</div>
+            {% if summary.busiest_day %}
+            <div>Busiest day: {{ summary.busiest_day }} ({{ summary.busiest_minutes }} min)</div>
+            {% endif %}
+            <div>Locks: {{ summary.locks }}, unlocks: {{ summary.unlocks }}</div>
+            <div>Limits hit: {{ summary.limit_hits }}</div>
+            <div>Within limits: {{ summary.streak }} days in a row (best {{ summary.best_streak }})</div>
+        </div>
+        
+        <div class="action-group stats">
+            <div class="action-title">Average by weekday</div>
+            {% for minutes in summary.weekday_minutes %}
+            <div>{{ weekdays[loop.index0] }}: {{ minutes }} min</div>
+            {% endfor %}
+        </div>
+        {% else %}
+            <p style="text-align: center; color: #666;">
+                No history for this PC yet.
+            </p>
+        {% endif %}
+    </div>
+</body>
+</html>
+'''
+
 # Create template files
-import os
 os.makedirs('templates', exist_ok=True)
 
 with open('templates/index.html', 'w') as f:
@@ -602,6 +2970,17 @@ with open('templates/index.html', 'w') as f:
 with open('templates/control.html', 'w') as f:
     f.write(CONTROL_TEMPLATE)
 
+with open('templates/reports.html', 'w') as f:
+    f.write(REPORTS_TEMPLATE)
+
+with open('templates/report.html', 'w') as f:
+    f.write(REPORT_TEMPLATE)
+
+load_command_queue()
+load_policies()
+load_history()
+init_audit_db()
+
 if __name__ == '__main__':
     # Do initial scan
     print("Performing initial scan...")